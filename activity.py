@@ -0,0 +1,105 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 60))
+ACTIVITY_FLUSH_THRESHOLD = int(os.environ.get('ACTIVITY_FLUSH_THRESHOLD', 500))
+ACTIVITY_WRITE_BEHIND = os.environ.get('ACTIVITY_WRITE_BEHIND', '1') != '0'
+
+
+class ActivityTracker:
+    """Buffer user activity touches in memory and write them in batches.
+
+    flush_fn receives a dict of {user_id: last_seen_datetime} and is expected
+    to persist it in a single transaction.
+
+    Every worker process keeps its own buffer and flusher thread (started
+    lazily after fork). A user is queued at most once per flush window, and
+    the UPDATE issued by flush_fn only moves last_activity forward, so
+    workers flushing in any order converge on the latest value.
+    """
+
+    def __init__(self, flush_fn, interval=ACTIVITY_FLUSH_INTERVAL,
+                 threshold=ACTIVITY_FLUSH_THRESHOLD, write_behind=ACTIVITY_WRITE_BEHIND):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.threshold = threshold
+        self.write_behind = write_behind
+        self._pending = {}
+        self._written = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        atexit.register(self.flush)
+
+    def touch(self, user_id, when=None):
+        """Record that user_id was active. Cheap; never touches the database
+        unless write-behind is disabled or the buffer reaches the threshold."""
+        when = when or datetime.utcnow()
+        if not self.write_behind:
+            self.flush_fn({user_id: when})
+            return
+
+        self._ensure_flusher()
+        window = timedelta(seconds=self.interval)
+        with self._lock:
+            last = self._written.get(user_id)
+            if last is not None and when - last < window:
+                return
+            self._pending[user_id] = when
+            self._written[user_id] = when
+            should_flush = len(self._pending) >= self.threshold
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Write all pending touches. Returns the number of users flushed."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = {}
+            # forget users whose window has expired so the map stays bounded
+            cutoff = datetime.utcnow() - timedelta(seconds=self.interval)
+            self._written = {uid: ts for uid, ts in self._written.items() if ts >= cutoff}
+        try:
+            self.flush_fn(batch)
+        except Exception:
+            # put the batch back so it is retried on the next flush
+            with self._lock:
+                for uid, ts in batch.items():
+                    if uid not in self._pending or ts > self._pending[uid]:
+                        self._pending[uid] = ts
+            raise
+        return len(batch)
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _ensure_flusher(self):
+        # threads do not survive fork, so every gunicorn worker starts its own
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None:
+                return
+            self._pid = pid
+            self._pending = {}
+            self._written = {}
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception('activity flush failed')
@@ -0,0 +1,159 @@
+"""Durable append-only answer logs for exam-mode quizzes.
+
+Each quiz gets <directory>/quiz_<id>.log of JSON lines. An append is one
+O_APPEND write (followed by fsync when EXAM_LOG_FSYNC=1), so records from
+concurrent workers never interleave and an acknowledged answer survives a
+crash. drain() hands the complete records after the committed offset to a
+callback in batches and only advances the offset once the callback returned,
+so a crash replays records rather than losing them; the callback must be
+idempotent.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process drains at a time anyway in development
+    fcntl = None
+
+EXAM_LOG_FSYNC = os.environ.get('EXAM_LOG_FSYNC', '1') == '1'
+EXAM_DRAIN_BATCH = int(os.environ.get('EXAM_DRAIN_BATCH', 5000))
+
+
+class LogBusy(Exception):
+    """Another process is draining this log."""
+
+
+class AnswerLog:
+    def __init__(self, directory, fsync=EXAM_LOG_FSYNC, batch_size=EXAM_DRAIN_BATCH):
+        self.directory = directory
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, quiz_id, suffix):
+        return os.path.join(self.directory, f'quiz_{quiz_id}.{suffix}')
+
+    def append(self, quiz_id, records):
+        """Durably append records (dicts) for quiz_id in a single write."""
+        data = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records).encode()
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._path(quiz_id, 'log'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def pending_quiz_ids(self):
+        """Quizzes whose log may still hold undrained records."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[5:-4]) for n in names
+                      if n.startswith('quiz_') and n.endswith('.log') and n[5:-4].isdigit())
+
+    def _read_offset(self, quiz_id):
+        try:
+            with open(self._path(quiz_id, 'offset')) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_offset(self, quiz_id, offset):
+        tmp = self._path(quiz_id, f'offset.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(quiz_id, 'offset'))
+
+    @contextmanager
+    def _locked(self, quiz_id, blocking):
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(quiz_id, threading.Lock())
+        if not thread_lock.acquire(blocking):
+            raise LogBusy(quiz_id)
+        lock_file = None
+        try:
+            if fcntl is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                lock_file = open(self._path(quiz_id, 'lock'), 'a')
+                flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+                try:
+                    fcntl.flock(lock_file, flags)
+                except BlockingIOError:
+                    raise LogBusy(quiz_id)
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            thread_lock.release()
+
+    def _drain(self, quiz_id, apply_fn, path=None):
+        path = path or self._path(quiz_id, 'log')
+        if not os.path.exists(path):
+            return 0
+        offset = self._read_offset(quiz_id)
+        total = 0
+        with open(path, 'rb') as f:
+            while True:
+                f.seek(offset)
+                records, consumed = [], 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # a write still in progress; picked up next time
+                    consumed += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+                    if len(records) >= self.batch_size:
+                        break
+                if not consumed:
+                    return total
+                if records:
+                    apply_fn(records)
+                offset += consumed
+                self._write_offset(quiz_id, offset)
+                total += len(records)
+
+    def drain(self, quiz_id, apply_fn, blocking=False):
+        """Feed undrained records to apply_fn(records) in batches; returns how many.
+
+        With blocking=False a log another process is draining is skipped (returns 0).
+        """
+        try:
+            with self._locked(quiz_id, blocking):
+                return self._drain(quiz_id, apply_fn)
+        except LogBusy:
+            return 0
+
+    def seal(self, quiz_id, apply_fn):
+        """Drain everything, then retire the log as quiz_<id>.sealed for auditing.
+
+        The caller must already have closed the quiz to new answers. A writer
+        that opened the log just before the rename still appends to the
+        renamed file, so that file is drained once more before the offset is
+        dropped. The lock file is kept: another process may be waiting on it.
+        """
+        with self._locked(quiz_id, True):
+            count = self._drain(quiz_id, apply_fn)
+            path = self._path(quiz_id, 'log')
+            if os.path.exists(path):
+                sealed, n = self._path(quiz_id, 'sealed'), 0
+                while os.path.exists(sealed):  # a late straggler log sealed a second time
+                    n += 1
+                    sealed = self._path(quiz_id, f'sealed.{n}')
+                os.replace(path, sealed)
+                count += self._drain(quiz_id, apply_fn, sealed)
+            try:
+                os.remove(self._path(quiz_id, 'offset'))
+            except FileNotFoundError:
+                pass
+            return count
@@ -2,18 +2,79 @@ from flask import Flask, render_template, redirect, url_for, request, flash, ses
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_limiter import Limiter
 from werkzeug.utils import secure_filename
+from markupsafe import Markup, escape
 import os
-import io
-import csv
 import re
+import functools
+import glob
+import hashlib
+import hmac
+import json
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import groupby
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
+import click
+
+# Write-behind last_activity tracking
+from activity import ActivityTracker
+
+# Per-worker background threads for batched and scheduled jobs
+from periodic import PeriodicWorker
+
+# Versioned schema migrations (run at deploy time)
+import migrations
+
+# Engine/pool settings, SQLite PRAGMAs and read/write routing from the environment
+import dbengine
+from dbengine import read_only
+
+# Durable append-only answer logs for exam-mode quizzes
+from answerlog import AnswerLog
+
+# Rendered catalogue page cache
+from cache import PageCache
+
+# Constant-memory ranged file responses
+from streaming import stream_file
+
+# Local ffmpeg renditions/posters for uploaded videos
+import transcode
+
+# Streaming (optionally gzipped) CSV responses
+from exports import EXPORT_BATCH_SIZE, batched, csv_response, timestamp as export_timestamp
+
+# Streaming question bank validation + executemany inserts
+import question_bank
+
+# FTS5 course/module search index and queries
+import search
+
+# Per-endpoint latency/SQL/template/size metrics merged across workers
+from metrics import RequestMetrics
+
+# Rotating log of slow SQL statements with their plans
+import slowlog
+
+# Admin-armed cProfile / stack-sampling of selected requests
+import profiler
+
+# Sliding-window rate limits and their shared SQLite counter storage
+import ratelimit
+
+# Password hashing on a bounded worker pool, with rehash-on-login when the configured cost changes
+import passwords
 
 # Paystack helper (server-side initialization + verification)
-from paystack import initialize_transaction, verify_transaction, get_public_key
+from paystack import (initialize_transaction, verify_transaction, verify_transaction_async,
+                      verify_webhook_signature, get_public_key)
 
 # =====================================================
 #  LANGUAGE SUPPORT
@@ -138,13 +199,66 @@ def translate(text, lang='en'):
 # =====================================================
 #  APP CONFIGURATION
 # =====================================================
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///zit_online.db'
+# INSTANCE_PATH (absolute) moves instance/: the default database, logs, metrics and counters
+app = Flask(__name__, instance_path=os.environ.get('INSTANCE_PATH') or None)
+# DATABASE_URL picks the backend; SQLite gets WAL/busy-timeout PRAGMAs, server databases a tuned pool
+app.config['SQLALCHEMY_DATABASE_URI'] = dbengine.database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dbengine.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# @read_only views read through this bind: DATABASE_READ_URL, or a query_only pool on the SQLite file
+app.config['SQLALCHEMY_BINDS'] = dbengine.read_binds(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max upload
-
-db = SQLAlchemy(app)
+app.config['COURSES_PER_PAGE'] = int(os.environ.get('COURSES_PER_PAGE', 24))
+# Answer keys, exam settings and compiled quiz payloads cached per worker
+app.config['QUIZ_CACHE_SIZE'] = int(os.environ.get('QUIZ_CACHE_SIZE', 512))
+# Chunked video uploads are not bound by MAX_CONTENT_LENGTH, only by these
+app.config['VIDEO_MAX_SIZE'] = int(os.environ.get('VIDEO_MAX_SIZE', 4 * 1024 * 1024 * 1024))  # 4GB
+app.config['VIDEO_UPLOAD_CHUNK_SIZE'] = int(os.environ.get('VIDEO_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 8MB
+app.config['VIDEO_WORKER_CONCURRENCY'] = int(os.environ.get('VIDEO_WORKER_CONCURRENCY', 2))
+app.config['VIDEO_JOB_MAX_ATTEMPTS'] = int(os.environ.get('VIDEO_JOB_MAX_ATTEMPTS', 3))
+app.config['VIDEO_WORKER_POLL_INTERVAL'] = float(os.environ.get('VIDEO_WORKER_POLL_INTERVAL', 5))
+# Verify Paystack payments on a background thread; the callback page polls for the result
+app.config['PAYSTACK_VERIFY_ASYNC'] = os.environ.get('PAYSTACK_VERIFY_ASYNC', '1') == '1'
+# Webhook payments are enrolled in batches: every PAYMENT_APPLY_INTERVAL seconds or PAYMENT_APPLY_BATCH events
+app.config['PAYMENT_APPLY_INTERVAL'] = float(os.environ.get('PAYMENT_APPLY_INTERVAL', 2))
+app.config['PAYMENT_APPLY_BATCH'] = int(os.environ.get('PAYMENT_APPLY_BATCH', 200))
+# Exam mode: how often buffered answers are drained, and how long after closes_at the log is sealed
+app.config['EXAM_DRAIN_INTERVAL'] = float(os.environ.get('EXAM_DRAIN_INTERVAL', 1))
+app.config['EXAM_SEAL_GRACE'] = float(os.environ.get('EXAM_SEAL_GRACE', 5))
+app.config['EXAM_SEAL_CHECK_INTERVAL'] = float(os.environ.get('EXAM_SEAL_CHECK_INTERVAL', 5))
+# Analytics rollups: `flask refresh-rollups --loop` refreshes them every ROLLUP_REFRESH_INTERVAL seconds;
+# rows stamped up to ROLLUP_LAG seconds before the last run are re-read to catch late commits
+app.config['ROLLUP_REFRESH_INTERVAL'] = float(os.environ.get('ROLLUP_REFRESH_INTERVAL', 300))
+app.config['ROLLUP_LAG'] = float(os.environ.get('ROLLUP_LAG', 120))
+# Prometheus can scrape /admin/metrics with "Authorization: Bearer <METRICS_TOKEN>" instead of an admin session
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+# Off until an admin arms it; wrapped inside the metrics so profiled requests count at their real cost
+request_profiler = profiler.RequestProfiler(os.path.join(app.instance_path, 'profiles'))
+request_profiler.init_app(app, exclude=('admin_profiling', 'admin_profile_download'))
+# Wraps app.wsgi_app, so its timings cover every request hook
+request_metrics = RequestMetrics(os.path.join(app.instance_path, 'metrics'))
+request_metrics.init_app(app)
+# Statements over SLOW_QUERY_MS go to instance/slow_queries.log; `flask slow-queries` ranks them
+slow_query_log = slowlog.SlowQueryLog(os.path.join(app.instance_path, 'slow_queries.log'))
+if slowlog.SLOW_QUERY_LOG:
+    slow_query_log.install()
+
+# Rate limits: counters in instance/ratelimit.db are shared by every worker on the host (redis:// for several)
+app.config['RATELIMIT_ENABLED'] = ratelimit.RATELIMIT_ENABLED
+app.config['RATELIMIT_STORAGE_URI'] = (ratelimit.RATELIMIT_STORAGE_URI
+                                       or f"sqlite:///{os.path.join(app.instance_path, 'ratelimit.db')}")
+app.config['RATELIMIT_STRATEGY'] = 'sliding-window-counter'
+app.config['RATELIMIT_SWALLOW_ERRORS'] = True  # a counter storage failure lets requests through
+limiter = Limiter(app=app, key_func=ratelimit.client_ip)
+
+# Hashes run on PASSWORD_HASH_WORKERS threads per worker process; a full queue answers 503
+password_service = passwords.PasswordService()
+
+db = SQLAlchemy(app, session_options={'class_': dbengine.RoutingSession})
+app.before_request(dbengine.route_request)
+app.after_request(dbengine.pin_after_write)
 csrf = CSRFProtect(app)
 
 login_manager = LoginManager()
@@ -205,10 +319,10 @@ class User(UserMixin, db.Model):
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_service.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_service.verify(self.password_hash, password)
 
 
 class Course(db.Model):
@@ -223,6 +337,10 @@ class Course(db.Model):
     rejection_reason = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     instructor = db.relationship('User', backref='courses')
+    __table_args__ = (
+        db.Index('ix_course_approved_created', 'is_approved', 'created_at', 'id'),
+        db.Index('ix_course_instructor_id', 'instructor_id'),
+    )
 
 
 class Module(db.Model):
@@ -232,6 +350,7 @@ class Module(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     course = db.relationship('Course', backref='modules')
+    __table_args__ = (db.Index('ix_module_course_id', 'course_id'),)
 
 
 class Announcement(db.Model):
@@ -240,6 +359,7 @@ class Announcement(db.Model):
     instructor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_announcement_course_created', 'course_id', 'created_at'),)
 
 
 class CourseProgress(db.Model):
@@ -250,6 +370,11 @@ class CourseProgress(db.Model):
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('uix_course_progress_student_course', 'student_id', 'course_id', unique=True),
+        db.Index('ix_course_progress_course_id', 'course_id'),
+        db.Index('ix_course_progress_created_at', 'created_at'),
+    )
 
 
 class Grade(db.Model):
@@ -267,7 +392,10 @@ class ModuleProgress(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     module_id = db.Column(db.Integer, db.ForeignKey('module.id'), nullable=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
-    __table_args__ = (db.UniqueConstraint('student_id', 'module_id', name='uix_student_module'),)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'module_id', name='uix_student_module'),
+        db.Index('ix_module_progress_module_id', 'module_id'),
+    )
 
 
 ######### Quiz Models #########
@@ -276,6 +404,11 @@ class Quiz(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # exam mode: answers go to a durable log first and are drained in batches
+    exam_mode = db.Column(db.Boolean, default=False)
+    closes_at = db.Column(db.DateTime)
+    sealed_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_quiz_course_id', 'course_id'),)
 
 
 class Question(db.Model):
@@ -284,6 +417,7 @@ class Question(db.Model):
     text = db.Column(db.Text, nullable=False)
     explanation = db.Column(db.Text)
     order = db.Column(db.Integer, default=0)
+    __table_args__ = (db.Index('ix_question_quiz_order', 'quiz_id', 'order'),)
 
 
 class Choice(db.Model):
@@ -291,6 +425,7 @@ class Choice(db.Model):
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
     text = db.Column(db.String(500), nullable=False)
     is_correct = db.Column(db.Boolean, default=False)
+    __table_args__ = (db.Index('ix_choice_question_id', 'question_id'),)
 
 
 class StudentAnswer(db.Model):
@@ -300,6 +435,10 @@ class StudentAnswer(db.Model):
     choice_id = db.Column(db.Integer, db.ForeignKey('choice.id'))
     correct = db.Column(db.Boolean)
     answered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('uix_student_answer_student_question', 'student_id', 'question_id', unique=True),
+        db.Index('ix_student_answer_question_id', 'question_id'),
+    )
 
 
 # =====================================================
@@ -314,7 +453,131 @@ class Video(db.Model):
     mimetype = db.Column(db.String(100), default='video/mp4')
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 'processing' until the worker has produced renditions, then 'ready'
+    status = db.Column(db.String(20), default='ready')
+    poster = db.Column(db.String(300))
+    renditions = db.Column(db.Text)  # JSON written by the video worker
     course = db.relationship('Course', backref='videos')
+    __table_args__ = (db.Index('ix_video_course_created', 'course_id', 'created_at'),)
+
+    @property
+    def rendition_info(self):
+        return json.loads(self.renditions) if self.renditions else {}
+
+
+class VideoJob(db.Model):
+    """A transcoding job picked up by `flask video-worker`."""
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_video_job_status_run_after', 'status', 'run_after'),)
+
+
+class VideoUpload(db.Model):
+    """A resumable chunked upload; becomes a Video row once every byte arrived."""
+    id = db.Column(db.String(32), primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(200))
+    original_filename = db.Column(db.String(300))
+    stored_name = db.Column(db.String(300), nullable=False)
+    mimetype = db.Column(db.String(100), default='video/mp4')
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# =====================================================
+#  Payment Model
+# =====================================================
+class Payment(db.Model):
+    """Ledger of Paystack payments, one row per reference.
+
+    Rows are written by the callback, the signed webhook and reconciliation;
+    applied_at is set once the enrollment for a successful payment exists.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(100), unique=True, nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'))
+    status = db.Column(db.String(20), default='pending')  # pending, success, failed, unmatched
+    message = db.Column(db.String(300))
+    email = db.Column(db.String(120))
+    amount = db.Column(db.Integer)  # kobo
+    currency = db.Column(db.String(3))
+    source = db.Column(db.String(20))  # callback, webhook, reconcile
+    event = db.Column(db.String(50))
+    payload = db.Column(db.Text)
+    paid_at = db.Column(db.String(40))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    verified_at = db.Column(db.DateTime)
+    applied_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_payment_status_applied', 'status', 'applied_at'),)
+
+
+# =====================================================
+#  Admin Statistics Snapshot Models
+# =====================================================
+class AdminStat(db.Model):
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Float, nullable=False, default=0)
+
+
+class DailyEnrollmentStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CourseEnrollmentStat(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+# =====================================================
+#  Analytics Rollup Models
+# =====================================================
+class DailyCourseStat(db.Model):
+    """Activity per (day, course), rebuilt a day at a time by refresh_rollups()."""
+    day = db.Column(db.Date, primary_key=True)
+    course_id = db.Column(db.Integer, primary_key=True)
+    enrollments = db.Column(db.Integer, nullable=False, default=0)
+    completions = db.Column(db.Integer, nullable=False, default=0)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.Index('ix_daily_course_stat_course_day', 'course_id', 'day'),)
+
+
+class CourseRollup(db.Model):
+    """All-time totals per course (the sum of its DailyCourseStat rows)."""
+    course_id = db.Column(db.Integer, primary_key=True)
+    enrollments = db.Column(db.Integer, nullable=False, default=0)
+    completions = db.Column(db.Integer, nullable=False, default=0)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StudentScoreStat(db.Model):
+    student_id = db.Column(db.Integer, primary_key=True)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+
+class RollupWatermark(db.Model):
+    """How far refresh_rollups() has read a source table: last id and last timestamp."""
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    last_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
 
 
 # =====================================================
@@ -325,13 +588,35 @@ def load_user(user_id):
     try:
         user = User.query.get(int(user_id))
         if user:
-            user.last_activity = datetime.utcnow()
-            db.session.commit()
+            activity_tracker.touch(user.id)
         return user
     except Exception:
         return None
 
 
+# =====================================================
+#  ACTIVITY TRACKING (write-behind)
+# =====================================================
+def flush_user_activity(touches):
+    """Persist buffered activity touches in one batched UPDATE.
+
+    Only moves last_activity forward, so concurrent workers can flush in any order.
+    """
+    if not touches:
+        return
+    stmt = User.__table__.update()\
+        .where(User.__table__.c.id == bindparam('uid'))\
+        .where(db.or_(User.__table__.c.last_activity.is_(None), User.__table__.c.last_activity < bindparam('ts')))\
+        .values(last_activity=bindparam('ts'))
+    params = [{'uid': uid, 'ts': ts} for uid, ts in touches.items()]
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(stmt, params)
+
+
+activity_tracker = ActivityTracker(flush_user_activity)
+
+
 # =====================================================
 #  INITIAL DATABASE CREATION (Flask-safe)
 # =====================================================
@@ -353,39 +638,88 @@ def init_db():
             db.session.commit()
 
 
-@app.before_request
-def ensure_database():
-    # Run once to create tables and try to add missing columns safely
-    if not hasattr(app, '_db_created'):
-        with app.app_context():
-            db.create_all()
-            try:
-                ensure_course_columns()
-            except Exception:
-                import traceback
-                traceback.print_exc()
-            app._db_created = True
+def upgrade_database():
+    """Create missing tables, then apply pending versioned migrations."""
+    with app.app_context():
+        db.create_all()
+        return migrations.upgrade(db.engine)
 
 
-def ensure_course_columns():
-    """Add missing columns to the course table if they don't exist (SQLite-safe)."""
-    with app.app_context():
-        conn = db.engine.connect()
-        try:
-            res = conn.execute(text("PRAGMA table_info('course');"))
-            cols = [row[1] for row in res.fetchall()]
-            if 'image' not in cols:
-                conn.execute(text("ALTER TABLE course ADD COLUMN image VARCHAR(300);"))
-            if 'price' not in cols:
-                conn.execute(text("ALTER TABLE course ADD COLUMN price REAL DEFAULT 0.0;"))
-            if 'is_approved' not in cols:
-                conn.execute(text("ALTER TABLE course ADD COLUMN is_approved BOOLEAN DEFAULT 0;"))
-            if 'is_rejected' not in cols:
-                conn.execute(text("ALTER TABLE course ADD COLUMN is_rejected BOOLEAN DEFAULT 0;"))
-            if 'rejection_reason' not in cols:
-                conn.execute(text("ALTER TABLE course ADD COLUMN rejection_reason TEXT;"))
-        finally:
-            conn.close()
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create tables and apply pending schema migrations (run at deploy time)."""
+    applied = upgrade_database()
+    print(f'{len(applied)} migration(s) applied.' if applied else 'Database is up to date.')
+
+
+@app.cli.command('db-info')
+def db_info_command():
+    """Show the configured backend, pool state and effective SQLite PRAGMAs."""
+    for key, value in dbengine.describe(db.engine).items():
+        print(f'{key:14} {value}')
+
+
+def hot_path_queries():
+    """Representative statements from the busiest routes, for plan checks."""
+    return {
+        'catalogue page': Course.query.filter(Course.is_approved == True)
+            .order_by(Course.created_at.desc(), Course.id.desc()).limit(25),
+        'student enrollments': CourseProgress.query.filter_by(student_id=1),
+        'enrollment check': CourseProgress.query.filter_by(student_id=1, course_id=1),
+        'course enrollments': CourseProgress.query.filter_by(course_id=1),
+        'course modules': Module.query.filter_by(course_id=1).order_by(Module.id),
+        'module completions': ModuleProgress.query.filter_by(module_id=1),
+        'course announcements': Announcement.query.filter_by(course_id=1).order_by(Announcement.created_at.desc()),
+        'quiz questions': Question.query.filter_by(quiz_id=1).order_by(Question.order),
+        'question choices': Choice.query.filter_by(question_id=1),
+        'student answers': StudentAnswer.query.filter_by(student_id=1, question_id=1),
+        'question answers': StudentAnswer.query.filter_by(question_id=1),
+        'course videos': Video.query.filter_by(course_id=1).order_by(Video.created_at.desc()),
+    }
+
+
+@app.cli.command('query-plans')
+def query_plans_command():
+    """Print EXPLAIN QUERY PLAN for hot-path queries and flag full table scans."""
+    if db.engine.dialect.name != 'sqlite':
+        print('query-plans only supports SQLite.')
+        return
+    scans = 0
+    for name, query in hot_path_queries().items():
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        uses_index = all('SCAN' not in step or 'USING' in step for step in plan)
+        scans += not uses_index
+        print(f"{'OK  ' if uses_index else 'SCAN'} {name}")
+        for step in plan:
+            print(f'       {step}')
+    if scans:
+        raise SystemExit(1)
+
+
+@app.cli.command('slow-queries')
+@click.option('--hours', type=float, default=None, help='Only captures from the last N hours.')
+@click.option('--endpoint', default=None, help='Only captures from this endpoint.')
+@click.option('--limit', type=int, default=10, show_default=True)
+@click.option('--plans/--no-plans', default=True, show_default=True)
+def slow_queries_command(hours, endpoint, limit, plans):
+    """Rank the slow-query log's query shapes by total time."""
+    shapes = slow_query_log.report(hours=hours, endpoint=endpoint)
+    if not shapes:
+        print(f'no slow queries in {slow_query_log.path} (threshold {slow_query_log.threshold * 1000:g} ms)')
+        return
+    print(f"{'shape':12} {'count':>6} {'total ms':>10} {'avg':>8} {'p95':>8} {'max':>8}  endpoints")
+    for s in shapes[:limit]:
+        endpoints = ', '.join(f'{name} ({n})' for name, n in s['endpoints'][:3])
+        print(f"{s['shape']:12} {s['count']:6} {s['total_ms']:10.1f} {s['avg_ms']:8.1f} {s['p95_ms']:8.1f} "
+              f"{s['max_ms']:8.1f}  {endpoints}")
+        print(f"    {s['sql'][:300]}")
+        if plans and s['plan']:
+            for step in s['plan']:
+                print(f'      {step}')
+        if plans and s['example'] and s['example']['params'] is not None:
+            print(f"    slowest params: {json.dumps(s['example']['params'], default=str)[:300]}")
+        print()
 
 
 # =====================================================
@@ -422,6 +756,914 @@ def sanitize_input(text, max_length=None):
     return text
 
 
+# =====================================================
+#  PROGRESS SERVICE
+# =====================================================
+def _percent(completed, total):
+    return int(round((completed / total) * 100)) if total else 0
+
+
+def get_enrolled_courses(student_id):
+    """Enrolled courses with completion percentage for a student.
+
+    Always two queries regardless of the number of enrollments.
+    """
+    courses = db.session.query(Course)\
+        .join(CourseProgress, CourseProgress.course_id == Course.id)\
+        .filter(CourseProgress.student_id == student_id)\
+        .group_by(Course.id)\
+        .order_by(db.func.min(CourseProgress.id)).all()
+    progress = get_course_progress(student_id, [c.id for c in courses])
+    return [{
+        'id': c.id,
+        'title': c.title,
+        'description': c.description,
+        'progress': progress[c.id]['percent'],
+        'completed_modules': progress[c.id]['completed'],
+        'total_modules': progress[c.id]['total'],
+    } for c in courses]
+
+
+def get_course_progress(student_id, course_ids):
+    """Map course_id -> {'total', 'completed', 'percent'} in one grouped query."""
+    result = {cid: {'total': 0, 'completed': 0, 'percent': 0} for cid in course_ids}
+    if not course_ids:
+        return result
+    rows = db.session.query(
+        Module.course_id,
+        db.func.count(Module.id),
+        db.func.count(ModuleProgress.id)
+    ).outerjoin(ModuleProgress, db.and_(ModuleProgress.module_id == Module.id,
+                                        ModuleProgress.student_id == student_id))\
+        .filter(Module.course_id.in_(course_ids))\
+        .group_by(Module.course_id).all()
+    for course_id, total, completed in rows:
+        result[course_id] = {'total': total, 'completed': completed, 'percent': _percent(completed, total)}
+    return result
+
+
+def get_module_progress(student_id, course_id):
+    """Per-module progress rows for one course: (module, completed_at or None)."""
+    return db.session.query(Module, ModuleProgress.completed_at)\
+        .outerjoin(ModuleProgress, db.and_(ModuleProgress.module_id == Module.id,
+                                           ModuleProgress.student_id == student_id))\
+        .filter(Module.course_id == course_id)\
+        .order_by(Module.id).all()
+
+
+# =====================================================
+#  ADMIN STATISTICS SNAPSHOT
+# =====================================================
+# Counters read by the admin dashboard. Routes that change users, courses or
+# enrollments bump them inside their own transaction, so the dashboard reads a
+# handful of rows instead of running the aggregates on every load.
+ADMIN_STAT_KEYS = ('users', 'users_student', 'users_instructor', 'users_admin',
+                   'courses', 'enrollments', 'revenue')
+
+
+def _bump(model, key_col, key, col, delta):
+    """Add delta to model.col for key, creating the row if it is missing."""
+    table = model.__table__
+    res = db.session.execute(table.update().where(table.c[key_col] == key)
+                             .values({col: table.c[col] + delta}))
+    if res.rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values({key_col: key, col: delta}))
+    except IntegrityError:
+        # another worker created the row first
+        db.session.execute(table.update().where(table.c[key_col] == key)
+                           .values({col: table.c[col] + delta}))
+
+
+def bump_admin_stats(**deltas):
+    """Apply counter deltas, e.g. bump_admin_stats(users=1, users_student=1)."""
+    for key, delta in deltas.items():
+        if delta:
+            _bump(AdminStat, 'key', key, 'value', delta)
+
+
+def record_user_stats(role, delta=1):
+    bump_admin_stats(**{'users': delta, f'users_{role}': delta})
+
+
+def record_enrollment_stats(course_id, enrolled_at, delta=1):
+    bump_admin_stats(enrollments=delta)
+    _bump(DailyEnrollmentStat, 'day', enrolled_at.date(), 'count', delta)
+    _bump(CourseEnrollmentStat, 'course_id', course_id, 'count', delta)
+
+
+def compute_live_admin_stats():
+    """Run the full aggregates against the live tables."""
+    roles = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all())
+    stats = {
+        'users': User.query.count(),
+        'users_student': roles.get('student', 0),
+        'users_instructor': roles.get('instructor', 0),
+        'users_admin': roles.get('admin', 0),
+        'courses': Course.query.count(),
+        'enrollments': CourseProgress.query.count(),
+        'revenue': db.session.query(db.func.sum(Course.price)).scalar() or 0.0,
+    }
+    days = {}
+    for day, count in db.session.query(db.func.date(CourseProgress.created_at), db.func.count(CourseProgress.id))\
+            .group_by(db.func.date(CourseProgress.created_at)).all():
+        if day:
+            days[datetime.strptime(str(day), '%Y-%m-%d').date()] = count
+    per_course = dict(db.session.query(Course.id, db.func.count(CourseProgress.id))
+                      .join(CourseProgress, Course.id == CourseProgress.course_id)
+                      .group_by(Course.id).all())
+    return stats, days, per_course
+
+
+def rebuild_admin_stats():
+    """Recompute the snapshot from scratch (recovery)."""
+    stats, days, per_course = compute_live_admin_stats()
+    AdminStat.query.delete()
+    DailyEnrollmentStat.query.delete()
+    CourseEnrollmentStat.query.delete()
+    db.session.add_all([AdminStat(key=k, value=v) for k, v in stats.items()])
+    db.session.add(AdminStat(key='built_at', value=datetime.utcnow().timestamp()))
+    db.session.add_all([DailyEnrollmentStat(day=d, count=c) for d, c in days.items()])
+    db.session.add_all([CourseEnrollmentStat(course_id=cid, count=c) for cid, c in per_course.items()])
+    db.session.commit()
+
+
+def check_admin_stats():
+    """Compare the snapshot with the live aggregates; returns a list of mismatches."""
+    stats, days, per_course = compute_live_admin_stats()
+    snapshot = {s.key: s.value for s in AdminStat.query.all()}
+    problems = []
+    for key in ADMIN_STAT_KEYS:
+        if abs((snapshot.get(key) or 0) - stats[key]) > 1e-6:
+            problems.append(f'{key}: snapshot={snapshot.get(key)} live={stats[key]}')
+    snap_days = {d.day: d.count for d in DailyEnrollmentStat.query.filter(DailyEnrollmentStat.count != 0).all()}
+    for day in sorted(set(days) | set(snap_days)):
+        if snap_days.get(day, 0) != days.get(day, 0):
+            problems.append(f'enrollments on {day}: snapshot={snap_days.get(day, 0)} live={days.get(day, 0)}')
+    snap_courses = {c.course_id: c.count for c in CourseEnrollmentStat.query.filter(CourseEnrollmentStat.count != 0).all()}
+    for cid in sorted(set(per_course) | set(snap_courses)):
+        if snap_courses.get(cid, 0) != per_course.get(cid, 0):
+            problems.append(f'course {cid} enrollments: snapshot={snap_courses.get(cid, 0)} live={per_course.get(cid, 0)}')
+    return problems
+
+
+def read_admin_stats():
+    """Read the dashboard snapshot, building it on first use."""
+    snapshot = {s.key: s.value for s in AdminStat.query.all()}
+    if 'built_at' not in snapshot:
+        rebuild_admin_stats()
+        snapshot = {s.key: s.value for s in AdminStat.query.all()}
+
+    since = (datetime.utcnow() - timedelta(days=7)).date()
+    days = DailyEnrollmentStat.query.filter(DailyEnrollmentStat.day >= since, DailyEnrollmentStat.count > 0)\
+        .order_by(DailyEnrollmentStat.day).all()
+    top_courses = db.session.query(Course.title, CourseEnrollmentStat.count)\
+        .join(Course, Course.id == CourseEnrollmentStat.course_id)\
+        .filter(CourseEnrollmentStat.count > 0)\
+        .order_by(CourseEnrollmentStat.count.desc()).limit(5).all()
+
+    stats = {key: int(snapshot.get(key) or 0) for key in ADMIN_STAT_KEYS if key != 'revenue'}
+    stats['revenue'] = snapshot.get('revenue') or 0.0
+    stats['enrollment_dates'] = [str(d.day) for d in days]
+    stats['enrollment_counts'] = [d.count for d in days]
+    stats['top_course_titles'] = [row[0] for row in top_courses]
+    stats['top_course_enrollments'] = [row[1] for row in top_courses]
+    return stats
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Rebuild the admin dashboard statistics snapshot."""
+    db.create_all()
+    rebuild_admin_stats()
+    print('Admin statistics rebuilt.')
+
+
+@app.cli.command('check-stats')
+def check_stats_command():
+    """Compare the admin statistics snapshot with live aggregates."""
+    db.create_all()
+    problems = check_admin_stats()
+    for p in problems:
+        print('MISMATCH', p)
+    if problems:
+        raise SystemExit(1)
+    print('Admin statistics are consistent.')
+
+
+# =====================================================
+#  ANALYTICS ROLLUPS (per-day, per-course aggregates)
+# =====================================================
+# admin_analytics only reads DailyCourseStat, CourseRollup and StudentScoreStat.
+# refresh_rollups() uses a watermark per source table (last id seen and the
+# time of the last run) to find the earliest day with new or changed rows, then
+# recomputes every day from there on as a whole. Recomputing instead of adding
+# deltas means a rerun or an overlapping ROLLUP_LAG window never double counts.
+ROLLUP_METRICS = ('enrollments', 'completions', 'answers', 'correct')
+ROLLUP_STUDENT_BATCH = 500
+
+
+def _sql_day(value):
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def aggregate_course_days(since=None):
+    """{(day, course_id): {metric: count}} from the live tables, for days >= since (a date)."""
+    result = {}
+
+    def add(query, column, day, group_col, *metrics):
+        if since is not None:
+            query = query.filter(column >= _day_start(since))
+        for row_day, course_id, *values in query.group_by(day, group_col):
+            if row_day is None or course_id is None:
+                continue
+            entry = result.setdefault((_sql_day(row_day), course_id), dict.fromkeys(ROLLUP_METRICS, 0))
+            for metric, value in zip(metrics, values):
+                entry[metric] += int(value or 0)
+
+    day = db.func.date(CourseProgress.created_at)
+    add(db.session.query(day, CourseProgress.course_id, db.func.count(CourseProgress.id)),
+        CourseProgress.created_at, day, CourseProgress.course_id, 'enrollments')
+    day = db.func.date(CourseProgress.completed_at)
+    add(db.session.query(day, CourseProgress.course_id, db.func.count(CourseProgress.id))
+        .filter(CourseProgress.completed == True),
+        CourseProgress.completed_at, day, CourseProgress.course_id, 'completions')
+    day = db.func.date(StudentAnswer.answered_at)
+    add(db.session.query(day, Quiz.course_id, db.func.count(StudentAnswer.id),
+                         db.func.sum(db.case((StudentAnswer.correct == True, 1), else_=0)))
+        .join(Question, Question.id == StudentAnswer.question_id)
+        .join(Quiz, Quiz.id == Question.quiz_id)
+        .join(Course, Course.id == Quiz.course_id),  # a deleted course's quizzes keep their answers
+        StudentAnswer.answered_at, day, Quiz.course_id, 'answers', 'correct')
+    return result
+
+
+def aggregate_student_scores(student_ids=None):
+    """{student_id: (answers, correct)} from student_answer, optionally for some students only."""
+    query = db.session.query(StudentAnswer.student_id, db.func.count(StudentAnswer.id),
+                             db.func.sum(db.case((StudentAnswer.correct == True, 1), else_=0)))
+    if student_ids is None:
+        return {sid: (n, int(c or 0)) for sid, n, c in query.group_by(StudentAnswer.student_id)}
+    scores = {}
+    for chunk in batched(sorted(student_ids), ROLLUP_STUDENT_BATCH):
+        scores.update((sid, (n, int(c or 0))) for sid, n, c in
+                      query.filter(StudentAnswer.student_id.in_(chunk)).group_by(StudentAnswer.student_id))
+    return scores
+
+
+def _rollup_watermark(name):
+    mark = db.session.get(RollupWatermark, name)
+    if mark is None:
+        mark = RollupWatermark(name=name, last_id=0)
+        db.session.add(mark)
+    return mark
+
+
+def refresh_rollups(full=False):
+    """Bring the analytics rollups up to date in one transaction.
+
+    Returns {'full': bool, 'since': first day recomputed, 'days': rows written, 'students': scores updated}.
+    The first run (or full=True) rebuilds everything.
+    """
+    now = datetime.utcnow()
+    enroll_mark, answer_mark = _rollup_watermark('course_progress'), _rollup_watermark('student_answer')
+    max_enrollment = db.session.query(db.func.max(CourseProgress.id)).scalar() or 0
+    max_answer = db.session.query(db.func.max(StudentAnswer.id)).scalar() or 0
+    full = full or enroll_mark.last_at is None or answer_mark.last_at is None
+
+    if full:
+        since, students = None, None
+    else:
+        lag = timedelta(seconds=app.config['ROLLUP_LAG'])
+        # new rows are found by id (exam drains insert with the time the answer was logged);
+        # updated rows (re-answers, completions) by timestamp; one query per index
+        new_answers = StudentAnswer.id > answer_mark.last_id
+        changed_answers = StudentAnswer.answered_at > answer_mark.last_at - lag
+        earliest = [t for t in (
+            db.session.query(db.func.min(CourseProgress.created_at)).filter(CourseProgress.id > enroll_mark.last_id).scalar(),
+            db.session.query(db.func.min(CourseProgress.completed_at))
+            .filter(CourseProgress.completed_at > enroll_mark.last_at - lag).scalar(),
+            db.session.query(db.func.min(StudentAnswer.answered_at)).filter(new_answers).scalar(),
+            db.session.query(db.func.min(StudentAnswer.answered_at)).filter(changed_answers).scalar(),
+        ) if t is not None]
+        since = min(earliest).date() if earliest else None
+        # deduplicated here: DISTINCT makes SQLite walk the (student_id, question_id) index
+        # instead of the id / answered_at range
+        students = {sid for condition in (new_answers, changed_answers)
+                    for (sid,) in db.session.query(StudentAnswer.student_id).filter(condition)}
+
+    days_written = 0
+    if full or since is not None:
+        stale = DailyCourseStat.query if full else DailyCourseStat.query.filter(DailyCourseStat.day >= since)
+        courses = {cid for (cid,) in stale.with_entities(DailyCourseStat.course_id).distinct()}
+        stale.delete(synchronize_session=False)
+        fresh = aggregate_course_days(since)
+        if fresh:
+            db.session.execute(DailyCourseStat.__table__.insert(), [
+                dict(values, day=day, course_id=course_id) for (day, course_id), values in fresh.items()])
+        days_written = len(fresh)
+        courses |= {course_id for _, course_id in fresh}
+
+        totals = db.session.query(DailyCourseStat.course_id,
+                                  *[db.func.sum(getattr(DailyCourseStat, m)) for m in ROLLUP_METRICS])\
+            .group_by(DailyCourseStat.course_id)
+        stale_totals = CourseRollup.query
+        if not full:
+            totals = totals.filter(DailyCourseStat.course_id.in_(courses))
+            stale_totals = stale_totals.filter(CourseRollup.course_id.in_(courses))
+        rows = [dict(zip(('course_id',) + ROLLUP_METRICS, row)) for row in totals]
+        stale_totals.delete(synchronize_session=False)
+        if rows:
+            db.session.execute(CourseRollup.__table__.insert(), rows)
+
+    scores = aggregate_student_scores(students)
+    if full:
+        StudentScoreStat.query.delete(synchronize_session=False)
+    elif students:
+        for chunk in batched(sorted(students), ROLLUP_STUDENT_BATCH):
+            StudentScoreStat.query.filter(StudentScoreStat.student_id.in_(chunk)).delete(synchronize_session=False)
+    if scores:
+        db.session.execute(StudentScoreStat.__table__.insert(), [
+            {'student_id': sid, 'answers': n, 'correct': c} for sid, (n, c) in scores.items()])
+
+    enroll_mark.last_id, answer_mark.last_id = max_enrollment, max_answer
+    for mark in (enroll_mark, answer_mark):
+        mark.last_at = mark.updated_at = now
+    db.session.commit()
+    return {'full': full, 'since': since, 'days': days_written, 'students': len(scores)}
+
+
+def check_rollups():
+    """Compare the rollup tables with the live aggregates; returns a list of mismatches."""
+    problems = []
+    live = {key: values for key, values in aggregate_course_days().items() if any(values.values())}
+    stored = {(r.day, r.course_id): {m: getattr(r, m) for m in ROLLUP_METRICS} for r in DailyCourseStat.query}
+    for key in sorted(set(live) | set(stored)):
+        if live.get(key) != stored.get(key):
+            problems.append(f'{key[0]} course {key[1]}: rollup={stored.get(key)} live={live.get(key)}')
+    live_scores = aggregate_student_scores()
+    stored_scores = {s.student_id: (s.answers, s.correct) for s in StudentScoreStat.query}
+    for sid in sorted(set(live_scores) | set(stored_scores)):
+        if live_scores.get(sid) != stored_scores.get(sid):
+            problems.append(f'student {sid} score: rollup={stored_scores.get(sid)} live={live_scores.get(sid)}')
+    return problems
+
+
+def read_analytics(days=7):
+    """Data for the admin analytics page, read from the rollup tables.
+
+    Only reads: `flask refresh-rollups --loop` (or cron) keeps the rollups current.
+    """
+    mark = db.session.get(RollupWatermark, 'student_answer')
+    updated_at = mark.updated_at if mark is not None else None
+
+    courses = db.session.query(Course.title, CourseRollup.enrollments, CourseRollup.completions)\
+        .outerjoin(CourseRollup, CourseRollup.course_id == Course.id)\
+        .filter(Course.is_approved == True).order_by(Course.id).all()
+    course_completion_data = [{'title': title, 'enrollments': enrollments or 0, 'completions': completions or 0,
+                               'rate': int(completions / enrollments * 100) if enrollments else 0}
+                              for title, enrollments, completions in courses]
+
+    today = datetime.utcnow().date()
+    window = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+    per_day = {day: (e, a) for day, e, a in db.session.query(
+        DailyCourseStat.day, db.func.sum(DailyCourseStat.enrollments), db.func.sum(DailyCourseStat.answers))
+        .filter(DailyCourseStat.day >= window[0]).group_by(DailyCourseStat.day)}
+
+    top = db.session.query(User.full_name, StudentScoreStat.answers, StudentScoreStat.correct)\
+        .join(User, User.id == StudentScoreStat.student_id)\
+        .filter(StudentScoreStat.answers > 0)\
+        .order_by(StudentScoreStat.correct.desc()).limit(5).all()
+    return {
+        'course_completion_data': course_completion_data,
+        'engagement_labels': [d.strftime('%a %d %b') for d in window],
+        'engagement_by_day': [int(per_day.get(d, (0, 0))[0] or 0) for d in window],
+        'answers_by_day': [int(per_day.get(d, (0, 0))[1] or 0) for d in window],
+        'top_students': [{'name': name, 'score': int(correct / answers * 100), 'attempts': answers}
+                         for name, answers, correct in top],
+        'rollups_updated_at': updated_at,
+        # two missed runs: the refresh job is probably not running
+        'rollups_stale': updated_at is not None and (datetime.utcnow() - updated_at).total_seconds()
+        > 2 * app.config['ROLLUP_REFRESH_INTERVAL'],
+    }
+
+
+@app.cli.command('refresh-rollups')
+@click.option('--full', is_flag=True, help='Rebuild every day from scratch.')
+@click.option('--loop', is_flag=True, help='Keep refreshing every ROLLUP_REFRESH_INTERVAL seconds.')
+def refresh_rollups_command(full, loop):
+    """Update the analytics rollup tables from their watermarks."""
+    while True:
+        start = time.perf_counter()
+        result = refresh_rollups(full=full)
+        scope = 'all days' if result['full'] else (f"days from {result['since']}" if result['since'] else 'no new activity')
+        print(f"Rollups refreshed in {time.perf_counter() - start:.2f}s ({scope}): "
+              f"{result['days']} day/course row(s), {result['students']} student score(s).")
+        if not loop:
+            break
+        full = False
+        db.session.remove()
+        time.sleep(app.config['ROLLUP_REFRESH_INTERVAL'])
+
+
+@app.cli.command('check-rollups')
+def check_rollups_command():
+    """Compare the analytics rollups with live aggregates."""
+    problems = check_rollups()
+    for p in problems:
+        print('MISMATCH', p)
+    if problems:
+        raise SystemExit(1)
+    print('Analytics rollups are consistent.')
+
+
+# =====================================================
+#  COURSE CATALOGUE (keyset pagination + page cache)
+# =====================================================
+catalogue_cache = PageCache(os.path.join(app.instance_path, 'catalogue.generation'))
+
+
+def encode_course_cursor(course):
+    # migration 009 backfills legacy NULLs; datetime.min keeps a stray one from breaking the page
+    created_at = course.created_at or datetime.min
+    return f"{created_at.isoformat()}_{course.id}"
+
+
+def decode_course_cursor(cursor):
+    """Parse an ``after`` cursor into (created_at, id); None if missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        created_at, course_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(course_id)
+    except ValueError:
+        return None
+
+
+def get_course_page(after=None, limit=None):
+    """One page of approved courses, newest first, keyed on (created_at, id).
+
+    Returns (courses, next_cursor); next_cursor is None on the last page.
+    """
+    limit = limit or app.config['COURSES_PER_PAGE']
+    query = Course.query.options(db.joinedload(Course.instructor)).filter(Course.is_approved == True)
+    position = decode_course_cursor(after)
+    if position:
+        created_at, course_id = position
+        query = query.filter(db.or_(Course.created_at < created_at,
+                                    db.and_(Course.created_at == created_at, Course.id < course_id)))
+    courses = query.order_by(Course.created_at.desc(), Course.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_course_cursor(courses[limit - 1]) if len(courses) > limit else None
+    return courses[:limit], next_cursor
+
+
+def cacheable_request():
+    """Only anonymous requests with no pending flash messages share cached pages."""
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def cached_page(key, build):
+    """Serve key from the catalogue cache for anonymous visitors, else build it."""
+    if not cacheable_request():
+        return build()
+    body = catalogue_cache.get(key)
+    if body is None:
+        body = build()
+        catalogue_cache.set(key, body)
+    return body
+
+
+def invalidate_catalogue():
+    catalogue_cache.invalidate()
+
+
+# =====================================================
+#  QUIZ CACHE (answer keys, compiled payloads) + ANSWER UPSERTS
+# =====================================================
+quiz_cache = PageCache(os.path.join(app.instance_path, 'quiz.generation'), max_entries=app.config['QUIZ_CACHE_SIZE'])
+
+
+def get_answer_key(quiz_id):
+    """{question_id: {'choices': {choice_id: is_correct}, 'explanation': str}} for a quiz.
+
+    Built with one query and cached per worker until invalidate_quiz_cache().
+    """
+    key = ('answer_key', quiz_id)
+    answer_key = quiz_cache.get(key)
+    if answer_key is None:
+        answer_key = {}
+        rows = db.session.query(Question.id, Question.explanation, Choice.id, Choice.is_correct)\
+            .outerjoin(Choice, Choice.question_id == Question.id)\
+            .filter(Question.quiz_id == quiz_id)
+        for question_id, explanation, choice_id, is_correct in rows:
+            entry = answer_key.setdefault(question_id, {'choices': {}, 'explanation': explanation or ''})
+            if choice_id is not None:
+                entry['choices'][choice_id] = bool(is_correct)
+        quiz_cache.set(key, answer_key)
+    return answer_key
+
+
+def get_compiled_quiz(quiz_id):
+    """The student-facing quiz (questions and choices in order, no answers) compiled once.
+
+    Returns {'quiz': dict, 'json': bytes, 'etag': str} or None if the quiz does
+    not exist. Quizzes do not change after create_quiz, so the entry lives
+    until invalidate_quiz_cache().
+    """
+    key = ('payload', quiz_id)
+    compiled = quiz_cache.get(key)
+    if compiled is None:
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None:
+            return None
+        questions = {}
+        rows = db.session.query(Question.id, Question.text, Question.order, Choice.id, Choice.text)\
+            .outerjoin(Choice, Choice.question_id == Question.id)\
+            .filter(Question.quiz_id == quiz_id)\
+            .order_by(Question.order, Question.id, Choice.id)
+        for question_id, text, order, choice_id, choice_text in rows:
+            question = questions.setdefault(question_id, {'id': question_id, 'text': text, 'order': order, 'choices': []})
+            if choice_id is not None:
+                question['choices'].append({'id': choice_id, 'text': choice_text})
+        data = {'id': quiz.id, 'title': quiz.title, 'course_id': quiz.course_id, 'exam_mode': bool(quiz.exam_mode),
+                'closes_at': quiz.closes_at, 'questions': list(questions.values())}
+        body = json.dumps(dict(data, closes_at=quiz.closes_at.isoformat() if quiz.closes_at else None),
+                          separators=(',', ':')).encode()
+        compiled = {'quiz': data, 'json': body, 'etag': hashlib.sha256(body).hexdigest()[:32]}
+        quiz_cache.set(key, compiled)
+    return compiled
+
+
+def invalidate_quiz_cache():
+    quiz_cache.invalidate()
+
+
+def upsert_answer_rows(rows):
+    """Insert or update StudentAnswer rows (dicts with student_id, question_id,
+    choice_id, correct, answered_at).
+
+    Uses the unique (student_id, question_id) index so the whole batch is a
+    single statement. The caller commits.
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(StudentAnswer.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'question_id'],
+            set_={'choice_id': stmt.excluded.choice_id, 'correct': stmt.excluded.correct,
+                  'answered_at': stmt.excluded.answered_at})
+        db.session.execute(stmt, rows)
+    else:
+        by_student = {}
+        for r in rows:
+            by_student.setdefault(r['student_id'], []).append(r['question_id'])
+        for student_id, question_ids in by_student.items():
+            StudentAnswer.query.filter(StudentAnswer.student_id == student_id,
+                                       StudentAnswer.question_id.in_(question_ids))\
+                .delete(synchronize_session=False)
+        db.session.execute(StudentAnswer.__table__.insert(), rows)
+
+
+def upsert_student_answers(student_id, graded):
+    """Upsert one StudentAnswer per (question_id, choice_id, correct) in graded."""
+    now = datetime.utcnow()
+    upsert_answer_rows([{'student_id': student_id, 'question_id': question_id, 'choice_id': choice_id,
+                         'correct': correct, 'answered_at': now} for question_id, choice_id, correct in graded])
+
+
+# =====================================================
+#  EXAM MODE (answers buffered in a durable log)
+# =====================================================
+answer_log = AnswerLog(os.path.join(app.instance_path, 'exam_logs'))
+
+
+def get_quiz_meta(quiz_id):
+    """Cached exam settings of a quiz, or None if it does not exist."""
+    key = ('meta', quiz_id)
+    meta = quiz_cache.get(key)
+    if meta is None:
+        quiz = db.session.get(Quiz, quiz_id)
+        if quiz is None:
+            return None
+        meta = {'exam_mode': bool(quiz.exam_mode), 'closes_at': quiz.closes_at, 'sealed': quiz.sealed_at is not None}
+        quiz_cache.set(key, meta)
+    return meta
+
+
+def exam_is_open(meta):
+    return not meta['sealed'] and (meta['closes_at'] is None or datetime.utcnow() < meta['closes_at'])
+
+
+def log_exam_answers(quiz_id, student_id, graded):
+    """Acknowledge exam answers by appending them to the quiz's answer log."""
+    now = datetime.utcnow().isoformat()
+    answer_log.append(quiz_id, [{'s': student_id, 'q': question_id, 'c': choice_id, 't': now}
+                                for question_id, choice_id, _ in graded])
+    exam_drainer.poke()
+
+
+def apply_logged_answers(quiz_id, records):
+    """Grade a batch of logged answers and upsert them in one transaction (last answer wins)."""
+    answer_key = get_answer_key(quiz_id)
+    latest = {}
+    for r in records:
+        question = answer_key.get(r.get('q'))
+        if question is None or r.get('c') not in question['choices']:
+            continue
+        latest[(r['s'], r['q'])] = {'student_id': r['s'], 'question_id': r['q'], 'choice_id': r['c'],
+                                    'correct': question['choices'][r['c']],
+                                    'answered_at': datetime.fromisoformat(r['t'])}
+    try:
+        upsert_answer_rows(list(latest.values()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def seal_exam(quiz_id):
+    """Stop accepting answers, then drain the quiz's log and retire it. Returns answers drained."""
+    now = datetime.utcnow()
+    # a conditional UPDATE, so when several workers find the exam due only one seals it
+    claimed = Quiz.query.filter(Quiz.id == quiz_id, Quiz.sealed_at.is_(None)).update(
+        {'sealed_at': now,
+         'closes_at': db.case((Quiz.closes_at.is_(None) | (Quiz.closes_at > now), now), else_=Quiz.closes_at)},
+        synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return 0
+    # every worker rejects new answers before the final drain reads the log
+    invalidate_quiz_cache()
+    return answer_log.seal(quiz_id, lambda records: apply_logged_answers(quiz_id, records))
+
+
+def drain_exam_logs(quiz_ids=None):
+    """Drain pending answer logs and seal exams past their close time (plus grace).
+
+    Returns the number of answers written.
+    """
+    count = 0
+    for quiz_id in (quiz_ids if quiz_ids is not None else answer_log.pending_quiz_ids()):
+        count += answer_log.drain(quiz_id, lambda records, quiz_id=quiz_id: apply_logged_answers(quiz_id, records),
+                                  blocking=quiz_ids is not None)
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['EXAM_SEAL_GRACE'])
+    due = Quiz.query.filter(Quiz.exam_mode.is_(True), Quiz.sealed_at.is_(None), Quiz.closes_at <= cutoff)
+    if quiz_ids is not None:
+        due = due.filter(Quiz.id.in_(quiz_ids))
+    for quiz in due.all():
+        count += seal_exam(quiz.id)
+    return count
+
+
+def _drain_exam_logs_job():
+    with app.app_context():
+        try:
+            drain_exam_logs()
+        finally:
+            db.session.remove()
+
+
+# poked on every logged answer and drains at most once per EXAM_DRAIN_INTERVAL per worker;
+# without answers it still runs every EXAM_SEAL_CHECK_INTERVAL to seal exams past their close time
+exam_drainer = PeriodicWorker(_drain_exam_logs_job, interval=app.config['EXAM_DRAIN_INTERVAL'],
+                              idle_interval=app.config['EXAM_SEAL_CHECK_INTERVAL'], name='exam-drainer')
+
+
+@app.before_request
+def start_exam_drainer():
+    exam_drainer.start()  # a pid check once running; started per worker, after the fork
+
+
+@app.cli.command('exam-drain')
+@click.option('--loop', is_flag=True, help='Keep draining every EXAM_DRAIN_INTERVAL seconds.')
+def exam_drain_command(loop):
+    """Write buffered exam answers to the database and seal exams past their close time."""
+    while True:
+        count = drain_exam_logs()
+        if count or not loop:
+            print(f'{count} answer(s) drained.')
+        if not loop:
+            break
+        time.sleep(app.config['EXAM_DRAIN_INTERVAL'])
+
+
+@app.cli.command('exam-seal')
+@click.argument('quiz_id', type=int)
+def exam_seal_command(quiz_id):
+    """Close an exam now: drain its answer log and stop accepting answers."""
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz is None:
+        raise click.ClickException(f'Quiz {quiz_id} not found')
+    if quiz.sealed_at is not None:
+        raise click.ClickException(f'Quiz {quiz_id} was already sealed at {quiz.sealed_at:%Y-%m-%d %H:%M:%S}')
+    print(f'Quiz {quiz_id} sealed; {seal_exam(quiz_id)} answer(s) drained.')
+
+
+# =====================================================
+#  QUESTION BANK IMPORT
+# =====================================================
+def check_questions(questions, start_order=1):
+    """Validate questions in the create_quiz JSON shape; returns them normalized or raises QuestionBankError."""
+    return list(question_bank.iter_valid((f'question {i}', q) for i, q in enumerate(questions, start=start_order)))
+
+
+def add_questions(quiz_id, questions, start_order=1):
+    """Validate and bulk insert questions in the create_quiz JSON shape.
+
+    Returns the number inserted; raises QuestionBankError. The caller commits.
+    """
+    checked = check_questions(questions, start_order)
+    count, _ = question_bank.insert_questions(db.session.connection(), Question.__table__, Choice.__table__,
+                                              quiz_id, checked, start_order)
+    return count
+
+
+def import_questions(quiz_id, source, fmt=None, start_order=1):
+    """Bulk insert a JSON/JSON Lines/CSV question bank (path, bytes or file
+    object) into quiz_id; returns the throughput report.
+
+    source may also be the result of question_bank.validate_question_bank,
+    which lets the caller validate before it writes anything (the Quiz row
+    included), so the write lock is only held for the inserts. Raises
+    QuestionBankError. The caller commits.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return import_questions(quiz_id, f, fmt, start_order)
+    bank = source if isinstance(source, dict) else question_bank.validate_question_bank(source, fmt)
+    return question_bank.import_question_bank(db.session.connection(), Question.__table__, Choice.__table__,
+                                              quiz_id, bank, start_order)
+
+
+def describe_import(report):
+    return (f"{report['questions']} questions, {report['choices']} choices in {report['total_seconds']:.2f}s "
+            f"(validate {report['validate_seconds']:.2f}s, insert {report['insert_seconds']:.2f}s, "
+            f"{report['questions_per_second']} questions/s)")
+
+
+@app.cli.command('import-questions')
+@click.argument('course_id', type=int)
+@click.argument('title')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['json', 'jsonl', 'csv']), default=None,
+              help='Defaults to the file extension.')
+@click.option('--exam-mode', is_flag=True)
+def import_questions_command(course_id, title, path, fmt, exam_mode):
+    """Create a quiz from a question bank file and print the import throughput."""
+    if db.session.get(Course, course_id) is None:
+        raise click.ClickException(f'Course {course_id} not found')
+    with open(path, 'rb') as f:
+        try:
+            # validate the whole file before the first write, the Quiz row included
+            bank = question_bank.validate_question_bank(f, fmt or question_bank.detect_format(path))
+            quiz = Quiz(course_id=course_id, title=title, exam_mode=exam_mode)
+            db.session.add(quiz)
+            db.session.flush()
+            report = import_questions(quiz.id, bank)
+        except question_bank.QuestionBankError as exc:
+            db.session.rollback()
+            raise click.ClickException('\n'.join(exc.errors))
+    db.session.commit()
+    invalidate_quiz_cache()
+    print(f'Quiz {quiz.id} created: {describe_import(report)}')
+
+
+# =====================================================
+#  COURSE SEARCH (FTS5 index kept in sync by the course/module routes)
+# =====================================================
+# The index holds approved courses and their modules. create_course,
+# edit_course, create_module, delete_course and the approve/reject routes
+# update it in the same transaction as the rows they change. Without FTS5
+# (migration 008 skipped) search falls back to LIKE scans.
+_search_index_ready = False
+
+
+def search_index_ready():
+    global _search_index_ready
+    if not _search_index_ready:
+        with db.engine.connect() as conn:
+            _search_index_ready = search.has_index(conn)
+    return _search_index_ready
+
+
+def index_course_for_search(course):
+    if search_index_ready() and course.is_approved:
+        dbengine.mark_written()  # text() writes don't pin the request to the primary by themselves
+        search.index_course(db.session, course.id, course.title, course.description)
+
+
+def index_module_for_search(module, course):
+    if search_index_ready() and course.is_approved:
+        dbengine.mark_written()
+        search.index_module(db.session, module.id, course.id, module.title, module.content)
+
+
+def add_course_to_search(course_id):
+    """Index a newly approved course with all of its modules."""
+    if search_index_ready():
+        dbengine.mark_written()
+        search.add_course(db.session, course_id)
+
+
+def remove_course_from_search(course_id):
+    if search_index_ready():
+        dbengine.mark_written()
+        search.remove_course(db.session, course_id)
+
+
+def run_search(query, page=1):
+    if search_index_ready():
+        return search.search(db.session, query, page)
+    return search.search_like(db.session, query, page)
+
+
+def run_suggest(query):
+    if search_index_ready():
+        return search.suggest(db.session, query)
+    return search.search_like(db.session, query, per_page=search.SUGGEST_LIMIT, titles_only=True)['results']
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the index's highlight markers into <mark> tags."""
+    if not snippet:
+        return Markup('')
+    return Markup(str(escape(snippet)).replace(search.HIGHLIGHT_START, '<mark>')
+                  .replace(search.HIGHLIGHT_END, '</mark>'))
+
+
+def search_result_url(result):
+    if result['kind'] == 'module':
+        return url_for('course_detail', course_id=result['course_id'], _anchor=f"module-{result['id']}")
+    return url_for('course_detail', course_id=result['course_id'])
+
+
+def _search_page_arg():
+    try:
+        return max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+@app.route('/search')
+@read_only
+def search_courses():
+    query = request.args.get('q', '').strip()
+    found = run_search(query, _search_page_arg())
+    for result in found['results']:
+        result['url'] = search_result_url(result)
+        result['snippet'] = highlight(result['snippet'])
+    return render_template('search.html', q=query, **found)
+
+
+@app.route('/api/search')
+@read_only
+def search_json():
+    """Ranked results: {"results": [{kind, id, course_id, course_title, title, snippet, url, score}], "page", "next"}.
+
+    snippet is HTML with the matched words in <mark>.
+    """
+    query = request.args.get('q', '').strip()
+    found = run_search(query, _search_page_arg())
+    results = [dict(r, url=search_result_url(r), snippet=str(highlight(r['snippet']))) for r in found['results']]
+    return jsonify({'q': query, 'page': found['page'], 'results': results,
+                    'next': url_for('search_json', q=query, page=found['page'] + 1) if found['has_next'] else None})
+
+
+@app.route('/api/search/suggest')
+@read_only
+def search_suggest():
+    """Autocomplete: up to 8 course/module titles matching what was typed, the last word as a prefix."""
+    suggestions = [{'kind': r['kind'], 'title': r['title'], 'course_title': r['course_title'],
+                    'url': search_result_url(r)} for r in run_suggest(request.args.get('q', ''))]
+    response = jsonify({'suggestions': suggestions})
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """(Re)build the search index from every course and module."""
+    with db.engine.begin() as conn:
+        if not search.fts5_available(conn):
+            raise click.ClickException('This database has no FTS5; search uses LIKE scans instead')
+        start = time.perf_counter()
+        search.create_index(conn)
+        courses, modules = search.rebuild(conn)
+    print(f'Indexed {courses} courses and {modules} modules in {time.perf_counter() - start:.2f}s')
+
+
 # =====================================================
 #  HEALTH CHECK ENDPOINT
 # =====================================================
@@ -446,15 +1688,45 @@ def health_check():
 #  ROUTES
 # =====================================================
 @app.route('/')
+@read_only
 def index():
-    courses = Course.query.filter_by(is_approved=True).order_by(Course.created_at.desc()).limit(6).all()
-    return render_template('index.html', courses=courses)
+    def build():
+        courses, _ = get_course_page(limit=6)
+        return render_template('index.html', courses=courses)
+    return cached_page(('index',), build)
 
 
 @app.route('/courses')
+@read_only
 def courses():
-    courses_list = Course.query.filter_by(is_approved=True).order_by(Course.created_at.desc()).all()
-    return render_template('courses.html', courses=courses_list)
+    after = request.args.get('after')
+
+    def build():
+        courses_list, next_cursor = get_course_page(after)
+        return render_template('courses.html', courses=courses_list, next_cursor=next_cursor, after=after)
+    return cached_page(('courses', after), build)
+
+
+@app.route('/api/courses')
+@read_only
+def courses_json():
+    after = request.args.get('after')
+
+    def build():
+        courses_list, next_cursor = get_course_page(after)
+        return jsonify({
+            'courses': [{
+                'id': c.id,
+                'title': c.title,
+                'description': c.description,
+                'image': c.image,
+                'price': c.price or 0.0,
+                'created_at': c.created_at.isoformat() if c.created_at else None,
+                'url': url_for('course_detail', course_id=c.id),
+            } for c in courses_list],
+            'next': next_cursor,
+        }).get_data(as_text=True)
+    return Response(cached_page(('courses.json', after), build), mimetype='application/json')
 
 
 @app.route('/about')
@@ -463,6 +1735,7 @@ def about():
 
 
 @app.route('/register', methods=['GET', 'POST'])
+@limiter.limit(ratelimit.REGISTER_PER_IP, methods=['POST'])
 def register():
     if request.method == 'POST':
         full_name = sanitize_input(request.form.get('full_name', ''), max_length=150)
@@ -494,10 +1767,12 @@ def register():
             flash('Email already registered!', 'error')
             return redirect(url_for('register'))
 
+        db.session.close()  # no pooled connection is held while the hash waits its turn
         new_user = User(full_name=full_name, email=email, role=role)
         new_user.set_password(password)
 
         db.session.add(new_user)
+        record_user_stats(role)
         try:
             db.session.commit()
         except IntegrityError:
@@ -511,17 +1786,37 @@ def register():
     return render_template('register.html')
 
 
+def store_rehashed_password(user_id, old_hash, new_hash):
+    # runs on a hashing thread; compare-and-set, so a password changed meanwhile is never overwritten
+    with app.app_context():
+        try:
+            User.query.filter_by(id=user_id, password_hash=old_hash).update(
+                {'password_hash': new_hash}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('storing the rehashed password of user %s failed', user_id)
+        finally:
+            db.session.remove()
+
+
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit(ratelimit.LOGIN_PER_IP, methods=['POST'])
+@limiter.limit(ratelimit.LOGIN_PER_ACCOUNT, key_func=ratelimit.login_account, methods=['POST'],
+               deduct_when=ratelimit.failed_login)
 def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
         user = User.query.filter_by(email=email).first()
+        db.session.close()  # no pooled connection is held while the hash waits its turn
 
         if user and user.check_password(password):
+            if passwords.PASSWORD_REHASH_ON_LOGIN and password_service.needs_rehash(user.password_hash):
+                password_service.rehash_async(password, functools.partial(store_rehashed_password,
+                                                                          user.id, user.password_hash))
             login_user(user)
-            user.last_activity = datetime.utcnow()
-            db.session.commit()
+            activity_tracker.touch(user.id)
             flash(f'Welcome back, {user.full_name}!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -550,19 +1845,10 @@ def set_language(lang):
 
 @app.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
-    # Update user activity
-    current_user.last_activity = datetime.utcnow()
-    db.session.commit()
-    
     if current_user.role == 'admin':
-        total_users = User.query.count()
-        total_students = User.query.filter_by(role='student').count()
-        total_instructors = User.query.filter_by(role='instructor').count()
-        total_admins = User.query.filter_by(role='admin').count()
-
-        total_courses = Course.query.count()
-        total_enrollments = CourseProgress.query.count()
+        stats = read_admin_stats()
 
         recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
         recent_courses = Course.query.order_by(Course.created_at.desc()).limit(10).all()
@@ -572,49 +1858,28 @@ def dashboard():
         recent_enrollments = recent_enrollments.join(Course, CourseProgress.course_id == Course.id)
         recent_enrollments = recent_enrollments.order_by(CourseProgress.created_at.desc()).limit(15).all()
 
-        # Enhanced analytics
-        # Total revenue from paid courses
-        total_revenue = db.session.query(db.func.sum(Course.price)).scalar() or 0.0
-        
-        # Enrollment trend (last 7 days)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        enrollments_by_day = db.session.query(
-            db.func.date(CourseProgress.created_at).label('date'),
-            db.func.count(CourseProgress.id).label('count')
-        ).filter(CourseProgress.created_at >= seven_days_ago).group_by(db.func.date(CourseProgress.created_at)).all()
-        enrollment_dates = [str(row[0]) for row in enrollments_by_day] if enrollments_by_day else []
-        enrollment_counts = [int(row[1]) for row in enrollments_by_day] if enrollments_by_day else []
-
-        # Course enrollment distribution (top courses)
-        top_courses_data = db.session.query(
-            Course.title,
-            db.func.count(CourseProgress.id).label('enrollment_count')
-        ).join(CourseProgress, Course.id == CourseProgress.course_id).group_by(Course.id).order_by(db.desc('enrollment_count')).limit(5).all()
-        top_course_titles = [row[0] for row in top_courses_data] if top_courses_data else []
-        top_course_enrollments = [row[1] for row in top_courses_data] if top_courses_data else []
-
         # User role distribution
         role_dist = [
-            {'name': 'Students', 'value': total_students},
-            {'name': 'Instructors', 'value': total_instructors},
-            {'name': 'Admins', 'value': total_admins}
+            {'name': 'Students', 'value': stats['users_student']},
+            {'name': 'Instructors', 'value': stats['users_instructor']},
+            {'name': 'Admins', 'value': stats['users_admin']}
         ]
 
         return render_template('admin_dashboard.html',
-                               total_users=total_users,
-                               total_students=total_students,
-                               total_instructors=total_instructors,
-                               total_admins=total_admins,
-                               total_courses=total_courses,
-                               total_enrollments=total_enrollments,
-                               total_revenue=total_revenue,
+                               total_users=stats['users'],
+                               total_students=stats['users_student'],
+                               total_instructors=stats['users_instructor'],
+                               total_admins=stats['users_admin'],
+                               total_courses=stats['courses'],
+                               total_enrollments=stats['enrollments'],
+                               total_revenue=stats['revenue'],
                                recent_users=recent_users,
                                recent_courses=recent_courses,
                                recent_enrollments=recent_enrollments,
-                               enrollment_dates=enrollment_dates,
-                               enrollment_counts=enrollment_counts,
-                               top_course_titles=top_course_titles,
-                               top_course_enrollments=top_course_enrollments,
+                               enrollment_dates=stats['enrollment_dates'],
+                               enrollment_counts=stats['enrollment_counts'],
+                               top_course_titles=stats['top_course_titles'],
+                               top_course_enrollments=stats['top_course_enrollments'],
                                role_dist=role_dist)
     elif current_user.role == 'instructor':
         courses = Course.query.filter_by(instructor_id=current_user.id).order_by(Course.created_at.desc()).all()
@@ -632,34 +1897,8 @@ def dashboard():
                                total_students=total_students,
                                recent_enrollments=total_students)
     else:
-        # Build a simple enrolled courses list with progress percentage for the student
-        progresses = CourseProgress.query.filter_by(student_id=current_user.id).all()
-        enrolled_courses = []
-        course_ids = []
-        for p in progresses:
-            course = Course.query.get(p.course_id)
-            if not course:
-                continue
-            modules = Module.query.filter_by(course_id=course.id).order_by(Module.id).all()
-            total = len(modules)
-            progress_pct = 0
-            if total > 0:
-                module_ids = [m.id for m in modules]
-                completed = ModuleProgress.query.filter(ModuleProgress.student_id == current_user.id, ModuleProgress.module_id.in_(module_ids)).count()
-                try:
-                    progress_pct = int(round((completed / total) * 100))
-                except Exception:
-                    progress_pct = 0
-            else:
-                progress_pct = 0
-
-            enrolled_courses.append({
-                'id': course.id,
-                'title': course.title,
-                'description': course.description,
-                'progress': progress_pct
-            })
-            course_ids.append(course.id)
+        enrolled_courses = get_enrolled_courses(current_user.id)
+        course_ids = [c['id'] for c in enrolled_courses]
 
         announcements = []
         if course_ids:
@@ -671,16 +1910,13 @@ def dashboard():
 
 @app.route('/teacher-dashboard')
 @login_required
+@read_only
 def teacher_dashboard():
     """Lightweight teacher dashboard for instructors."""
     if current_user.role != 'instructor':
         flash('Only instructors can access the teacher dashboard.', 'error')
         return redirect(url_for('dashboard'))
     
-    # Update activity
-    current_user.last_activity = datetime.utcnow()
-    db.session.commit()
-    
     # Get instructor's courses
     courses = Course.query.filter_by(instructor_id=current_user.id).order_by(Course.created_at.desc()).all()
     
@@ -704,24 +1940,78 @@ def teacher_dashboard():
 
 @app.route('/course/<int:course_id>')
 @login_required
+@read_only
 def course_detail(course_id):
     course = Course.query.get_or_404(course_id)
-    modules = Module.query.filter_by(course_id=course_id).all()
-    announcements = Announcement.query.filter_by(course_id=course_id).order_by(Announcement.created_at.desc()).all()
-    quizzes = Quiz.query.filter_by(course_id=course_id).order_by(Quiz.created_at.desc()).all()
-    videos = Video.query.filter_by(course_id=course_id).order_by(Video.created_at.desc()).all()
-    
+
     # If student, also gather completed module ids for UI
     completed_module_ids = set()
     if current_user.is_authenticated and current_user.role == 'student':
-        m_ids = [m.id for m in modules]
-        if m_ids:
-            rows = ModuleProgress.query.filter(ModuleProgress.student_id == current_user.id, ModuleProgress.module_id.in_(m_ids)).all()
-            completed_module_ids = {r.module_id for r in rows}
+        rows = get_module_progress(current_user.id, course_id)
+        modules = [m for m, _ in rows]
+        completed_module_ids = {m.id for m, completed_at in rows if completed_at}
+    else:
+        modules = Module.query.filter_by(course_id=course_id).order_by(Module.id).all()
+
+    announcements = Announcement.query.filter_by(course_id=course_id).order_by(Announcement.created_at.desc()).all()
+    quizzes = Quiz.query.filter_by(course_id=course_id).order_by(Quiz.created_at.desc()).all()
+    videos = Video.query.filter_by(course_id=course_id).order_by(Video.created_at.desc()).all()
 
     return render_template('course_detail.html', course=course, modules=modules, announcements=announcements, completed_module_ids=completed_module_ids, quizzes=quizzes, videos=videos)
 
 
+@app.route('/course/<int:course_id>/progress')
+@login_required
+@read_only
+def student_progress(course_id):
+    if current_user.role != 'student':
+        flash('Only students have course progress.', 'error')
+        return redirect(url_for('course_detail', course_id=course_id))
+
+    course = Course.query.get_or_404(course_id)
+    rows = get_module_progress(current_user.id, course_id)
+    grades = {g.module_id: g for g in Grade.query.filter_by(student_id=current_user.id, course_id=course_id).all()}
+
+    progress = []
+    for module, completed_at in rows:
+        grade = grades.get(module.id)
+        progress.append({
+            'module_title': module.title,
+            'completed': completed_at is not None,
+            'completed_at': completed_at,
+            'grade': grade.grade if grade else None,
+            'feedback': grade.feedback if grade else None,
+        })
+    completed_modules = sum(1 for p in progress if p['completed'])
+
+    return render_template('student_progress.html',
+                           course=course,
+                           progress=progress,
+                           completed_modules=completed_modules,
+                           total_modules=len(progress),
+                           progress_percent=_percent(completed_modules, len(progress)))
+
+
+VIDEO_MIMETYPES = {
+    'mp4': 'video/mp4',
+    'webm': 'video/webm',
+    'ogg': 'video/ogg',
+    'm4v': 'video/mp4'
+}
+
+
+def video_upload_dir():
+    upload_dir = os.path.join(app.root_path, 'static', 'uploads', 'videos')
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+
+def can_upload_videos(course):
+    if current_user.role == 'admin':
+        return True
+    return current_user.role == 'instructor' and course.instructor_id == current_user.id
+
+
 @app.route('/course/<int:course_id>/videos/upload', methods=['GET','POST'])
 @login_required
 def upload_video(course_id):
@@ -730,7 +2020,7 @@ def upload_video(course_id):
         flash('Only instructors or admins can upload videos.', 'error')
         return redirect(url_for('course_detail', course_id=course_id))
     # if instructor ensure they own the course
-    if current_user.role == 'instructor' and course.instructor_id != current_user.id:
+    if not can_upload_videos(course):
         flash('Only the course instructor can upload videos for this course.', 'error')
         return redirect(url_for('course_detail', course_id=course_id))
 
@@ -740,72 +2030,400 @@ def upload_video(course_id):
         if not file:
             flash('No file uploaded', 'error')
             return redirect(url_for('upload_video', course_id=course_id))
-        ALLOWED_EXT = {'mp4', 'webm', 'ogg', 'm4v'}
         filename = secure_filename(file.filename)
         ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-        if ext not in ALLOWED_EXT:
+        if ext not in VIDEO_MIMETYPES:
             flash('Unsupported video format', 'error')
             return redirect(url_for('upload_video', course_id=course_id))
-        upload_dir = os.path.join(app.root_path, 'static', 'uploads', 'videos')
-        os.makedirs(upload_dir, exist_ok=True)
         stored_name = f"{int(datetime.utcnow().timestamp())}_{filename}"
-        path = os.path.join(upload_dir, stored_name)
+        path = os.path.join(video_upload_dir(), stored_name)
         file.save(path)
         # Auto-detect MIME type based on file extension
-        mimetype_map = {
-            'mp4': 'video/mp4',
-            'webm': 'video/webm',
-            'ogg': 'video/ogg',
-            'm4v': 'video/mp4'
-        }
-        detected_mimetype = mimetype_map.get(ext, 'video/mp4')
-        v = Video(course_id=course_id, title=title, filename=stored_name, original_filename=filename, mimetype=detected_mimetype, uploaded_by=current_user.id)
+        v = Video(course_id=course_id, title=title, filename=stored_name, original_filename=filename, mimetype=VIDEO_MIMETYPES[ext], uploaded_by=current_user.id)
         db.session.add(v)
+        enqueue_video_job(v)
         db.session.commit()
         flash('Video uploaded successfully', 'success')
         return redirect(url_for('course_detail', course_id=course_id))
 
-    return render_template('upload_video.html', course=course)
+    return render_template('upload_video.html', course=course, chunk_size=app.config['VIDEO_UPLOAD_CHUNK_SIZE'])
 
 
-@app.route('/video/<int:video_id>')
-@login_required
-def view_video(video_id):
-    video = Video.query.get_or_404(video_id)
-    return render_template('video_player.html', video=video)
+# =====================================================
+#  RESUMABLE CHUNKED VIDEO UPLOADS
+# =====================================================
+# POST   /course/<id>/videos/uploads      start a session -> {upload_id, chunk_size, received}
+# PUT    /videos/uploads/<upload_id>      append one chunk at ?offset=<received>,
+#                                         with its hex SHA-256 in X-Chunk-SHA256
+# GET    /videos/uploads/<upload_id>      how many bytes arrived (to resume after a drop)
+# Chunks are written straight into the final file; the Video row is created
+# when the last byte arrives.
+def _upload_status(upload):
+    return {
+        'upload_id': upload.id,
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': app.config['VIDEO_UPLOAD_CHUNK_SIZE'],
+        'complete': upload.video_id is not None,
+        'video_id': upload.video_id,
+        'video_url': url_for('view_video', video_id=upload.video_id) if upload.video_id else None,
+    }
 
 
-@app.route('/video/<int:video_id>/stream')
-def stream_video(video_id):
-    video = Video.query.get_or_404(video_id)
-    file_path = os.path.join(app.root_path, 'static', 'uploads', 'videos', video.filename)
-    if not os.path.exists(file_path):
-        abort(404)
-    file_size = os.path.getsize(file_path)
-    range_header = request.headers.get('Range', None)
-    if not range_header:
-        return send_file(file_path, mimetype=video.mimetype, conditional=True)
-    # parse Range header: bytes=start-end
-    import re
-    m = re.match(r'bytes=(\d+)-(\d*)', range_header)
-    if m:
-        start = int(m.group(1))
-        end = m.group(2)
-        end = int(end) if end else file_size - 1
-    else:
-        start = 0
-        end = file_size - 1
-    if start >= file_size:
-        abort(416)
-    length = end - start + 1
-    with open(file_path, 'rb') as f:
-        f.seek(start)
-        data = f.read(length)
-    rv = Response(data, 206, mimetype=video.mimetype, direct_passthrough=True)
-    rv.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
-    rv.headers.add('Accept-Ranges', 'bytes')
-    rv.headers.add('Content-Length', str(length))
-    return rv
+def _get_own_upload(upload_id):
+    upload = VideoUpload.query.get_or_404(upload_id)
+    if upload.uploaded_by != current_user.id:
+        abort(403)
+    return upload
+
+
+@app.route('/course/<int:course_id>/videos/uploads', methods=['POST'])
+@login_required
+def start_video_upload(course_id):
+    course = Course.query.get_or_404(course_id)
+    if not can_upload_videos(course):
+        return jsonify({'error': 'Only the course instructor can upload videos for this course.'}), 403
+
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in VIDEO_MIMETYPES:
+        return jsonify({'error': 'Unsupported video format'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size required'}), 400
+    if size <= 0 or size > app.config['VIDEO_MAX_SIZE']:
+        return jsonify({'error': 'Video is empty or too large'}), 400
+
+    upload_id = secrets.token_hex(16)
+    stored_name = f"{int(datetime.utcnow().timestamp())}_{upload_id[:8]}_{filename}"
+    # create the final file up front; chunks are written into it in place
+    open(os.path.join(video_upload_dir(), stored_name), 'wb').close()
+
+    upload = VideoUpload(id=upload_id, course_id=course_id, uploaded_by=current_user.id,
+                         title=(data.get('title') or '').strip()[:200] or filename,
+                         original_filename=filename, stored_name=stored_name,
+                         mimetype=VIDEO_MIMETYPES[ext], size=size)
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(_upload_status(upload)), 201
+
+
+@app.route('/videos/uploads/<upload_id>', methods=['GET'])
+@login_required
+def video_upload_status(upload_id):
+    return jsonify(_upload_status(_finish_stalled_upload(_get_own_upload(upload_id))))
+
+
+@app.route('/videos/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_video_chunk(upload_id):
+    upload = _finish_stalled_upload(_get_own_upload(upload_id))
+    if upload.video_id is not None:
+        return jsonify(_upload_status(upload))
+
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'offset required'}), 400
+    if offset != upload.received:
+        # client is out of sync (e.g. resent a chunk after a dropped response)
+        return jsonify(dict(_upload_status(upload), error='offset mismatch')), 409
+
+    expected = (request.headers.get('X-Chunk-SHA256') or '').lower()
+    length = request.content_length or 0
+    if not expected or length <= 0 or length > app.config['VIDEO_UPLOAD_CHUNK_SIZE']:
+        return jsonify({'error': 'chunk with X-Chunk-SHA256 and Content-Length required'}), 400
+    if offset + length > upload.size:
+        return jsonify({'error': 'chunk exceeds declared size'}), 400
+
+    # stream the body to a per-request part file first: the upload file only
+    # changes once the checksum matches and this request has claimed the range
+    path = os.path.join(video_upload_dir(), upload.stored_name)
+    part_path = f'{path}.{secrets.token_hex(8)}.part'
+    try:
+        digest = hashlib.sha256()
+        written = 0
+        with open(part_path, 'wb') as part:
+            while written < length:
+                piece = request.stream.read(min(64 * 1024, length - written))
+                if not piece:
+                    break
+                digest.update(piece)
+                part.write(piece)
+                written += len(piece)
+        if written != length or digest.hexdigest() != expected:
+            return jsonify(dict(_upload_status(upload), error='checksum mismatch')), 422
+
+        # claim the range with a conditional update; its row lock is held until
+        # the commit, so a concurrent PUT for the same offset waits, matches no
+        # row and never touches the file. Bytes copied by a request that dies
+        # before committing lie past `received` and are overwritten on retry.
+        # The copy runs inside that window, so it uses large buffers to keep
+        # the write lock short even for chunks of several MB.
+        res = db.session.execute(VideoUpload.__table__.update()
+                                 .where(VideoUpload.__table__.c.id == upload.id)
+                                 .where(VideoUpload.__table__.c.received == offset)
+                                 .values(received=offset + length, updated_at=datetime.utcnow()))
+        if res.rowcount:
+            try:
+                with open(part_path, 'rb') as part, open(path, 'r+b') as f:
+                    f.seek(offset)
+                    shutil.copyfileobj(part, f, 1024 * 1024)
+            except OSError:
+                db.session.rollback()
+                raise
+            if offset + length == upload.size:
+                # the Video and its job commit with the last range, so a crash
+                # can't leave a complete upload that no retry can finish
+                _finish_upload(upload)
+        db.session.commit()
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    db.session.refresh(upload)
+    if not res.rowcount:
+        return jsonify(dict(_upload_status(upload), error='offset mismatch')), 409
+    return jsonify(_upload_status(upload))
+
+
+def _finish_upload(upload):
+    """Create the Video for a fully received upload and queue its renditions.
+
+    Runs in the caller's transaction; the conditional update on video_id
+    means only one request links a Video, the others roll back.
+    Returns False when another request got there first.
+    """
+    v = Video(course_id=upload.course_id, title=upload.title, filename=upload.stored_name,
+              original_filename=upload.original_filename, mimetype=upload.mimetype,
+              uploaded_by=upload.uploaded_by)
+    db.session.add(v)
+    enqueue_video_job(v)
+    res = db.session.execute(VideoUpload.__table__.update()
+                             .where(VideoUpload.__table__.c.id == upload.id)
+                             .where(VideoUpload.__table__.c.video_id.is_(None))
+                             .values(video_id=v.id))
+    return bool(res.rowcount)
+
+
+def _finish_stalled_upload(upload):
+    """Finish an upload whose last range was committed without its Video, as releases before this one could leave it."""
+    if upload.video_id is None and upload.received == upload.size:
+        if _finish_upload(upload):
+            db.session.commit()
+        else:
+            db.session.rollback()
+        db.session.refresh(upload)
+    return upload
+
+
+# =====================================================
+#  VIDEO PROCESSING QUEUE
+# =====================================================
+# Uploads enqueue a VideoJob; `flask video-worker` claims jobs from the table,
+# runs ffmpeg (see transcode.py) and stores rendition metadata on the Video.
+def video_rendition_dir(video_id):
+    return os.path.join(video_upload_dir(), 'renditions', str(video_id))
+
+
+def enqueue_video_job(video):
+    """Queue renditions for a new Video (call before committing it)."""
+    video.status = 'processing'
+    db.session.flush()
+    db.session.add(VideoJob(video_id=video.id, max_attempts=app.config['VIDEO_JOB_MAX_ATTEMPTS']))
+
+
+def claim_video_job(worker_name):
+    """Atomically move the oldest runnable job to 'running'; returns its id or None."""
+    table = VideoJob.__table__
+    while True:
+        job_id = db.session.query(VideoJob.id)\
+            .filter(VideoJob.status == 'queued', VideoJob.run_after <= datetime.utcnow())\
+            .order_by(VideoJob.run_after, VideoJob.id).limit(1).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        res = db.session.execute(table.update()
+                                 .where(table.c.id == job_id, table.c.status == 'queued')
+                                 .values(status='running', worker=worker_name, started_at=datetime.utcnow(),
+                                         attempts=table.c.attempts + 1))
+        db.session.commit()
+        if res.rowcount:
+            return job_id
+        # another worker claimed it first; try the next one
+
+
+def run_video_job(job_id):
+    """Transcode one claimed job, recording success, retry or failure."""
+    with app.app_context():
+        job = VideoJob.query.get(job_id)
+        video = Video.query.get(job.video_id)
+        try:
+            if not video:
+                raise transcode.TranscodeError('video no longer exists')
+            src = os.path.join(video_upload_dir(), video.filename)
+            info = transcode.transcode(src, video_rendition_dir(video.id))
+        except Exception as e:
+            db.session.rollback()
+            job.error = str(e)[-2000:]
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                job.finished_at = datetime.utcnow()
+                if video:
+                    # keep serving the original upload
+                    video.status = 'ready'
+            else:
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=30 * 2 ** job.attempts)
+            db.session.commit()
+            app.logger.warning('Video job %s attempt %s failed: %s', job.id, job.attempts, job.error)
+            return False
+
+        video.renditions = json.dumps(info)
+        video.poster = info['poster']
+        video.status = 'ready'
+        job.status = 'done'
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+
+def requeue_stale_video_jobs():
+    """Jobs left 'running' by a crashed worker go back to the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=transcode.TRANSCODE_TIMEOUT * 2)
+    count = VideoJob.query.filter(VideoJob.status == 'running', VideoJob.started_at < cutoff)\
+        .update({'status': 'queued'}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+@app.cli.command('video-worker')
+@click.option('--concurrency', type=int, default=None, help='Parallel ffmpeg jobs (VIDEO_WORKER_CONCURRENCY).')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+def video_worker_command(concurrency, once):
+    """Process queued video transcoding jobs."""
+    concurrency = concurrency or app.config['VIDEO_WORKER_CONCURRENCY']
+    worker_name = f'{os.uname().nodename}:{os.getpid()}'
+    requeued = requeue_stale_video_jobs()
+    print(f'video worker {worker_name}: concurrency={concurrency}, requeued {requeued} stale job(s)')
+    slots = threading.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            slots.acquire()
+            job_id = claim_video_job(worker_name)
+            if job_id is None:
+                slots.release()
+                if once:
+                    break
+                time.sleep(app.config['VIDEO_WORKER_POLL_INTERVAL'])
+                continue
+            print(f'job {job_id}: started')
+            pool.submit(_run_video_job_slot, job_id, slots)
+
+
+def _run_video_job_slot(job_id, slots):
+    try:
+        ok = run_video_job(job_id)
+    except Exception:
+        app.logger.exception('Video job %s crashed', job_id)
+        ok = False
+    finally:
+        slots.release()
+    print(f"job {job_id}: {'done' if ok else 'will retry or failed'}")
+
+
+def video_job_summary(limit=50):
+    counts = dict(db.session.query(VideoJob.status, db.func.count(VideoJob.id)).group_by(VideoJob.status).all())
+    jobs = VideoJob.query.order_by(VideoJob.id.desc()).limit(limit).all()
+    return {
+        'concurrency': app.config['VIDEO_WORKER_CONCURRENCY'],
+        'max_attempts': app.config['VIDEO_JOB_MAX_ATTEMPTS'],
+        'counts': counts,
+        'jobs': [{
+            'id': j.id, 'video_id': j.video_id, 'status': j.status,
+            'attempts': j.attempts, 'max_attempts': j.max_attempts, 'error': j.error,
+            'worker': j.worker,
+            'run_after': j.run_after.isoformat() if j.run_after else None,
+            'started_at': j.started_at.isoformat() if j.started_at else None,
+            'finished_at': j.finished_at.isoformat() if j.finished_at else None,
+        } for j in jobs],
+    }
+
+
+@app.cli.command('video-jobs')
+def video_jobs_command():
+    """Show video job counts and the most recent jobs."""
+    summary = video_job_summary(limit=20)
+    print('counts:', ', '.join(f'{k}={v}' for k, v in sorted(summary['counts'].items())) or 'none')
+    for j in summary['jobs']:
+        print(f"#{j['id']:<5} video={j['video_id']:<5} {j['status']:8} attempts={j['attempts']}/{j['max_attempts']} {(j['error'] or '')[:80]}")
+
+
+@app.route('/admin/video-jobs')
+@login_required
+@read_only
+def admin_video_jobs():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    return jsonify(video_job_summary())
+
+
+@app.route('/admin/video-jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def admin_retry_video_job(job_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    job = VideoJob.query.get_or_404(job_id)
+    job.status = 'queued'
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.error = None
+    db.session.commit()
+    return jsonify({'id': job.id, 'status': job.status})
+
+
+@app.cli.command('cleanup-uploads')
+def cleanup_uploads_command():
+    """Delete chunked uploads that have not progressed for a day."""
+    cutoff = datetime.utcnow() - timedelta(days=1)
+    # fully received uploads are kept; the next status or chunk request finishes them
+    stale = VideoUpload.query.filter(VideoUpload.video_id.is_(None), VideoUpload.received < VideoUpload.size,
+                                     VideoUpload.updated_at < cutoff).all()
+    for upload in stale:
+        path = os.path.join(video_upload_dir(), upload.stored_name)
+        # part files left behind by chunk requests that were killed mid-write
+        for leftover in [path] + glob.glob(glob.escape(path) + '.*.part'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        db.session.delete(upload)
+    db.session.commit()
+    print(f'Removed {len(stale)} stale upload(s).')
+
+
+@app.route('/video/<int:video_id>')
+@login_required
+def view_video(video_id):
+    video = Video.query.get_or_404(video_id)
+    return render_template('video_player.html', video=video)
+
+
+@app.route('/video/<int:video_id>/stream')
+def stream_video(video_id):
+    video = Video.query.get_or_404(video_id)
+    file_path = os.path.join(video_upload_dir(), video.filename)
+    mimetype = video.mimetype
+    rendition = request.args.get('rendition')
+    if rendition:
+        match = [r for r in video.rendition_info.get('renditions', []) if r['name'] == rendition]
+        if not match:
+            abort(404)
+        file_path = os.path.join(video_rendition_dir(video.id), match[0]['file'])
+        mimetype = 'video/mp4'
+    if not os.path.exists(file_path):
+        abort(404)
+    return stream_file(file_path, mimetype)
 
 
 @app.route('/enroll/<int:course_id>')
@@ -834,11 +2452,19 @@ def enroll(course_id):
     progress = CourseProgress(
         student_id=current_user.id,
         course_id=course_id,
-        module_id=first_module.id
+        module_id=first_module.id,
+        created_at=datetime.utcnow()
     )
 
     db.session.add(progress)
-    db.session.commit()
+    record_enrollment_stats(course_id, progress.created_at)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent request enrolled the student first
+        db.session.rollback()
+        flash('You are already enrolled in this course.', 'info')
+        return redirect(url_for('course_detail', course_id=course_id))
 
     flash('You have successfully enrolled in this course!', 'success')
     return redirect(url_for('course_detail', course_id=course_id))
@@ -881,10 +2507,17 @@ def start_payment(course_id):
     progress = CourseProgress(
         student_id=current_user.id,
         course_id=course_id,
-        module_id=first_module.id
+        module_id=first_module.id,
+        created_at=datetime.utcnow()
     )
     db.session.add(progress)
-    db.session.commit()
+    record_enrollment_stats(course_id, progress.created_at)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('You are already enrolled in this course.', 'info')
+        return redirect(url_for('course_detail', course_id=course_id))
 
     flash('Course purchased successfully! You now have access to this course.', 'success')
     return redirect(url_for('course_detail', course_id=course_id))
@@ -918,74 +2551,307 @@ def complete_module(module_id):
     return redirect(request.referrer or url_for('course_detail', course_id=module.course_id))
 
 
-@app.route('/paystack_callback')
-def paystack_callback():
-    reference = request.args.get('reference') or request.args.get('trxref')
-    if not reference:
-        flash('Missing payment reference.', 'error')
-        return redirect(url_for('courses'))
-
+# =====================================================
+#  PAYMENTS LEDGER
+# =====================================================
+def _int_or_none(value):
     try:
-        verify_resp = verify_transaction(reference)
-    except Exception:
-        app.logger.exception('Paystack verify failed')
-        flash('Unable to validate payment. Contact support.', 'error')
-        return redirect(url_for('courses'))
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
 
-    if not verify_resp.get('status'):
-        flash(verify_resp.get('message', 'Payment verification failed'), 'error')
-        return redirect(url_for('courses'))
 
-    data = verify_resp.get('data') or {}
+def _get_or_create_payment(reference):
+    payment = Payment.query.filter_by(reference=reference).first()
+    if payment:
+        return payment
+    try:
+        with db.session.begin_nested():
+            payment = Payment(reference=reference, status='pending')
+            db.session.add(payment)
+    except IntegrityError:
+        # the webhook and the callback arrived together
+        payment = Payment.query.filter_by(reference=reference).first()
+    return payment
+
+
+def record_payment(reference, data, source, event=None, fallback_course_id=None, message=None):
+    """Upsert the ledger row for reference from a Paystack transaction object.
+
+    data is the `data` of a verify response or webhook event. A confirmed
+    payment is never downgraded. The caller commits.
+    """
+    payment = _get_or_create_payment(reference)
+    metadata = data.get('metadata') or {}
+    if not isinstance(metadata, dict):
+        metadata = {}
+    payment.course_id = _int_or_none(metadata.get('course_id')) or payment.course_id or fallback_course_id
+    payment.student_id = _int_or_none(metadata.get('student_id')) or payment.student_id
+    payment.email = (data.get('customer') or {}).get('email') or payment.email
+    payment.amount = data.get('amount', payment.amount)
+    payment.currency = data.get('currency', payment.currency)
+    payment.paid_at = data.get('paid_at') or payment.paid_at
+    payment.source = source
+    payment.event = event or payment.event
+    payment.payload = json.dumps(data)
+    payment.verified_at = datetime.utcnow()
+    if payment.status in ('success', 'unmatched'):
+        return payment
+
     if data.get('status') != 'success':
-        flash('Payment was not successful.', 'error')
-        return redirect(url_for('courses'))
+        payment.status = 'failed'
+        payment.message = message or 'Payment was not successful.'
+    elif not payment.course_id:
+        payment.status = 'unmatched'
+        payment.message = 'Payment verified but could not determine course. Contact support.'
+    else:
+        payment.status = 'success'
+        payment.message = None
+    return payment
+
+
+def apply_pending_payments(references=None, limit=None):
+    """Enroll students for successful payments that have not been applied yet.
+
+    Students, existing enrollments and first modules are looked up with one
+    query each for the whole batch, and the batch commits once. Returns the
+    number of payments processed.
+    """
+    limit = limit or app.config['PAYMENT_APPLY_BATCH']
+    for _ in range(3):
+        query = Payment.query.filter(Payment.status == 'success', Payment.applied_at.is_(None))
+        if references is not None:
+            query = query.filter(Payment.reference.in_(references))
+        payments = query.order_by(Payment.id).limit(limit).all()
+        if not payments:
+            return 0
+
+        by_id = {u.id: u for u in User.query.filter(User.id.in_({p.student_id for p in payments if p.student_id}))}
+        emails = {p.email for p in payments if not p.student_id and p.email}
+        by_email = {u.email: u for u in User.query.filter(User.email.in_(emails))} if emails else {}
+        course_ids = {p.course_id for p in payments}
+        first_modules = dict(db.session.query(Module.course_id, db.func.min(Module.id))
+                             .filter(Module.course_id.in_(course_ids)).group_by(Module.course_id))
+        student_ids = {u.id for u in by_id.values()} | {u.id for u in by_email.values()}
+        enrolled = set(db.session.query(CourseProgress.student_id, CourseProgress.course_id)
+                       .filter(CourseProgress.student_id.in_(student_ids), CourseProgress.course_id.in_(course_ids)))
+
+        now = datetime.utcnow()
+        per_course = {}
+        for payment in payments:
+            student = by_id.get(payment.student_id) if payment.student_id else by_email.get(payment.email)
+            if not student:
+                payment.status = 'unmatched'
+                payment.message = 'Payment verified but student account not found. Please register with the same email.'
+                continue
+            payment.student_id = student.id
+            payment.applied_at = now
+            payment.message = 'Payment successful. You are now enrolled in the course.'
+            if (student.id, payment.course_id) in enrolled:
+                continue
+            enrolled.add((student.id, payment.course_id))
+            db.session.add(CourseProgress(student_id=student.id, course_id=payment.course_id,
+                                          module_id=first_modules.get(payment.course_id), created_at=now))
+            per_course[payment.course_id] = per_course.get(payment.course_id, 0) + 1
+
+        new_enrollments = sum(per_course.values())
+        if new_enrollments:
+            bump_admin_stats(enrollments=new_enrollments)
+            _bump(DailyEnrollmentStat, 'day', now.date(), 'count', new_enrollments)
+            for course_id, count in per_course.items():
+                _bump(CourseEnrollmentStat, 'course_id', course_id, 'count', count)
+        try:
+            db.session.commit()
+            return len(payments)
+        except IntegrityError:
+            # a concurrent enroll slipped in between the lookup and the insert; redo the batch
+            db.session.rollback()
+    raise RuntimeError('Could not apply payments after 3 attempts')
 
-    metadata = data.get('metadata') or {}
-    try:
-        course_id = int(metadata.get('course_id') or request.args.get('course_id'))
-    except Exception:
-        course_id = None
 
-    student_id = metadata.get('student_id')
+def drain_pending_payments():
+    """Apply every unapplied payment in batches (the job of payment_applier)."""
+    with app.app_context():
+        try:
+            while apply_pending_payments() >= app.config['PAYMENT_APPLY_BATCH']:
+                pass
+        finally:
+            db.session.remove()
 
-    if not course_id:
-        flash('Payment verified but could not determine course. Contact support.', 'error')
-        return redirect(url_for('courses'))
 
-    try:
-        student_id = int(student_id) if student_id else None
-    except Exception:
-        student_id = None
+# webhooks only record the payment and poke; one thread per worker enrolls the batch
+payment_applier = PeriodicWorker(drain_pending_payments, interval=app.config['PAYMENT_APPLY_INTERVAL'],
+                                 threshold=app.config['PAYMENT_APPLY_BATCH'], name='payment-applier')
 
-    enrolled_user = None
-    if student_id:
-        enrolled_user = User.query.get(student_id)
+
+def apply_verified_payment(reference, verify_resp, fallback_course_id=None, source='callback'):
+    """Record a Paystack verify response and enroll the student when it succeeded.
+
+    Returns the Payment row; its status and message say what happened.
+    """
+    if verify_resp.get('status'):
+        record_payment(reference, verify_resp.get('data') or {}, source, fallback_course_id=fallback_course_id)
     else:
-        email = data.get('customer', {}).get('email')
-        if email:
-            enrolled_user = User.query.filter_by(email=email).first()
+        record_payment(reference, {}, source, fallback_course_id=fallback_course_id,
+                       message=verify_resp.get('message', 'Payment verification failed'))
+    db.session.commit()
+    apply_pending_payments([reference])
+    return Payment.query.filter_by(reference=reference).first()
 
-    if not enrolled_user:
-        flash('Payment verified but student account not found. Please register with the same email.', 'error')
+
+def _finish_payment_verification(reference, course_id, future):
+    """Done-callback for verify_transaction_async: runs on the Paystack pool thread."""
+    with app.app_context():
+        try:
+            verify_resp = future.result()
+        except Exception:
+            app.logger.exception('Paystack verify failed for %s', reference)
+            verify_resp = {'status': False, 'message': 'Unable to validate payment. Contact support.'}
+        try:
+            apply_verified_payment(reference, verify_resp, course_id)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Applying Paystack payment %s failed', reference)
+        finally:
+            db.session.remove()
+
+
+def _payment_redirect(payment):
+    if payment.status == 'success':
+        return url_for('course_detail', course_id=payment.course_id)
+    return url_for('courses')
+
+
+@app.route('/paystack_callback')
+@limiter.limit(ratelimit.PAYMENT_PER_IP)
+@limiter.limit(ratelimit.PAYMENT_PER_ACCOUNT, key_func=ratelimit.current_account)
+def paystack_callback():
+    reference = request.args.get('reference') or request.args.get('trxref')
+    if not reference:
+        flash('Missing payment reference.', 'error')
         return redirect(url_for('courses'))
 
-    existing = CourseProgress.query.filter_by(student_id=enrolled_user.id, course_id=course_id).first()
-    if existing:
-        flash('Payment successful. You are now enrolled in the course.', 'success')
-        return redirect(url_for('course_detail', course_id=course_id))
+    try:
+        course_id = int(request.args.get('course_id'))
+    except (TypeError, ValueError):
+        course_id = None
 
-    first_module = Module.query.filter_by(course_id=course_id).first()
-    if not first_module:
-        progress = CourseProgress(student_id=enrolled_user.id, course_id=course_id, module_id=None)
-    else:
-        progress = CourseProgress(student_id=enrolled_user.id, course_id=course_id, module_id=first_module.id)
+    payment = Payment.query.filter_by(reference=reference).first()
+    if payment and payment.status == 'success':
+        if not payment.applied_at:
+            # the webhook got here first and its batch has not run yet
+            apply_pending_payments([reference])
+            payment = Payment.query.filter_by(reference=reference).first()
+        flash(payment.message, 'success' if payment.applied_at else 'error')
+        return redirect(_payment_redirect(payment))
+
+    if app.config['PAYSTACK_VERIFY_ASYNC']:
+        if payment and payment.status != 'pending':
+            # already decided; reloading the callback must not reopen it
+            flash(payment.message, 'error')
+            return redirect(_payment_redirect(payment))
+        # answer now; the verify job enrolls the student and the page polls for the outcome.
+        # A new row starts out pending; the student is filled in by apply_verified_payment.
+        payment = _get_or_create_payment(reference)
+        payment.course_id = payment.course_id or course_id
+        db.session.commit()
+        verify_transaction_async(reference).add_done_callback(
+            lambda future: _finish_payment_verification(reference, course_id, future))
+        return render_template('payment_pending.html', reference=reference)
 
-    db.session.add(progress)
+    try:
+        verify_resp = verify_transaction(reference)
+    except Exception:
+        app.logger.exception('Paystack verify failed')
+        flash('Unable to validate payment. Contact support.', 'error')
+        return redirect(url_for('courses'))
+
+    payment = apply_verified_payment(reference, verify_resp, course_id)
+    flash(payment.message, 'success' if payment.status == 'success' else 'error')
+    return redirect(_payment_redirect(payment))
+
+
+@app.route('/payments/<reference>/status')
+def payment_status(reference):
+    """JSON status polled by payment_pending.html.
+
+    Answers 401 for anonymous visitors and 404 for payments of other
+    students, as JSON, so the page can stop polling and offer a manual check.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({'reference': reference, 'status': 'signed_out',
+                        'message': 'Sign in to see your enrollment.', 'login': url_for('login')}), 401
+    payment = Payment.query.filter_by(reference=reference).first()
+    if payment and payment.student_id is None and payment.status == 'pending':
+        # not verified yet, so nobody owns it; say only that it is pending
+        return jsonify({'reference': reference, 'status': 'pending', 'message': None})
+    # only the paying student may see a payment; anyone else gets the same 404 as for an unknown reference
+    if payment is None or payment.student_id != current_user.id:
+        return jsonify({'reference': reference, 'status': 'not_found',
+                        'message': 'We could not find this payment on your account.'}), 404
+    status = 'pending' if payment.status == 'success' and not payment.applied_at else payment.status
+    body = {'reference': payment.reference, 'status': status, 'message': payment.message}
+    if status != 'pending':
+        body['redirect'] = _payment_redirect(payment)
+    return jsonify(body)
+
+
+@app.route('/paystack/webhook', methods=['POST'])
+@csrf.exempt
+def paystack_webhook():
+    """Signed Paystack events. Only records the event; enrollment happens in payment_applier's batch."""
+    body = request.get_data()
+    if not verify_webhook_signature(body, request.headers.get('X-Paystack-Signature', '')):
+        return jsonify({'error': 'invalid signature'}), 401
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return jsonify({'error': 'invalid JSON'}), 400
+
+    data = event.get('data') or {}
+    reference = data.get('reference')
+    if event.get('event') == 'charge.success' and reference:
+        record_payment(reference, data, 'webhook', event=event['event'])
+        db.session.commit()
+        payment_applier.poke()
+    return jsonify({'status': 'ok'})
+
+
+@app.cli.command('reconcile-payments')
+@click.option('--days', default=2, show_default=True, help='Re-verify pending and failed payments this recent.')
+@click.option('--limit', default=500, show_default=True)
+def reconcile_payments_command(days, limit):
+    """Re-verify pending/failed payments with Paystack in bulk, then enroll every confirmed one."""
+    since = datetime.utcnow() - timedelta(days=days)
+    payments = Payment.query.filter(Payment.status.in_(['pending', 'failed']), Payment.created_at >= since)\
+        .order_by(Payment.id).limit(limit).all()
+    # verify in parallel on the client's pool; the ledger is updated in one transaction
+    futures = {p.reference: (p.course_id, verify_transaction_async(p.reference)) for p in payments}
+    errors = 0
+    for reference, (course_id, future) in futures.items():
+        try:
+            verify_resp = future.result()
+        except Exception as exc:
+            errors += 1
+            print(f'{reference}: verify failed: {exc}')
+            continue
+        if verify_resp.get('status'):
+            record_payment(reference, verify_resp.get('data') or {}, 'reconcile', fallback_course_id=course_id)
+        else:
+            record_payment(reference, {}, 'reconcile', fallback_course_id=course_id,
+                           message=verify_resp.get('message', 'Payment verification failed'))
     db.session.commit()
 
-    flash('Payment successful. You are now enrolled in the course.', 'success')
-    return redirect(url_for('course_detail', course_id=course_id))
+    applied = 0
+    while True:
+        batch = apply_pending_payments()
+        applied += batch
+        if batch < app.config['PAYMENT_APPLY_BATCH']:
+            break
+    counts = dict(db.session.query(Payment.status, db.func.count(Payment.id))
+                  .filter(Payment.reference.in_(list(futures))).group_by(Payment.status)) if futures else {}
+    print(f'Re-verified {len(futures) - errors}/{len(futures)} payment(s); applied {applied}. '
+          + ', '.join(f'{k}: {v}' for k, v in sorted(counts.items())))
 
 
 # =====================================================
@@ -1020,6 +2886,9 @@ def create_course():
         )
 
         db.session.add(course)
+        db.session.flush()
+        index_course_for_search(course)
+        bump_admin_stats(courses=1, revenue=price)
         db.session.commit()
 
         flash('Course created successfully!', 'success')
@@ -1038,6 +2907,7 @@ def edit_course(course_id):
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
+        old_price = course.price or 0.0
         course.title = request.form.get('title')
         course.description = request.form.get('description')
         course.image = request.form.get('image')
@@ -1046,7 +2916,10 @@ def edit_course(course_id):
         except ValueError:
             course.price = 0.0
 
+        index_course_for_search(course)
+        bump_admin_stats(revenue=course.price - old_price)
         db.session.commit()
+        invalidate_catalogue()
         flash('Course updated successfully!', 'success')
         return redirect(url_for('dashboard'))
 
@@ -1070,6 +2943,8 @@ def create_module(course_id):
 
         module = Module(course_id=course_id, title=title, content=content)
         db.session.add(module)
+        db.session.flush()
+        index_module_for_search(module, course)
         db.session.commit()
         flash('Module added successfully!', 'success')
         return redirect(url_for('course_detail', course_id=course_id))
@@ -1088,31 +2963,54 @@ def create_quiz(course_id):
     if request.method == 'POST':
         title = request.form.get('title')
         questions_json = request.form.get('questions_json')
-        if not title or not questions_json:
+        bank = request.files.get('question_bank')
+        if bank is not None and not bank.filename:
+            bank = None
+        if not title or (not questions_json and bank is None):
             flash('Title and questions are required', 'error')
             return redirect(url_for('create_quiz', course_id=course_id))
 
         try:
-            import json
-            questions = json.loads(questions_json)
+            questions = json.loads(questions_json or '[]')
         except Exception:
             flash('Invalid JSON for questions', 'error')
             return redirect(url_for('create_quiz', course_id=course_id))
+        if not isinstance(questions, list) or (not questions and bank is None):
+            flash('Title and questions are required', 'error')
+            return redirect(url_for('create_quiz', course_id=course_id))
 
-        quiz = Quiz(course_id=course_id, title=title)
-        db.session.add(quiz)
-        db.session.flush()
+        closes_at = None
+        if request.form.get('closes_at'):
+            try:
+                closes_at = datetime.strptime(request.form['closes_at'], '%Y-%m-%dT%H:%M')
+            except ValueError:
+                flash('Invalid close time', 'error')
+                return redirect(url_for('create_quiz', course_id=course_id))
 
-        for idx, q in enumerate(questions, start=1):
-            question = Question(quiz_id=quiz.id, text=q.get('text', ''), explanation=q.get('explanation'), order=idx)
-            db.session.add(question)
+        report = None
+        try:
+            # validate everything before the first write, so the write lock is only held for the inserts
+            checked = check_questions(questions)
+            if bank is not None:
+                bank = question_bank.validate_question_bank(bank.stream, question_bank.detect_format(bank.filename))
+            quiz = Quiz(course_id=course_id, title=title, exam_mode=bool(request.form.get('exam_mode')),
+                        closes_at=closes_at)
+            db.session.add(quiz)
             db.session.flush()
-            for choice in q.get('choices', []):
-                c = Choice(question_id=question.id, text=choice.get('text', ''), is_correct=bool(choice.get('is_correct', False)))
-                db.session.add(c)
+            count, _ = question_bank.insert_questions(db.session.connection(), Question.__table__, Choice.__table__,
+                                                      quiz.id, checked)
+            if bank is not None:
+                report = import_questions(quiz.id, bank, start_order=count + 1)
+        except question_bank.QuestionBankError as exc:
+            db.session.rollback()
+            flash('Quiz not created: ' + '; '.join(exc.errors[:5]), 'error')
+            return redirect(url_for('create_quiz', course_id=course_id))
 
         db.session.commit()
+        invalidate_quiz_cache()
         flash('Quiz created successfully', 'success')
+        if report is not None:
+            flash(f'Imported {describe_import(report)}', 'info')
         return redirect(url_for('course_detail', course_id=course_id))
 
     return render_template('create_quiz.html', course=course)
@@ -1120,17 +3018,42 @@ def create_quiz(course_id):
 
 @app.route('/quiz/<int:quiz_id>')
 @login_required
+@read_only
 def view_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order).all()
-    qdata = []
-    for q in questions:
-        choices = Choice.query.filter_by(question_id=q.id).all()
-        qdata.append({'id': q.id, 'text': q.text, 'choices': choices})
-    return render_template('quiz.html', quiz=quiz, questions=qdata)
+    compiled = get_compiled_quiz(quiz_id)
+    if compiled is None:
+        abort(404)
+    # the page embeds the user's CSRF token, so its ETag is per session and
+    # rolls over well inside the token's lifetime
+    etag = hashlib.sha256(f"{compiled['etag']}|{current_user.id}|{session.get('csrf_token')}|"
+                          f"{session.get('language', 'en')}|{int(time.time() // 1800)}".encode()).hexdigest()[:32]
+    if '_flashes' not in session and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        quiz = compiled['quiz']
+        response = make_response(render_template('quiz.html', quiz=quiz, questions=quiz['questions']))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/api/quiz/<int:quiz_id>')
+@login_required
+@read_only
+def quiz_api(quiz_id):
+    """The compiled quiz as JSON; revalidate with If-None-Match for a 304."""
+    compiled = get_compiled_quiz(quiz_id)
+    if compiled is None:
+        return jsonify({'error': 'Quiz not found'}), 404
+    response = Response(compiled['json'], mimetype='application/json')
+    response.set_etag(compiled['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 
 @app.route('/quiz/<int:quiz_id>/answer/<int:question_id>', methods=['POST'])
+@limiter.limit(ratelimit.ANSWER_PER_IP)
+@limiter.limit(ratelimit.ANSWER_PER_ACCOUNT, key_func=ratelimit.current_account)
 @login_required
 def submit_answer(quiz_id, question_id):
     if current_user.role != 'student':
@@ -1141,30 +3064,161 @@ def submit_answer(quiz_id, question_id):
     if not choice_id:
         return jsonify({'error': 'choice_id required'}), 400
 
-    question = Question.query.filter_by(id=question_id, quiz_id=quiz_id).first_or_404()
-    choice = Choice.query.filter_by(id=choice_id, question_id=question_id).first()
-    if not choice:
+    question = get_answer_key(quiz_id).get(question_id)
+    if question is None:
+        abort(404)
+    try:
+        choice_id = int(choice_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid choice'}), 400
+    if choice_id not in question['choices']:
         return jsonify({'error': 'Invalid choice'}), 400
 
-    correct = bool(choice.is_correct)
+    correct = question['choices'][choice_id]
+    meta = get_quiz_meta(quiz_id)
+    if meta['exam_mode']:
+        if not exam_is_open(meta):
+            return jsonify({'error': 'This exam is closed.'}), 403
+        log_exam_answers(quiz_id, current_user.id, [(question_id, choice_id, correct)])
+        return jsonify({'accepted': True, 'queued': True})
 
     # store student answer (idempotent: if exists, update)
-    existing = StudentAnswer.query.filter_by(student_id=current_user.id, question_id=question_id).first()
-    if existing:
-        existing.choice_id = choice.id
-        existing.correct = correct
-        existing.answered_at = datetime.utcnow()
-    else:
-        sa = StudentAnswer(student_id=current_user.id, question_id=question_id, choice_id=choice.id, correct=correct)
-        db.session.add(sa)
+    upsert_student_answers(current_user.id, [(question_id, choice_id, correct)])
+    db.session.commit()
+
+    return jsonify({'correct': correct, 'explanation': question['explanation']})
+
+
+@app.route('/quiz/<int:quiz_id>/submit', methods=['POST'])
+@limiter.limit(ratelimit.ANSWER_PER_IP)
+@limiter.limit(ratelimit.ANSWER_PER_ACCOUNT, key_func=ratelimit.current_account)
+@login_required
+def submit_quiz(quiz_id):
+    """Grade a whole attempt at once: {"answers": {"<question_id>": <choice_id>, ...}}.
+
+    Every answer is checked against the cached answer key and all of them are
+    upserted in one transaction.
+    """
+    if current_user.role != 'student':
+        return jsonify({'error': 'Only students can answer quizzes.'}), 403
+
+    data = request.get_json(silent=True) or {}
+    answers = data.get('answers')
+    if isinstance(answers, list):
+        answers = {a.get('question_id'): a.get('choice_id') for a in answers if isinstance(a, dict)}
+    if not isinstance(answers, dict) or not answers:
+        return jsonify({'error': 'answers required'}), 400
+
+    answer_key = get_answer_key(quiz_id)
+    if not answer_key:
+        abort(404)
 
+    graded, results, errors = [], {}, {}
+    for question_id, choice_id in answers.items():
+        try:
+            question_id, choice_id = int(question_id), int(choice_id)
+        except (TypeError, ValueError):
+            errors[str(question_id)] = 'Invalid question or choice'
+            continue
+        question = answer_key.get(question_id)
+        if question is None:
+            errors[str(question_id)] = 'Question is not part of this quiz'
+        elif choice_id not in question['choices']:
+            errors[str(question_id)] = 'Invalid choice'
+        else:
+            correct = question['choices'][choice_id]
+            graded.append((question_id, choice_id, correct))
+            results[str(question_id)] = {'correct': correct, 'explanation': question['explanation']}
+    if errors:
+        return jsonify({'error': 'Invalid answers', 'details': errors}), 400
+
+    meta = get_quiz_meta(quiz_id)
+    if meta['exam_mode']:
+        # exams are graded after the drain; only acknowledge here
+        if not exam_is_open(meta):
+            return jsonify({'error': 'This exam is closed.'}), 403
+        log_exam_answers(quiz_id, current_user.id, graded)
+        return jsonify({'accepted': True, 'queued': True, 'answered': len(graded)})
+
+    upsert_student_answers(current_user.id, graded)
     db.session.commit()
 
-    return jsonify({'correct': correct, 'explanation': question.explanation or ''})
+    score = sum(1 for _, _, correct in graded if correct)
+    total = len(answer_key)
+    return jsonify({'answered': len(graded), 'correct': score, 'total': total,
+                    'percent': int(round(score / total * 100)) if total else 0, 'results': results})
+
+
+def compute_quiz_results(quiz):
+    """Per-student summaries, the per-question answer matrix, per-question
+    accuracy and the leaderboard for a quiz, in four statements however many
+    students and questions there are."""
+    questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order).all()
+    q_ids = [q.id for q in questions]
+    total_q = len(q_ids)
+    results = {
+        'questions': questions,
+        'total_q': total_q,
+        'results': [],
+        'question_stats': {},
+        'average_score': 0,
+        'leaderboard': [],
+    }
+    if not total_q:
+        return results
+
+    # text of the (first) correct choice per question
+    correct_answers = {}
+    for question_id, choice_text in db.session.query(Choice.question_id, Choice.text)\
+            .filter(Choice.question_id.in_(q_ids), Choice.is_correct == True)\
+            .order_by(Choice.id):
+        correct_answers.setdefault(question_id, choice_text)
+
+    # per-student totals, computed by the database
+    summaries = db.session.query(
+        User,
+        db.func.count(StudentAnswer.id).label('answers'),
+        db.func.sum(db.case((StudentAnswer.correct == True, 1), else_=0)).label('correct')
+    ).join(StudentAnswer, StudentAnswer.student_id == User.id)\
+        .filter(StudentAnswer.question_id.in_(q_ids))\
+        .group_by(User.id).all()
+
+    # every answer with its choice text in one pass
+    per_student = {}
+    question_stats = {q_id: {'answered': 0, 'correct': 0} for q_id in q_ids}
+    answers = db.session.query(StudentAnswer.student_id, StudentAnswer.question_id, StudentAnswer.choice_id,
+                               StudentAnswer.correct, StudentAnswer.answered_at, Choice.text)\
+        .outerjoin(Choice, Choice.id == StudentAnswer.choice_id)\
+        .filter(StudentAnswer.question_id.in_(q_ids))
+    for student_id, question_id, choice_id, correct, answered_at, choice_text in answers:
+        per_student.setdefault(student_id, {})[question_id] = {
+            'choice_id': choice_id,
+            'choice_text': choice_text,
+            'correct': correct,
+            'answered_at': answered_at,
+            'correct_choice_text': correct_answers.get(question_id)
+        }
+        question_stats[question_id]['answered'] += 1
+        question_stats[question_id]['correct'] += 1 if correct else 0
+
+    for user, answers_count, correct_count in summaries:
+        correct_count = correct_count or 0
+        percent = int(round(correct_count / total_q * 100))
+        results['results'].append({'student': user, 'answers': answers_count, 'correct': correct_count,
+                                   'percent': percent, 'per_question': per_student.get(user.id, {})})
+
+    for stats in question_stats.values():
+        stats['percent'] = _percent(stats['correct'], stats['answered'])
+    results['question_stats'] = question_stats
+    if results['results']:
+        results['average_score'] = int(round(sum(r['percent'] for r in results['results']) / len(results['results'])))
+        results['leaderboard'] = sorted(results['results'], key=lambda r: r['percent'], reverse=True)[:5]
+    return results
 
 
 @app.route('/quiz/<int:quiz_id>/results')
 @login_required
+@read_only
 def quiz_results(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     course = Course.query.get(quiz.course_id)
@@ -1173,76 +3227,25 @@ def quiz_results(quiz_id):
         flash('You do not have permission to view quiz results.', 'error')
         return redirect(url_for('dashboard'))
 
-    questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order).all()
-    q_ids = [q.id for q in questions]
-    total_q = len(q_ids)
-
-    # Aggregate student answers
-    results = []
-    average_score = 0
-    leaderboard = []
-    if total_q > 0:
-        # map correct answers text per question
-        correct_answers = {}
-        for q in questions:
-            correct_choice = Choice.query.filter_by(question_id=q.id, is_correct=True).first()
-            correct_answers[q.id] = correct_choice.text if correct_choice else None
-        # Get distinct students who answered
-        rows = db.session.query(User, 
-                       db.func.count(StudentAnswer.id).label('answers'), 
-                       db.func.sum(db.case((StudentAnswer.correct == True, 1), else_=0)).label('correct'))
-        rows = rows.join(StudentAnswer, StudentAnswer.student_id == User.id)
-        rows = rows.filter(StudentAnswer.question_id.in_(q_ids))
-        rows = rows.group_by(User.id).all()
-
-        total_percent_sum = 0
-        for user, answers_count, correct_count in rows:
-            correct_count = correct_count or 0
-            percent = int(round((correct_count) / total_q * 100))
-            total_percent_sum += percent
-            # fetch per-question answers for this user and include choice text
-            per_q = StudentAnswer.query.filter(StudentAnswer.student_id == user.id, StudentAnswer.question_id.in_(q_ids)).all()
-            per_map = {}
-            for a in per_q:
-                choice = Choice.query.get(a.choice_id) if a.choice_id else None
-                per_map[a.question_id] = {
-                    'choice_id': a.choice_id,
-                    'choice_text': choice.text if choice else None,
-                    'correct': a.correct,
-                    'correct_choice_text': correct_answers.get(a.question_id)
-                }
-
-            results.append({'student': user, 'answers': answers_count, 'correct': correct_count, 'percent': percent, 'per_question': per_map})
-
-        # compute average and leaderboard
-        if rows:
-            average_score = int(round(total_percent_sum / len(rows)))
-            # sort results for leaderboard
-            leaderboard = sorted(results, key=lambda r: r['percent'], reverse=True)[:5]
-
-    return render_template('quiz_results.html', quiz=quiz, questions=questions, results=results, total_q=total_q)
+    if quiz.exam_mode:
+        drain_exam_logs([quiz.id])
+    return render_template('quiz_results.html', quiz=quiz, **compute_quiz_results(quiz))
 
 
 @app.route('/quiz/<int:quiz_id>/export.csv')
 @login_required
+@read_only
 def export_quiz_csv(quiz_id):
     quiz = Quiz.query.get_or_404(quiz_id)
     course = Course.query.get(quiz.course_id)
     if not current_user.is_authenticated or (current_user.role != 'admin' and current_user.id != course.instructor_id):
         flash('You do not have permission to export quiz results.', 'error')
         return redirect(url_for('dashboard'))
+    if quiz.exam_mode:
+        drain_exam_logs([quiz.id])
 
     questions = Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order).all()
     q_ids = [q.id for q in questions]
-
-    # Header
-    import csv
-    from io import StringIO
-
-    si = StringIO()
-    writer = csv.writer(si)
-
-    # Export timestamp metadata row
     export_time = datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%SZ')
 
     header = ['Student Name', 'Student Email', 'Answered Count', 'Correct Count', 'Percent']
@@ -1252,42 +3255,35 @@ def export_quiz_csv(quiz_id):
         header.append(f'Q{i} Answer - {qlabel}')
         header.append(f'Q{i} Answered At - {qlabel}')
         header.append(f'Q{i} Correct - {qlabel}')
-    writer.writerow(header)
-
-    # build rows
-    rows = db.session.query(User).join(StudentAnswer, StudentAnswer.student_id == User.id).filter(StudentAnswer.question_id.in_(q_ids)).group_by(User.id).all()
-    for user in rows:
-        per_q = StudentAnswer.query.filter(StudentAnswer.student_id == user.id, StudentAnswer.question_id.in_(q_ids)).all()
-        per_map = {a.question_id: a for a in per_q}
-        answers_count = len(per_q)
-        correct_count = sum(1 for a in per_q if a.correct)
-        percent = int(round((correct_count) / len(q_ids) * 100)) if q_ids else 0
-        row = [user.full_name, user.email, answers_count, correct_count, percent]
-        for q in questions:
-            a = per_map.get(q.id)
-            if a:
-                choice = Choice.query.get(a.choice_id) if a.choice_id else None
-                answered_at = a.answered_at.strftime('%Y-%m-%dT%H:%M:%SZ') if a.answered_at else ''
-                row.append(choice.text if choice else '')
-                row.append(answered_at)
-                row.append('Yes' if a.correct else 'No')
-            else:
-                row.append('')
-                row.append('')
-                row.append('')
-        writer.writerow(row)
-
-    # Prepend export metadata row then CSV header
-    meta_si = StringIO()
-    meta_writer = csv.writer(meta_si)
-    meta_writer.writerow(['Exported At', export_time])
-    meta_writer.writerow([])
-    meta_writer.writerow(header)
-    output = meta_si.getvalue() + si.getvalue()
-    response = make_response(output)
-    response.headers['Content-Disposition'] = f'attachment; filename=quiz_{quiz_id}_results_{export_time}.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    return response
+
+    def rows():
+        # one pass over the answers ordered by student; choice text comes from the join
+        answers = db.session.query(StudentAnswer.student_id, User.full_name, User.email,
+                                   StudentAnswer.question_id, Choice.text,
+                                   StudentAnswer.answered_at, StudentAnswer.correct)\
+            .join(User, User.id == StudentAnswer.student_id)\
+            .outerjoin(Choice, Choice.id == StudentAnswer.choice_id)\
+            .filter(StudentAnswer.question_id.in_(q_ids))\
+            .order_by(StudentAnswer.student_id)\
+            .yield_per(EXPORT_BATCH_SIZE)
+        for _, group in groupby(answers, key=lambda a: a.student_id):
+            group = list(group)
+            per_map = {a.question_id: a for a in group}
+            correct_count = sum(1 for a in group if a.correct)
+            percent = int(round(correct_count / len(q_ids) * 100)) if q_ids else 0
+            row = [group[0].full_name, group[0].email, len(group), correct_count, percent]
+            for q in questions:
+                a = per_map.get(q.id)
+                if a:
+                    row.append(a.text or '')
+                    row.append(a.answered_at.strftime('%Y-%m-%dT%H:%M:%SZ') if a.answered_at else '')
+                    row.append('Yes' if a.correct else 'No')
+                else:
+                    row.extend(['', '', ''])
+            yield row
+
+    return csv_response(f'quiz_{quiz_id}_results_{export_time}.csv', rows(), header,
+                        preamble=[['Exported At', export_time], []])
 
 
 @app.route('/delete_course/<int:course_id>')
@@ -1299,6 +3295,20 @@ def delete_course(course_id):
         flash('You do not have permission to delete this course.', 'error')
         return redirect(url_for('dashboard'))
 
+    enrollment_days = db.session.query(db.func.date(CourseProgress.created_at), db.func.count(CourseProgress.id))\
+        .filter(CourseProgress.course_id == course_id)\
+        .group_by(db.func.date(CourseProgress.created_at)).all()
+    for day, count in enrollment_days:
+        if day:
+            _bump(DailyEnrollmentStat, 'day', datetime.strptime(str(day), '%Y-%m-%d').date(), 'count', -count)
+    bump_admin_stats(courses=-1, revenue=-(course.price or 0.0),
+                     enrollments=-sum(count for _, count in enrollment_days))
+    CourseEnrollmentStat.query.filter_by(course_id=course_id).delete()
+    # the live aggregates skip deleted courses, so their rollups go too
+    DailyCourseStat.query.filter_by(course_id=course_id).delete()
+    CourseRollup.query.filter_by(course_id=course_id).delete()
+
+    remove_course_from_search(course_id)
     Module.query.filter_by(course_id=course_id).delete()
     Announcement.query.filter_by(course_id=course_id).delete()
     CourseProgress.query.filter_by(course_id=course_id).delete()
@@ -1306,6 +3316,7 @@ def delete_course(course_id):
 
     db.session.delete(course)
     db.session.commit()
+    invalidate_catalogue()
 
     flash('Course deleted successfully!', 'success')
     return redirect(url_for('dashboard'))
@@ -1319,6 +3330,57 @@ def not_found(e):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(429)
+def too_many_requests(e):
+    current = limiter.current_limit
+    retry_after = max(1, int(current.reset_at - time.time())) if current else 60
+    message = f'Too many requests. Please try again in {retry_after} seconds.'
+    if request.endpoint in ('login', 'register'):
+        response = make_response(render_template(f'{request.endpoint}.html', rate_limit_message=message), 429)
+    elif request.endpoint == 'paystack_callback':
+        response = make_response(f'{message} Your payment is still being confirmed in the background.', 429)
+    else:
+        response = make_response(jsonify({'error': message, 'retry_after': retry_after}), 429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@app.errorhandler(passwords.PasswordServiceBusy)
+def password_service_busy(e):
+    retry_after = e.retry_after
+    message = f'The server is busy signing other people in. Please try again in {retry_after} seconds.'
+    if request.endpoint in ('login', 'register'):
+        response = make_response(render_template(f'{request.endpoint}.html', rate_limit_message=message), 503)
+    else:
+        response = make_response(jsonify({'error': message, 'retry_after': retry_after}), 503)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@app.cli.command('ratelimit-reset')
+def ratelimit_reset_command():
+    """Clear every rate-limit counter, e.g. to unlock an account after a credential-stuffing attack."""
+    limiter.reset()
+    print(f"cleared {app.config['RATELIMIT_STORAGE_URI']}")
+
+
+@app.cli.command('password-hashes')
+def password_hashes_command():
+    """Count accounts per hash method and cost, and time one hash with PASSWORD_HASH_METHOD."""
+    counts = {}
+    for (pwhash,) in db.session.query(User.password_hash):
+        method = pwhash.split('$', 1)[0] if pwhash.count('$') >= 2 else '(no password)'
+        counts[method] = counts.get(method, 0) + 1
+    for method, count in sorted(counts.items(), key=lambda item: -item[1]):
+        note = 'current' if method == password_service.method else ('' if method == '(no password)'
+                                                                     else 'rehashed on next login')
+        print(f'{count:8}  {method:32} {note}')
+    start = time.perf_counter()
+    password_service.hash(secrets.token_hex(8))
+    print(f'one {password_service.method} hash takes {(time.perf_counter() - start) * 1000:.0f} ms '
+          f'on this machine, {password_service.workers} hashing threads per worker')
+
+
 @app.errorhandler(500)
 def internal_error(e):
     db.session.rollback()
@@ -1328,74 +3390,74 @@ def internal_error(e):
 # =====================================================
 #  ADMIN EXPORT ROUTES
 # =====================================================
+def _export_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
 @app.route('/admin/export/users.csv')
 @login_required
+@read_only
 def admin_export_users():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
         return redirect(url_for('dashboard'))
     
-    users = User.query.all()
-    si = io.StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['ID', 'Full Name', 'Email', 'Role', 'Created At', 'Last Activity'])
-    for u in users:
-        last_activity = u.last_activity.strftime('%Y-%m-%d %H:%M:%S') if u.last_activity else ''
-        writer.writerow([u.id, u.full_name, u.email, u.role, u.created_at.strftime('%Y-%m-%d %H:%M:%S'), last_activity])
-    
-    output = si.getvalue()
-    response = make_response(output)
-    response.headers['Content-Disposition'] = f'attachment; filename=users_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    return response
+    users = db.session.query(User.id, User.full_name, User.email, User.role, User.created_at, User.last_activity)\
+        .order_by(User.id).yield_per(EXPORT_BATCH_SIZE)
+    rows = ([u.id, u.full_name, u.email, u.role, _export_time(u.created_at), _export_time(u.last_activity)]
+            for u in users)
+    return csv_response(f'users_{export_timestamp()}.csv', rows,
+                        ['ID', 'Full Name', 'Email', 'Role', 'Created At', 'Last Activity'])
 
 
 @app.route('/admin/export/courses.csv')
 @login_required
+@read_only
 def admin_export_courses():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
         return redirect(url_for('dashboard'))
-    
-    courses = Course.query.all()
-    si = io.StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['ID', 'Title', 'Instructor', 'Price', 'Created At', 'Module Count', 'Enrollment Count', 'Approved', 'Rejected'])
-    for c in courses:
-        module_count = Module.query.filter_by(course_id=c.id).count()
-        enrollment_count = CourseProgress.query.filter_by(course_id=c.id).count()
-        writer.writerow([c.id, c.title, c.instructor.full_name if c.instructor else 'N/A', f'{c.price or 0:.2f}', 
-                        c.created_at.strftime('%Y-%m-%d %H:%M:%S'), module_count, enrollment_count, 
-                        'Yes' if c.is_approved else 'No', 'Yes' if c.is_rejected else 'No'])
-    
-    output = si.getvalue()
-    response = make_response(output)
-    response.headers['Content-Disposition'] = f'attachment; filename=courses_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    return response
+
+    courses = db.session.query(Course.id, Course.title, User.full_name, Course.price, Course.created_at,
+                               Course.is_approved, Course.is_rejected)\
+        .outerjoin(User, User.id == Course.instructor_id)\
+        .order_by(Course.id).yield_per(EXPORT_BATCH_SIZE)
+
+    def rows():
+        for batch in batched(courses):
+            ids = [c.id for c in batch]
+            module_counts = dict(db.session.query(Module.course_id, db.func.count(Module.id))
+                                 .filter(Module.course_id.in_(ids)).group_by(Module.course_id))
+            enrollment_counts = dict(db.session.query(CourseProgress.course_id, db.func.count(CourseProgress.id))
+                                     .filter(CourseProgress.course_id.in_(ids)).group_by(CourseProgress.course_id))
+            for c in batch:
+                yield [c.id, c.title, c.full_name or 'N/A', f'{c.price or 0:.2f}', _export_time(c.created_at),
+                       module_counts.get(c.id, 0), enrollment_counts.get(c.id, 0),
+                       'Yes' if c.is_approved else 'No', 'Yes' if c.is_rejected else 'No']
+
+    return csv_response(f'courses_{export_timestamp()}.csv', rows(),
+                        ['ID', 'Title', 'Instructor', 'Price', 'Created At', 'Module Count',
+                         'Enrollment Count', 'Approved', 'Rejected'])
 
 
 @app.route('/admin/export/enrollments.csv')
 @login_required
+@read_only
 def admin_export_enrollments():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
         return redirect(url_for('dashboard'))
-    
-    enrollments = db.session.query(CourseProgress, User, Course).join(User, CourseProgress.student_id == User.id).join(Course, CourseProgress.course_id == Course.id).all()
-    si = io.StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Student', 'Student Email', 'Course', 'Enrolled At', 'Status', 'Last Activity'])
-    for progress, user, course in enrollments:
-        status = 'Completed' if progress.completed else 'In Progress'
-        last_activity = user.last_activity.strftime('%Y-%m-%d %H:%M:%S') if user.last_activity else ''
-        writer.writerow([user.full_name, user.email, course.title, progress.created_at.strftime('%Y-%m-%d %H:%M:%S'), status, last_activity])
-    
-    output = si.getvalue()
-    response = make_response(output)
-    response.headers['Content-Disposition'] = f'attachment; filename=enrollments_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.csv'
-    response.headers['Content-Type'] = 'text/csv'
-    return response
+
+    enrollments = db.session.query(User.full_name, User.email, Course.title, CourseProgress.created_at,
+                                   CourseProgress.completed, User.last_activity)\
+        .join(User, CourseProgress.student_id == User.id)\
+        .join(Course, CourseProgress.course_id == Course.id)\
+        .order_by(CourseProgress.id).yield_per(EXPORT_BATCH_SIZE)
+    rows = ([e.full_name, e.email, e.title, _export_time(e.created_at),
+             'Completed' if e.completed else 'In Progress', _export_time(e.last_activity)]
+            for e in enrollments)
+    return csv_response(f'enrollments_{export_timestamp()}.csv', rows,
+                        ['Student', 'Student Email', 'Course', 'Enrolled At', 'Status', 'Last Activity'])
 
 
 # =====================================================
@@ -1403,6 +3465,7 @@ def admin_export_enrollments():
 # =====================================================
 @app.route('/admin/users')
 @login_required
+@read_only
 def admin_users():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
@@ -1439,6 +3502,7 @@ def admin_create_user():
         new_user = User(full_name=full_name, email=email, role=role)
         new_user.set_password(password)
         db.session.add(new_user)
+        record_user_stats(role)
         db.session.commit()
         flash(f'User {full_name} created successfully', 'success')
         return redirect(url_for('admin_users'))
@@ -1468,6 +3532,8 @@ def admin_edit_user(user_id):
             flash('Email already exists', 'error')
             return redirect(url_for('admin_edit_user', user_id=user_id))
         
+        if new_role != user.role:
+            bump_admin_stats(**{f'users_{user.role}': -1, f'users_{new_role}': 1})
         user.email = new_email
         user.role = new_role
         
@@ -1495,6 +3561,7 @@ def admin_delete_user(user_id):
         return redirect(url_for('admin_users'))
     
     db.session.delete(user)
+    record_user_stats(user.role, -1)
     db.session.commit()
     flash(f'User {user.full_name} deleted successfully', 'success')
     return redirect(url_for('admin_users'))
@@ -1505,6 +3572,7 @@ def admin_delete_user(user_id):
 # =====================================================
 @app.route('/admin/courses/moderation')
 @login_required
+@read_only
 def admin_moderation():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
@@ -1531,7 +3599,9 @@ def admin_approve_course(course_id):
     course.is_approved = True
     course.is_rejected = False
     course.rejection_reason = None
+    add_course_to_search(course.id)
     db.session.commit()
+    invalidate_catalogue()
     flash(f'Course "{course.title}" approved successfully', 'success')
     return redirect(url_for('admin_moderation'))
 
@@ -1553,7 +3623,9 @@ def admin_reject_course(course_id):
     course.is_rejected = True
     course.is_approved = False
     course.rejection_reason = reason
+    remove_course_from_search(course.id)
     db.session.commit()
+    invalidate_catalogue()
     flash(f'Course "{course.title}" rejected', 'success')
     return redirect(url_for('admin_moderation'))
 
@@ -1563,51 +3635,117 @@ def admin_reject_course(course_id):
 # =====================================================
 @app.route('/admin/analytics')
 @login_required
+@read_only
 def admin_analytics():
     if current_user.role != 'admin':
         flash('Admin access required', 'error')
         return redirect(url_for('dashboard'))
-    
-    # Course completion rates
-    all_courses = Course.query.filter_by(is_approved=True).all()
-    course_completion_data = []
-    for course in all_courses:
-        modules = Module.query.filter_by(course_id=course.id).count()
-        enrollments = CourseProgress.query.filter_by(course_id=course.id).count()
-        completions = CourseProgress.query.filter_by(course_id=course.id, completed=True).count()
-        completion_rate = int((completions / enrollments * 100) if enrollments > 0 else 0)
-        course_completion_data.append({
-            'title': course.title,
-            'enrollments': enrollments,
-            'completions': completions,
-            'rate': completion_rate
-        })
-    
-    # Student engagement (hours online approximation based on activity frequency)
-    engagement_by_week = []
-    for i in range(7, 0, -1):
-        week_ago = datetime.utcnow().replace(day=datetime.utcnow().day - i)
-        week_enrollments = CourseProgress.query.filter(CourseProgress.created_at >= week_ago).count()
-        engagement_by_week.append(week_enrollments)
-    
-    # Top performing students (by quiz scores)
-    from sqlalchemy import func
-    top_students_data = db.session.query(
-        User.full_name,
-        func.count(StudentAnswer.id).label('answers'),
-        func.sum(func.cast(StudentAnswer.correct, db.Integer)).label('correct')
-    ).join(StudentAnswer, User.id == StudentAnswer.student_id).group_by(User.id).order_by(db.desc('correct')).limit(5).all()
-    
-    top_students = []
-    for student in top_students_data:
-        if student[1] > 0:
-            score = int(student[2] / student[1] * 100) if student[1] > 0 else 0
-            top_students.append({'name': student[0], 'score': score, 'attempts': student[1]})
-    
-    return render_template('admin_analytics.html',
-                         course_completion_data=course_completion_data,
-                         engagement_by_week=engagement_by_week,
-                         top_students=top_students)
+
+    return render_template('admin_analytics.html', **read_analytics())
+
+
+# =====================================================
+#  REQUEST METRICS
+# =====================================================
+@app.route('/admin/metrics')
+def admin_metrics():
+    """All workers' request metrics in Prometheus text format; admin session or METRICS_TOKEN."""
+    token = app.config['METRICS_TOKEN']
+    if not (token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+    if not request_metrics.enabled:
+        abort(404)
+    response = Response(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.cli.command('metrics-reset')
+def metrics_reset_command():
+    """Delete collected request metrics; running workers rewrite theirs, so use while the app is stopped."""
+    request_metrics.reset()
+    print(f'cleared {request_metrics.directory}')
+
+
+# =====================================================
+#  REQUEST PROFILING
+# =====================================================
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@login_required
+def admin_profiling():
+    """Arm or disarm request profiling (POST) and list the saved profiles (GET)."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        if str(data.get('enabled', '1')).lower() in ('0', 'false', 'off'):
+            request_profiler.disarm()
+        elif data.get('endpoint') and data['endpoint'] not in app.view_functions:
+            return jsonify({'error': f"unknown endpoint {data['endpoint']!r}"}), 400
+        else:
+            try:
+                request_profiler.arm(endpoint=data.get('endpoint') or None,
+                                     sample_rate=float(data['sample_rate']) if data.get('sample_rate') else None,
+                                     minutes=float(data.get('minutes', 10)),
+                                     min_ms=float(data.get('min_ms', 0)),
+                                     mode=data.get('mode', 'cprofile'))
+            except ValueError as exc:
+                return jsonify({'error': str(exc)}), 400
+    profiles = request_profiler.profiles()
+    for p in profiles:
+        p['url'] = url_for('admin_profile_download', name=p['name'])
+    return jsonify({'settings': request_profiler.settings(), 'profiles': profiles})
+
+
+@app.route('/admin/profiling/<name>')
+@login_required
+def admin_profile_download(name):
+    """A saved profile as a download, or as a text summary with ?format=text."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    path = request_profiler.path(name)
+    if path is None:
+        abort(404)
+    if request.args.get('format') == 'text':
+        return Response(profiler.summary(path, limit=request.args.get('limit', 40, type=int)),
+                        content_type='text/plain; charset=utf-8')
+    return send_file(path, as_attachment=True, download_name=name, mimetype='application/octet-stream')
+
+
+@app.cli.command('profiling')
+@click.option('--endpoint', default=None, help='Only profile this endpoint.')
+@click.option('--sample-rate', type=float, default=None, help='Fraction of matching requests to profile.')
+@click.option('--minutes', type=float, default=10, show_default=True)
+@click.option('--min-ms', type=float, default=0, show_default=True, help='Discard profiles of faster requests.')
+@click.option('--mode', type=click.Choice(list(profiler.MODES)), default='cprofile', show_default=True)
+@click.option('--off', is_flag=True, help='Stop profiling.')
+@click.option('--clear', is_flag=True, help='Delete the saved profiles.')
+@click.option('--status', is_flag=True, help='Only show the settings and saved profiles.')
+def profiling_command(endpoint, sample_rate, minutes, min_ms, mode, off, clear, status):
+    """Arm request profiling for every worker, or stop it."""
+    if clear:
+        request_profiler.clear()
+    if off:
+        request_profiler.disarm()
+    elif not status and not clear:
+        if endpoint and endpoint not in app.view_functions:
+            raise click.BadParameter(f'unknown endpoint {endpoint!r}', param_hint='--endpoint')
+        try:
+            request_profiler.arm(endpoint, sample_rate, minutes, min_ms, mode)
+        except ValueError as exc:
+            raise click.UsageError(str(exc))
+    settings = request_profiler.settings()
+    if settings:
+        print(f"profiling {settings['endpoint'] or 'all endpoints'} at {settings['sample_rate']:g} "
+              f"({settings['mode']}, min {settings['min_ms']:g} ms) until "
+              f"{datetime.fromtimestamp(settings['until']):%Y-%m-%d %H:%M:%S}")
+    else:
+        print('profiling is off')
+    for p in request_profiler.profiles():
+        print(f"{p['name']}  {p['size'] / 1024:8.1f} KB")
 
 
 # =====================================================
@@ -1620,8 +3758,7 @@ if __name__ == "__main__":
         os.makedirs(dir_path, exist_ok=True)
     
     # Initialize database
-    with app.app_context():
-        db.create_all()
+    upgrade_database()
     
     # Determine if we should use reloader
     is_development = os.environ.get('FLASK_ENV') == 'development'
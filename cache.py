@@ -0,0 +1,66 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class PageCache:
+    """Bounded in-process LRU cache shared by all requests of one worker.
+
+    Invalidation has to reach every gunicorn worker, so instead of clearing
+    the dict we replace a small generation file; each worker stats it on
+    lookup and drops its entries when the file changed.
+    """
+
+    def __init__(self, generation_path, max_entries=256):
+        self.generation_path = generation_path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _current_generation(self):
+        try:
+            st = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _sync(self):
+        generation = self._current_generation()
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+    def get(self, key):
+        with self._lock:
+            self._sync()
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._sync()
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop cached entries in this and every other worker."""
+        os.makedirs(os.path.dirname(self.generation_path), exist_ok=True)
+        tmp = f'{self.generation_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        # os.replace gives the file a new inode, so the generation always changes
+        os.replace(tmp, self.generation_path)
+        with self._lock:
+            self._entries.clear()
+            self._generation = self._current_generation()
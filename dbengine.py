@@ -0,0 +1,187 @@
+"""Database engine configuration from the environment.
+
+DATABASE_URL selects the backend (default: SQLite in the instance folder).
+Two profiles:
+
+- SQLite: WAL journal, synchronous=NORMAL, a busy timeout and mmap I/O, set
+  on every new connection, so readers never block the writer and a worker
+  waiting for the write lock retries instead of failing with
+  "database is locked".
+- Server databases (PostgreSQL, MySQL): a bounded connection pool per
+  worker with pre-ping and recycling, so idle connections dropped by the
+  server or a proxy are replaced transparently. Install the driver
+  (e.g. psycopg2-binary) separately.
+
+Read/write routing: views decorated with @read_only run their SELECTs on
+the 'read' bind, either a replica (DATABASE_READ_URL) or, for SQLite, a
+second pool on the same file whose connections have PRAGMA query_only set.
+Flushes and INSERT/UPDATE/DELETE always go to the primary, and once a
+request has written, its later reads do too. Writes made with bare text()
+statements must call mark_written() for that. With a replica, a user who
+just wrote is pinned to the primary for DB_READ_PIN_SECONDS so they read
+their own writes despite replication lag.
+"""
+import os
+import sqlite3
+import time
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.selectable import SelectBase
+from sqlalchemy.sql.dml import UpdateBase
+
+DEFAULT_DATABASE_URL = 'sqlite:///zit_online.db'
+
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 15000))  # ms
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -32000))  # negative: KiB
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+
+READ_BIND = 'read'
+DB_READ_ROUTING = os.environ.get('DB_READ_ROUTING', '1') == '1'
+DB_READ_PIN_SECONDS = float(os.environ.get('DB_READ_PIN_SECONDS', 5))
+
+
+class QueryOnlyConnection(sqlite3.Connection):
+    """sqlite3 connection factory for the read bind; marks connections query_only."""
+
+
+def _normalize(url):
+    if url.startswith('postgres://'):  # the scheme Heroku/Render hand out; SQLAlchemy wants postgresql://
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def database_url():
+    return _normalize(os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL)
+
+
+def read_replica_url():
+    url = os.environ.get('DATABASE_READ_URL')
+    return _normalize(url) if url else None
+
+
+def read_binds(primary_url):
+    """SQLALCHEMY_BINDS entry for the read bind, or {} when routing is off.
+
+    Without a replica, SQLite primaries still get a separate query_only pool on
+    the same file; server databases then read from the primary.
+    """
+    if not DB_READ_ROUTING:
+        return {}
+    url = read_replica_url()
+    if url is None:
+        if not is_sqlite(primary_url) or ':memory:' in primary_url:
+            return {}
+        url = primary_url
+    return {READ_BIND: dict(engine_options(url, read_only=True), url=url)}
+
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def engine_options(url, read_only=False):
+    """SQLALCHEMY_ENGINE_OPTIONS for the backend in url."""
+    if is_sqlite(url):
+        # pysqlite's own timeout (seconds) covers the implicit BEGIN; the PRAGMA covers the rest
+        connect_args = {'timeout': SQLITE_BUSY_TIMEOUT / 1000, 'check_same_thread': False}
+        if read_only:
+            connect_args['factory'] = QueryOnlyConnection
+        return {'connect_args': connect_args}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def sqlite_pragmas():
+    return [
+        f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}',
+        f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}',
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+        f'PRAGMA cache_size={SQLITE_CACHE_SIZE}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+        if isinstance(dbapi_connection, QueryOnlyConnection):
+            cursor.execute('PRAGMA query_only=1')
+    finally:
+        cursor.close()
+
+
+class RoutingSession(Session):
+    """db.session class that sends the reads of @read_only views to the read bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and READ_BIND in self._db.engines and has_app_context():
+            if self._flushing or clause is None or isinstance(clause, UpdateBase):
+                mark_written()
+            elif g.get('_db_read_only') and not g.get('_db_wrote') and isinstance(clause, SelectBase):
+                return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def mark_written():
+    """Record that this request wrote, so its later reads and the user's next requests use the primary.
+
+    get_bind calls it for flushes and ORM DML; callers that write with bare
+    text() statements, which it cannot tell from reads, call it themselves.
+    """
+    if has_app_context():
+        g._db_wrote = True
+
+
+def read_only(view):
+    """Mark a view as read-only: its queries, including loading current_user, run on the read bind.
+
+    Writes it makes still reach the primary.
+    """
+    view.db_read_only = True
+    return view
+
+
+def route_request():
+    """before_request hook: route @read_only endpoints unless the user is pinned to the primary."""
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'db_read_only', False) and session.get('_db_primary_until', 0) < time.time():
+        g._db_read_only = True
+
+
+def pin_after_write(response):
+    """after_request hook: with a replica, keep a user who just wrote on the primary for a while."""
+    if g.get('_db_wrote') and read_replica_url() is not None:
+        session['_db_primary_until'] = time.time() + DB_READ_PIN_SECONDS
+    return response
+
+
+def describe(engine):
+    """Backend, pool and (SQLite) effective PRAGMA values, for the db-info command."""
+    info = {'backend': engine.dialect.name, 'driver': engine.dialect.driver, 'url': engine.url.render_as_string(),
+            'pool': engine.pool.status()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store'):
+                info[name] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+    return info
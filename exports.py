@@ -0,0 +1,81 @@
+"""Streaming CSV exports.
+
+Rows are pulled from a generator (typically a yield_per query), encoded a
+buffer at a time and sent as they are produced, so memory stays flat and the
+first bytes go out before the query has finished. Output can be gzipped on
+the fly.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+from itertools import islice
+
+from flask import Response, request, stream_with_context
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def batched(iterable, size=EXPORT_BATCH_SIZE):
+    """Yield lists of up to size items, for looking up related rows per batch."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_csv(rows, header=None, preamble=()):
+    """Encode rows as CSV, yielding UTF-8 bytes roughly every 64KB."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in preamble:
+        writer.writerow(row)
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= EXPORT_FLUSH_BYTES:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def timestamp():
+    return datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+
+
+def csv_response(filename, rows, header=None, preamble=()):
+    """Stream rows as a CSV download.
+
+    ?gzip=1 downloads filename.gz; otherwise the body is gzip
+    Content-Encoded when the client accepts it.
+    """
+    body = iter_csv(rows, header, preamble)
+    headers = {}
+    mimetype = 'text/csv'
+    if request.args.get('gzip') == '1':
+        body = iter_gzip(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    else:
+        headers['Vary'] = 'Accept-Encoding'
+        if request.accept_encodings['gzip'] > 0:  # honours q-values, so gzip;q=0 opts out
+            body = iter_gzip(body)
+            headers['Content-Encoding'] = 'gzip'
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
@@ -0,0 +1,409 @@
+"""Per-endpoint request metrics, aggregated across worker processes.
+
+For every request: latency, response size, SQL statement count and time
+(from engine events, so every engine and bind is covered) and template
+render time, labelled by Flask endpoint rather than URL so the number of
+series stays bounded. Requests whose response streams inside the request
+context (CSV exports) are measured until the last chunk is sent.
+
+A request only appends its numbers to a queue; every worker's flusher
+thread adds the queue to that worker's totals and writes them to
+<dir>/<pid>-<token>.json every METRICS_FLUSH_INTERVAL seconds (atomic
+replace). A scrape flushes its own worker and sums every file; files left
+by workers that have exited are folded into archived.json under a file
+lock, so counters never go backwards when gunicorn recycles workers.
+"""
+import atexit
+import bisect
+import collections
+import contextvars
+import functools
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single development server, no exited workers to fold
+    fcntl = None
+
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'zit_http_requests_total': ('counter', 'Requests by endpoint, method and status.', None),
+    'zit_http_request_duration_seconds': ('histogram', 'Time until the response is built, or fully sent if streamed.',
+                                          LATENCY_BUCKETS),
+    'zit_http_response_size_bytes': ('histogram', 'Response body size.', SIZE_BUCKETS),
+    'zit_sql_statements_per_request': ('histogram', 'SQL statements executed per request.', STATEMENT_BUCKETS),
+    'zit_sql_duration_seconds_total': ('counter', 'Time spent executing SQL statements.', None),
+    'zit_template_render_seconds': ('histogram', 'Jinja render time per request.', LATENCY_BUCKETS),
+}
+
+ARCHIVE = 'archived.json'
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class _RequestStats:
+    __slots__ = ('start', 'seconds', 'endpoint', 'method', 'status', 'size', 'statements', 'sql_seconds',
+                 'template_seconds', 'template_depth', 'template_start')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.endpoint = None
+        self.status = '500'
+        self.size = None
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.template_start = 0.0
+
+
+class _CountingBody:
+    """WSGI body that counts the bytes sent; the server's close() records the request."""
+
+    def __init__(self, body, stats, on_close):
+        self.body = body
+        self.stats = stats
+        self.on_close = on_close
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.stats.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+class RequestMetrics:
+    """Collects request metrics for one Flask app; see the module docstring."""
+
+    def __init__(self, directory, enabled=METRICS_ENABLED, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._histograms = {}
+        self._series = {}
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._thread = None
+        self._stop = threading.Event()
+        atexit.register(self.flush)
+
+    def init_app(self, app):
+        """Wrap app.wsgi_app and connect the SQL and template listeners."""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.wsgi_app = self._timed(app.wsgi_app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # ---- request hooks -------------------------------------------------
+
+    def _timed(self, wsgi_app):
+        # Measured at the WSGI layer rather than with before/after_request hooks: it
+        # costs less per request, covers building the request context and loading the
+        # session, and sees error responses. Flask calls start_response while the request
+        # context is still pushed, so the request Werkzeug keeps in the environ is there.
+        @functools.wraps(wsgi_app)
+        def timed_wsgi_app(environ, start_response):
+            stats = _RequestStats()
+            _current.set(stats)
+
+            def capture(status, headers, exc_info=None):
+                req = environ.get('werkzeug.request')
+                if req is not None:
+                    stats.endpoint = req.endpoint
+                stats.status = status[:3]
+                for name, value in headers:
+                    if name == 'Content-Length':  # Werkzeug's spelling
+                        stats.size = int(value)
+                        break
+                return start_response(status, headers, exc_info)
+
+            body = wsgi_app(environ, capture)
+            if stats.size is None:
+                # streamed without a length (CSV exports): count what the server sends
+                stats.size = 0
+                return _CountingBody(body, stats, functools.partial(self._finish, stats, environ))
+            self._finish(stats, environ)
+            return body
+        return timed_wsgi_app
+
+    def _finish(self, stats, environ):
+        _current.set(None)
+        self.record(stats, time.perf_counter() - stats.start, environ.get('REQUEST_METHOD', 'GET'))
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            if stats.template_depth == 0:
+                stats.template_start = time.perf_counter()
+            stats.template_depth += 1
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats.template_depth:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_seconds += time.perf_counter() - stats.template_start
+
+    # ---- aggregation ---------------------------------------------------
+
+    def record(self, stats, seconds, method):
+        """Queue a finished request; the flusher thread adds it to the totals."""
+        if self._pid != os.getpid():
+            self._ensure_flusher()
+        stats.seconds = seconds
+        stats.method = method
+        self._pending.append(stats)
+
+    def _drain(self):
+        # deque.popleft is thread-safe, so requests keep appending while this runs
+        pending = self._pending
+        with self._lock:
+            while True:
+                try:
+                    stats = pending.popleft()
+                except IndexError:
+                    return
+                key = (stats.endpoint or 'unmatched', stats.method, stats.status)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = self._new_series(*key)
+                requests, duration, size, statements, sql, template = series
+                requests[0] += 1
+                duration[0][bisect.bisect_left(LATENCY_BUCKETS, stats.seconds)] += 1
+                duration[1] += stats.seconds
+                size[0][bisect.bisect_left(SIZE_BUCKETS, stats.size)] += 1
+                size[1] += stats.size
+                statements[0][bisect.bisect_left(STATEMENT_BUCKETS, stats.statements)] += 1
+                statements[1] += stats.statements
+                if stats.sql_seconds:
+                    sql[0] += stats.sql_seconds
+                if stats.template_seconds:
+                    template[0][bisect.bisect_left(LATENCY_BUCKETS, stats.template_seconds)] += 1
+                    template[1] += stats.template_seconds
+
+    def _new_series(self, endpoint, method, status):
+        # counters are [value] and histograms [bucket_counts, sum], so _drain() updates them in place
+        by_endpoint = (('endpoint', endpoint),)
+        by_method = by_endpoint + (('method', method),)
+        return (
+            self._counter('zit_http_requests_total', by_method + (('status', status),)),
+            self._histogram('zit_http_request_duration_seconds', by_method),
+            self._histogram('zit_http_response_size_bytes', by_endpoint),
+            self._histogram('zit_sql_statements_per_request', by_endpoint),
+            self._counter('zit_sql_duration_seconds_total', by_endpoint),
+            self._histogram('zit_template_render_seconds', by_endpoint),
+        )
+
+    def _counter(self, name, labels):
+        return self._counters.setdefault((name, labels), [0])
+
+    def _histogram(self, name, labels):
+        return self._histograms.setdefault((name, labels), [[0] * (len(METRICS[name][2]) + 1), 0.0])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), (value,) in self._counters.items()
+                             if value],
+                'histograms': [[name, list(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items() if any(counts)],
+            }
+
+    def flush(self):
+        """Add queued requests to the totals and write them to this worker's file."""
+        if self._path is None or self._pid != os.getpid():
+            return
+        self._drain()
+        tmp = f'{self._path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self._path)
+
+    def collect(self):
+        """All workers' totals merged: ({(name, labels): value}, {(name, labels): [counts, sum]}, workers)."""
+        self.flush()
+        self._fold_exited_workers()
+        counters, histograms, workers = {}, {}, 0
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            data = _read(path)
+            if data is None:
+                continue
+            if os.path.basename(path) != ARCHIVE:
+                workers += 1
+            _merge(counters, histograms, data)
+        return counters, histograms, workers
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        counters, histograms, workers = self.collect()
+        lines = ['# HELP zit_metrics_workers Worker processes whose metrics are included.',
+                 '# TYPE zit_metrics_workers gauge', f'zit_metrics_workers {workers}']
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Forget every worker's numbers (e.g. after a deploy)."""
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._series = {}
+            self._pending = collections.deque()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            os.remove(path)
+
+    def _fold_exited_workers(self):
+        if fcntl is None:
+            return
+        lock_path = os.path.join(self.directory, '.lock')
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                exited = [p for p in glob.glob(os.path.join(self.directory, '*-*.json'))
+                          if not _alive(int(os.path.basename(p).split('-', 1)[0]))]
+                if not exited:
+                    return
+                archive = os.path.join(self.directory, ARCHIVE)
+                counters, histograms = {}, {}
+                for path in [archive] + exited:
+                    data = _read(path)
+                    if data is not None:
+                        _merge(counters, histograms, data)
+                tmp = f'{archive}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump({'counters': [[n, list(l), v] for (n, l), v in counters.items()],
+                               'histograms': [[n, list(l), c, s] for (n, l), (c, s) in histograms.items()]}, f)
+                os.replace(tmp, archive)
+                for path in exited:
+                    os.remove(path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _ensure_flusher(self):
+        # threads do not survive fork, so every gunicorn worker starts its own
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._counters = {}
+            self._histograms = {}
+            self._series = {}
+            self._pending = collections.deque()
+            self._path = os.path.join(self.directory, f'{pid}-{uuid.uuid4().hex[:8]}.json')
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception('request metrics flush failed')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, '_metrics_start', None)
+    if stats is not None and start is not None:
+        stats.statements += 1
+        stats.sql_seconds += time.perf_counter() - start
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts, total in data['histograms']:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        merged = histograms.get(key)
+        if merged is None:
+            histograms[key] = [list(counts), total]
+        else:
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,176 @@
+"""Versioned schema migrations.
+
+Each migration is a (version, name, function) entry; the function receives an
+open connection inside a transaction. Applied versions are recorded in the
+schema_migrations table so every migration runs exactly once per database.
+Run them at deploy time with `flask --app app db-upgrade`.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import search
+
+
+def _add_missing_columns(conn, table, columns):
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+
+def m001_course_moderation_columns(conn):
+    """Columns that used to be patched in by ensure_course_columns."""
+    _add_missing_columns(conn, 'course', [
+        ('image', 'VARCHAR(300)'),
+        ('price', 'REAL DEFAULT 0.0'),
+        ('is_approved', 'BOOLEAN DEFAULT 0'),
+        ('is_rejected', 'BOOLEAN DEFAULT 0'),
+        ('rejection_reason', 'TEXT'),
+    ])
+
+
+def m002_hot_path_indexes(conn):
+    """Indexes for the foreign keys and sort orders used on every hot path."""
+    for ddl in (
+        'CREATE INDEX IF NOT EXISTS ix_course_approved_created ON course (is_approved, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_course_instructor_id ON course (instructor_id)',
+        'CREATE INDEX IF NOT EXISTS ix_module_course_id ON module (course_id)',
+        'CREATE INDEX IF NOT EXISTS ix_announcement_course_created ON announcement (course_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_course_progress_course_id ON course_progress (course_id)',
+        'CREATE INDEX IF NOT EXISTS ix_course_progress_created_at ON course_progress (created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_module_progress_module_id ON module_progress (module_id)',
+        'CREATE INDEX IF NOT EXISTS ix_quiz_course_id ON quiz (course_id)',
+        'CREATE INDEX IF NOT EXISTS ix_question_quiz_order ON question (quiz_id, "order")',
+        'CREATE INDEX IF NOT EXISTS ix_choice_question_id ON choice (question_id)',
+        'CREATE INDEX IF NOT EXISTS ix_student_answer_question_id ON student_answer (question_id)',
+        'CREATE INDEX IF NOT EXISTS ix_video_course_created ON video (course_id, created_at)',
+    ):
+        conn.execute(text(ddl))
+
+
+def m003_unique_enrollments_and_answers(conn):
+    """One enrollment per (student, course) and one answer per (student, question).
+
+    Duplicates left behind by earlier check-then-insert races are removed
+    first: the oldest enrollment and the newest answer are kept.
+    """
+    conn.execute(text(
+        'DELETE FROM course_progress WHERE id NOT IN '
+        '(SELECT MIN(id) FROM course_progress GROUP BY student_id, course_id)'))
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uix_course_progress_student_course '
+        'ON course_progress (student_id, course_id)'))
+    conn.execute(text(
+        'DELETE FROM student_answer WHERE id NOT IN '
+        '(SELECT MAX(id) FROM student_answer GROUP BY student_id, question_id)'))
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uix_student_answer_student_question '
+        'ON student_answer (student_id, question_id)'))
+
+
+def m004_video_rendition_columns(conn):
+    """Processing state and rendition metadata filled in by the video worker."""
+    _add_missing_columns(conn, 'video', [
+        ('status', "VARCHAR(20) DEFAULT 'ready'"),
+        ('poster', 'VARCHAR(300)'),
+        ('renditions', 'TEXT'),
+    ])
+
+
+def m005_payment_ledger(conn):
+    """Turn the payment verification table into a ledger fed by the webhook."""
+    _add_missing_columns(conn, 'payment', [
+        ('email', 'VARCHAR(120)'),
+        ('amount', 'INTEGER'),
+        ('currency', 'VARCHAR(3)'),
+        ('source', 'VARCHAR(20)'),
+        ('event', 'VARCHAR(50)'),
+        ('payload', 'TEXT'),
+        ('paid_at', 'VARCHAR(40)'),
+        ('applied_at', 'DATETIME'),
+    ])
+    # payments verified before the ledger existed already have their enrollment
+    conn.execute(text("UPDATE payment SET applied_at = verified_at WHERE status = 'success' AND applied_at IS NULL"))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_payment_status_applied ON payment (status, applied_at)'))
+
+
+def m006_quiz_exam_mode(conn):
+    """Exam mode settings: buffered answers, close time and seal time."""
+    _add_missing_columns(conn, 'quiz', [
+        ('exam_mode', 'BOOLEAN DEFAULT 0'),
+        ('closes_at', 'DATETIME'),
+        ('sealed_at', 'DATETIME'),
+    ])
+
+
+def m007_rollup_source_indexes(conn):
+    """Let the analytics rollup job find new and changed rows without a table scan."""
+    for ddl in (
+        'CREATE INDEX IF NOT EXISTS ix_student_answer_answered_at ON student_answer (answered_at)',
+        'CREATE INDEX IF NOT EXISTS ix_course_progress_completed_at ON course_progress (completed_at)',
+    ):
+        conn.execute(text(ddl))
+
+
+def m008_search_index(conn):
+    """FTS5 index over courses and modules, filled from the existing rows.
+
+    Skipped on databases without FTS5; search then falls back to LIKE scans.
+    """
+    if not search.fts5_available(conn):
+        return
+    search.create_index(conn)
+    search.rebuild(conn)
+
+
+def m009_course_created_at_backfill(conn):
+    """Give legacy courses without a created_at one, so keyset paging can encode them.
+
+    They are dated like the oldest known course (or now, on a database with no
+    dated courses), which keeps them at the end of the newest-first catalogue.
+    """
+    conn.execute(text(
+        'UPDATE course SET created_at = COALESCE((SELECT MIN(created_at) FROM course), :now) '
+        'WHERE created_at IS NULL'), {'now': datetime.utcnow()})
+
+
+MIGRATIONS = [
+    (1, 'course_moderation_columns', m001_course_moderation_columns),
+    (2, 'hot_path_indexes', m002_hot_path_indexes),
+    (3, 'unique_enrollments_and_answers', m003_unique_enrollments_and_answers),
+    (4, 'video_rendition_columns', m004_video_rendition_columns),
+    (5, 'payment_ledger', m005_payment_ledger),
+    (6, 'quiz_exam_mode', m006_quiz_exam_mode),
+    (7, 'rollup_source_indexes', m007_rollup_source_indexes),
+    (8, 'search_index', m008_search_index),
+    (9, 'course_created_at_backfill', m009_course_created_at_backfill),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(engine, log=print):
+    """Apply every pending migration in order; returns the versions applied."""
+    done = applied_versions(engine)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                         {'v': version, 'n': name, 't': datetime.utcnow()})
+        log(f'Applied migration {version:03d} {name}')
+        applied.append(version)
+    return applied
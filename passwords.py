@@ -0,0 +1,126 @@
+"""Password hashing on a bounded worker pool.
+
+Hashing is deliberately expensive (about 0.3 s of CPU for the default
+pbkdf2:sha256:600000 on a small server), so a login storm at the start of an
+exam can occupy every request thread. PasswordService runs the hashes on at
+most PASSWORD_HASH_WORKERS threads per process. hashlib releases the GIL
+while it hashes, so the other request threads of a worker keep serving
+pages. At most PASSWORD_HASH_MAX_WAITING more hashes may queue. Beyond that,
+or after waiting PASSWORD_HASH_TIMEOUT seconds, the request fails fast with
+PasswordServiceBusy (a 503 with Retry-After) instead of piling up.
+
+PASSWORD_HASH_METHOD takes any Werkzeug method string (pbkdf2:sha256:600000,
+scrypt:32768:8:1, ...). Stored hashes made with another method or cost are
+re-hashed in the background after the next successful login, so raising the
+cost migrates users as they sign in.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))  # 0: hash inline
+# about 2.5 s of queue per thread at the default cost, well inside the timeout
+PASSWORD_HASH_MAX_WAITING = int(os.environ.get('PASSWORD_HASH_MAX_WAITING', 8 * max(PASSWORD_HASH_WORKERS, 1)))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+PASSWORD_REHASH_ON_LOGIN = os.environ.get('PASSWORD_REHASH_ON_LOGIN', '1') == '1'
+
+
+class PasswordServiceBusy(Exception):
+    """Too many hashes are queued in this worker; the client should retry shortly."""
+
+    retry_after = 5
+
+
+def normalize_method(method):
+    """method with Werkzeug's defaults filled in, as it appears in a stored hash."""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes a hash name and an iteration count")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        if args and len(args) != 3:
+            raise ValueError("'scrypt' takes n, r and p")
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    raise ValueError(f'unsupported password hash method {method!r}; use pbkdf2 or scrypt')
+
+
+class PasswordService:
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_waiting=PASSWORD_HASH_MAX_WAITING, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash or pwhash.count('$') < 2:
+            return False  # placeholder hashes such as '!' never match, so skip the pool
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when pwhash was made with another method or cost than the configured one."""
+        return bool(pwhash) and pwhash.count('$') >= 2 and pwhash.split('$', 1)[0] != self.method
+
+    def rehash_async(self, password, store):
+        """Hash password with the configured method in the background and pass the result to store().
+
+        Best effort: when the pool is busy it is skipped, and the next login tries again.
+        """
+        if not self.workers:
+            store(self.hash(password))
+            return
+        try:
+            future = self._submit(generate_password_hash, password, self.method)
+        except PasswordServiceBusy:
+            return
+
+        def done(f):
+            if not f.cancelled() and f.exception() is None:
+                store(f.result())
+        future.add_done_callback(done)
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.workers, 'max_waiting': self.max_waiting,
+                'in_flight': self._in_flight}
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordServiceBusy() from None
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            # threads do not survive fork, so every gunicorn worker starts its own pool
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+                self._in_flight = 0
+            if self._in_flight >= self.workers + self.max_waiting:
+                raise PasswordServiceBusy()
+            self._in_flight += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
@@ -1,45 +1,172 @@
+"""Paystack API client.
+
+One pooled requests.Session per process keeps TLS connections alive between
+calls. Connection errors, timeouts, 429 and 5xx responses are retried with
+exponential backoff. The *_async variants run on a small thread pool and
+return a concurrent.futures.Future, so a request worker never has to wait on
+Paystack. Set PAYSTACK_BASE_URL to a running paystack_stub.py to exercise all
+of this offline.
+"""
+import hashlib
+import hmac
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 
 PAYSTACK_SECRET_KEY = os.environ.get('PAYSTACK_SECRET_KEY', '')
 PAYSTACK_PUBLIC_KEY = os.environ.get('PAYSTACK_PUBLIC_KEY', '')
-PAYSTACK_INITIALIZE_URL = 'https://api.paystack.co/transaction/initialize'
-PAYSTACK_VERIFY_URL = 'https://api.paystack.co/transaction/verify/{}'
+PAYSTACK_BASE_URL = os.environ.get('PAYSTACK_BASE_URL', 'https://api.paystack.co').rstrip('/')
+PAYSTACK_TIMEOUT = float(os.environ.get('PAYSTACK_TIMEOUT', 15))
+PAYSTACK_RETRIES = int(os.environ.get('PAYSTACK_RETRIES', 3))
+PAYSTACK_BACKOFF = float(os.environ.get('PAYSTACK_BACKOFF', 0.5))
+PAYSTACK_POOL_SIZE = int(os.environ.get('PAYSTACK_POOL_SIZE', 10))
+PAYSTACK_ASYNC_WORKERS = int(os.environ.get('PAYSTACK_ASYNC_WORKERS', 4))
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 10.0
 
-def _auth_headers():
-    if not PAYSTACK_SECRET_KEY:
-        raise RuntimeError('PAYSTACK_SECRET_KEY not configured in environment')
-    return {
-        'Authorization': f'Bearer {PAYSTACK_SECRET_KEY}',
-        'Content-Type': 'application/json'
-    }
 
+class PaystackClient:
+    def __init__(self, secret_key=PAYSTACK_SECRET_KEY, base_url=PAYSTACK_BASE_URL, timeout=PAYSTACK_TIMEOUT,
+                 retries=PAYSTACK_RETRIES, backoff=PAYSTACK_BACKOFF, pool_size=PAYSTACK_POOL_SIZE,
+                 async_workers=PAYSTACK_ASYNC_WORKERS, pooled=True):
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.async_workers = async_workers
+        self.pooled = pooled
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._executor = None
 
-def initialize_transaction(email: str, amount_kobo: int, callback_url: str, metadata: dict = None):
-    """Initialize a Paystack transaction and return the JSON response.
+    def _auth_headers(self):
+        if not self.secret_key:
+            raise RuntimeError('PAYSTACK_SECRET_KEY not configured in environment')
+        return {
+            'Authorization': f'Bearer {self.secret_key}',
+            'Content-Type': 'application/json'
+        }
+
+    def _reset_after_fork(self):
+        # sockets and threads inherited from a pre-fork parent are not usable
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._session = None
+                    self._executor = None
+                    self._pid = os.getpid()
+
+    def _get_session(self):
+        self._reset_after_fork()
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _delay(self, attempt, resp=None):
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF)
+        return min(self.backoff * (2 ** attempt), MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    def request(self, method, path, **kwargs):
+        """Send one API call, retrying transient failures; returns the decoded JSON body.
+
+        Retrying initialize is harmless: an unused checkout is simply never paid.
+        """
+        headers = self._auth_headers()
+        url = self.base_url + path
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                if self.pooled:
+                    resp = self._get_session().request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+                else:
+                    resp = requests.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            if resp.status_code in RETRY_STATUSES and not last:
+                delay = self._delay(attempt, resp)
+                resp.close()
+                time.sleep(delay)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+
+    def initialize_transaction(self, email: str, amount_kobo: int, callback_url: str, metadata: dict = None):
+        """Initialize a Paystack transaction and return the JSON response.
+
+        amount_kobo: amount in kobo (NGN * 100)
+        """
+        payload = {
+            'email': email,
+            'amount': int(amount_kobo),
+            'callback_url': callback_url,
+        }
+        if metadata:
+            payload['metadata'] = metadata
+        return self.request('POST', '/transaction/initialize', json=payload)
+
+    def verify_transaction(self, reference: str):
+        """Verify a Paystack transaction by reference."""
+        return self.request('GET', f'/transaction/verify/{reference}')
 
-    amount_kobo: amount in kobo (NGN * 100)
-    """
-    payload = {
-        'email': email,
-        'amount': int(amount_kobo),
-        'callback_url': callback_url,
-    }
-    if metadata:
-        payload['metadata'] = metadata
+    def _get_executor(self):
+        self._reset_after_fork()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.async_workers,
+                                                        thread_name_prefix='paystack')
+        return self._executor
 
-    resp = requests.post(PAYSTACK_INITIALIZE_URL, json=payload, headers=_auth_headers(), timeout=15)
-    resp.raise_for_status()
-    return resp.json()
+    def initialize_transaction_async(self, *args, **kwargs):
+        return self._get_executor().submit(self.initialize_transaction, *args, **kwargs)
+
+    def verify_transaction_async(self, reference: str):
+        """Verify off the calling thread; returns a Future of the JSON response."""
+        return self._get_executor().submit(self.verify_transaction, reference)
+
+
+client = PaystackClient()
+
+
+def initialize_transaction(email: str, amount_kobo: int, callback_url: str, metadata: dict = None):
+    return client.initialize_transaction(email, amount_kobo, callback_url, metadata)
 
 
 def verify_transaction(reference: str):
-    """Verify a Paystack transaction by reference."""
-    url = PAYSTACK_VERIFY_URL.format(reference)
-    resp = requests.get(url, headers=_auth_headers(), timeout=15)
-    resp.raise_for_status()
-    return resp.json()
+    return client.verify_transaction(reference)
+
+
+def verify_transaction_async(reference: str):
+    return client.verify_transaction_async(reference)
+
+
+def verify_webhook_signature(body: bytes, signature: str, secret_key: str = None):
+    """Check X-Paystack-Signature: the hex HMAC-SHA512 of the raw body keyed with the secret key."""
+    secret_key = secret_key or client.secret_key
+    if not secret_key or not signature:
+        return False
+    expected = hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
 
 
 def get_public_key():
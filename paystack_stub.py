@@ -0,0 +1,167 @@
+"""A local stand-in for the Paystack API, for offline demos and benchmarks.
+
+Implements POST /transaction/initialize, GET /transaction/verify/<reference>
+and a /checkout/<reference> page that marks the payment successful and
+redirects to the callback URL. Latency and failure rate are configurable, and
+GET /__stats reports request and TCP connection counts.
+
+    python paystack_stub.py --port 8765 --latency 0.2 --fail-rate 0.1
+    PAYSTACK_BASE_URL=http://127.0.0.1:8765 PAYSTACK_SECRET_KEY=sk_test_stub python app.py
+
+Unknown references verify as successful when they look like stub-<course>-<student>,
+so benchmarks can verify without initializing first.
+"""
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class StubPaystack:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.transactions = {}
+        self.stats = {'requests': 0, 'connections': 0, 'failures': 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _transaction(self, reference):
+        txn = self.transactions.get(reference)
+        if txn is None and reference.startswith('stub-'):
+            parts = reference.split('-')
+            if len(parts) >= 3 and parts[1].isdigit() and parts[2].isdigit():
+                txn = {'reference': reference, 'amount': 0, 'email': '', 'status': 'success',
+                       'metadata': {'course_id': int(parts[1]), 'student_id': int(parts[2])}}
+        return txn
+
+    def _verify_payload(self, txn):
+        return {'status': True, 'message': 'Verification successful', 'data': {
+            'reference': txn['reference'], 'status': txn['status'], 'amount': txn['amount'],
+            'currency': 'NGN', 'paid_at': txn.get('paid_at'), 'customer': {'email': txn['email']},
+            'metadata': txn['metadata']}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so client pooling is visible in the stats
+            disable_nagle_algorithm = True  # headers and body are separate writes
+
+            def setup(self):
+                super().setup()
+                stub._count('connections')
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _maybe_fail(self):
+                if self.path == '/__stats':
+                    return False
+                stub._count('requests')
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.fail_rate and random.random() < stub.fail_rate:
+                    stub._count('failures')
+                    self._send(503, {'status': False, 'message': 'Service unavailable (stub)'})
+                    return True
+                return False
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self._maybe_fail():
+                    return
+                if self.path != '/transaction/initialize':
+                    return self._send(404, {'status': False, 'message': 'Not found'})
+                payload = json.loads(body or b'{}')
+                reference = f'stub_{secrets.token_hex(8)}'
+                stub.transactions[reference] = {
+                    'reference': reference, 'amount': payload.get('amount', 0), 'email': payload.get('email', ''),
+                    'metadata': payload.get('metadata') or {}, 'callback_url': payload.get('callback_url'),
+                    'status': 'abandoned'}
+                host = self.headers.get('Host')
+                self._send(200, {'status': True, 'message': 'Authorization URL created', 'data': {
+                    'authorization_url': f'http://{host}/checkout/{reference}',
+                    'access_code': secrets.token_hex(6), 'reference': reference}})
+
+            def do_GET(self):
+                if self._maybe_fail():
+                    return
+                path = urlsplit(self.path).path
+                if path == '/__stats':
+                    return self._send(200, dict(stub.stats, transactions=len(stub.transactions)))
+                if path.startswith('/transaction/verify/'):
+                    txn = stub._transaction(path.rsplit('/', 1)[1])
+                    if txn is None:
+                        return self._send(400, {'status': False, 'message': 'Transaction reference not found'})
+                    return self._send(200, stub._verify_payload(txn))
+                if path.startswith('/checkout/'):
+                    txn = stub.transactions.get(path.rsplit('/', 1)[1])
+                    if txn is None:
+                        return self._send(404, {'status': False, 'message': 'Not found'})
+                    txn['status'] = 'success'
+                    txn['paid_at'] = datetime.utcnow().isoformat() + 'Z'
+                    sep = '&' if '?' in (txn['callback_url'] or '') else '?'
+                    location = f"{txn['callback_url']}{sep}reference={txn['reference']}"
+                    self.send_response(302)
+                    self.send_header('Location', location)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self._send(404, {'status': False, 'message': 'Not found'})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Paystack stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API call')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    args = parser.parse_args()
+    stub = StubPaystack(args.host, args.port, args.latency, args.fail_rate)
+    print(f'Paystack stub listening on {stub.url} (latency {args.latency}s, fail rate {args.fail_rate})')
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
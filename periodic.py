@@ -0,0 +1,73 @@
+"""A per-process background thread for batched and scheduled jobs."""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """Run a background job on one thread per worker process.
+
+    poke() marks that there is work. The job then runs within interval
+    seconds, or at once after threshold pokes, so a burst is handled in one
+    batch rather than one run per poke. With idle_interval set, the job also
+    runs that often when nobody poked, e.g. to act on deadlines that pass
+    without any request.
+
+    The job takes no arguments and must find its own work (a durable log,
+    unapplied rows), so nothing is lost if a worker exits between runs. A
+    failed run is logged and retried on the next tick.
+    """
+
+    def __init__(self, job, interval, threshold=0, idle_interval=None, name='periodic-worker'):
+        self.job = job
+        self.interval = interval
+        self.threshold = threshold
+        self.idle_interval = idle_interval
+        self.name = name
+        self._pokes = 0
+        self._last_run = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def poke(self):
+        """Record that there is work. Cheap; the job runs on the background thread."""
+        self.start()
+        with self._lock:
+            self._pokes += 1
+            full = self.threshold and self._pokes >= self.threshold
+        if full:
+            self._wake.set()
+
+    def start(self):
+        """Start this process's thread if it is not running yet."""
+        # threads do not survive fork, so every gunicorn worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pokes = 0
+            self._wake = threading.Event()
+            threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                pokes, self._pokes = self._pokes, 0
+            idle_due = self.idle_interval is not None and time.monotonic() - self._last_run >= self.idle_interval
+            if not pokes and not idle_due:
+                continue
+            self._last_run = time.monotonic()
+            try:
+                self.job()
+            except Exception:
+                log.exception('%s: job failed', self.name)
+                with self._lock:
+                    self._pokes += pokes  # retried on the next tick
@@ -0,0 +1,320 @@
+"""On-demand request profiling for admins.
+
+Off by default and close to free while off: the WSGI wrapper only checks a
+flag. An admin arms it (POST /admin/profiling or `flask profiling`) for one
+endpoint, a sampled fraction of requests, or both, for a limited time. The
+settings are a JSON file in the profile directory, so every gunicorn worker
+picks them up within PROFILE_SETTINGS_CHECK seconds.
+
+Two modes:
+- cprofile: deterministic cProfile of the whole request, saved as a .pstats
+  file (load it with pstats, snakeviz or `python -m pstats`). Every Python
+  call is counted, which slows the profiled request down noticeably.
+- sample: a per-worker thread records the profiled request's stack every
+  PROFILE_SAMPLE_INTERVAL seconds, saved as a .folded file (one
+  `frame;frame;frame count` line per stack), the input of flamegraph.pl and
+  speedscope. Cheaper, and good for spotting where wall time goes,
+  including time blocked in SQL or I/O.
+
+Profiles of requests faster than min_ms are discarded. After each save the
+directory is pruned to the newest PROFILE_MAX_FILES files and
+PROFILE_MAX_BYTES bytes.
+"""
+import cProfile
+import collections
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.exceptions import HTTPException
+
+log = logging.getLogger(__name__)
+
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+PROFILE_MAX_BYTES = int(os.environ.get('PROFILE_MAX_BYTES', 100 * 1024 * 1024))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+PROFILE_SETTINGS_CHECK = float(os.environ.get('PROFILE_SETTINGS_CHECK', 1))
+PROFILE_MAX_MINUTES = float(os.environ.get('PROFILE_MAX_MINUTES', 60))
+
+MODES = {'cprofile': '.pstats', 'sample': '.folded'}
+SETTINGS = 'settings.json'
+# <utc time>_<endpoint>_<ms>ms_<token>.<ext>
+PROFILE_NAME = re.compile(r'^(\d{8}T\d{6}\d{3})_([\w.]+)_(\d+)ms_([0-9a-f]{8})\.(pstats|folded)$')
+
+
+class RequestProfiler:
+    """Profiles selected requests of one Flask app; see the module docstring."""
+
+    def __init__(self, directory, max_files=PROFILE_MAX_FILES, max_bytes=PROFILE_MAX_BYTES,
+                 sample_interval=PROFILE_SAMPLE_INTERVAL):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.sample_interval = sample_interval
+        self.url_map = None
+        self.exclude = frozenset()
+        self._settings = None  # armed settings, or None
+        self._settings_mtime = None
+        self._next_check = 0.0
+        self._sampler = None
+        self._sampler_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, exclude=()):
+        """Wrap app.wsgi_app; requests to the endpoints in exclude are never profiled."""
+        self.url_map = app.url_map
+        self.exclude = frozenset(exclude)
+        os.makedirs(self.directory, exist_ok=True)
+        app.wsgi_app = self._profiled(app.wsgi_app)
+
+    # ---- settings ------------------------------------------------------
+
+    def arm(self, endpoint=None, sample_rate=None, minutes=10, min_ms=0, mode='cprofile'):
+        """Profile requests to endpoint (all if None) with probability sample_rate, for minutes."""
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {", ".join(MODES)}')
+        if sample_rate is None:
+            sample_rate = 1.0 if endpoint else 0.01
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be in (0, 1]')
+        if not 0 < minutes <= PROFILE_MAX_MINUTES:
+            raise ValueError(f'minutes must be in (0, {PROFILE_MAX_MINUTES:g}]')
+        if min_ms < 0:
+            raise ValueError('min_ms must not be negative')
+        settings = {'endpoint': endpoint or None, 'sample_rate': sample_rate, 'min_ms': min_ms, 'mode': mode,
+                    'until': time.time() + minutes * 60}
+        self._write_settings(settings)
+        return settings
+
+    def disarm(self):
+        self._write_settings(None)
+
+    def settings(self):
+        """The armed settings as stored, or None when off or expired."""
+        try:
+            with open(os.path.join(self.directory, SETTINGS)) as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not settings or settings['until'] <= time.time():
+            return None
+        return settings
+
+    def _write_settings(self, settings):
+        path = os.path.join(self.directory, SETTINGS)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(settings, f)
+        os.replace(tmp, path)
+        self._next_check = 0.0  # this worker applies it on its next request
+
+    def _refresh(self, now):
+        self._next_check = now + PROFILE_SETTINGS_CHECK
+        try:
+            mtime = os.stat(os.path.join(self.directory, SETTINGS)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._settings_mtime:
+            self._settings_mtime = mtime
+            self._settings = self.settings()
+        elif self._settings and self._settings['until'] <= time.time():
+            self._settings = None
+
+    # ---- request hook --------------------------------------------------
+
+    def _profiled(self, wsgi_app):
+        @functools.wraps(wsgi_app)
+        def profiled_wsgi_app(environ, start_response):
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._refresh(now)
+            settings = self._settings
+            if settings is None or random.random() >= settings['sample_rate']:
+                return wsgi_app(environ, start_response)
+            endpoint = self._endpoint(environ)
+            if endpoint in self.exclude or settings['endpoint'] and endpoint != settings['endpoint']:
+                return wsgi_app(environ, start_response)
+            return self._run(wsgi_app, environ, start_response, settings, endpoint or 'unmatched')
+        return profiled_wsgi_app
+
+    def _endpoint(self, environ):
+        try:
+            return self.url_map.bind_to_environ(environ).match()[0]
+        except HTTPException:
+            return None
+
+    def _run(self, wsgi_app, environ, start_response, settings, endpoint):
+        # a streamed body (CSV exports) is profiled until the response starts
+        start = time.perf_counter()
+        if settings['mode'] == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                profile.disable()
+                self._save(profile, endpoint, start, settings)
+        sampler = self._sampler_for_pid()
+        stacks = sampler.start(sys._getframe())
+        try:
+            return wsgi_app(environ, start_response)
+        finally:
+            sampler.stop()
+            self._save(stacks, endpoint, start, settings)
+
+    def _sampler_for_pid(self):
+        # threads do not survive fork, so every gunicorn worker starts its own
+        if self._sampler_pid != os.getpid():
+            with self._lock:
+                if self._sampler_pid != os.getpid():
+                    self._sampler = _Sampler(self.sample_interval)
+                    self._sampler_pid = os.getpid()
+        return self._sampler
+
+    # ---- storage -------------------------------------------------------
+
+    def _save(self, profile, endpoint, start, settings):
+        ms = (time.perf_counter() - start) * 1000
+        if ms < settings['min_ms'] or not profile:
+            return  # too fast, or over before the sampler looked
+        try:
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')[:-3]
+            name = f"{stamp}_{endpoint}_{ms:.0f}ms_{uuid.uuid4().hex[:8]}{MODES[settings['mode']]}"
+            path = os.path.join(self.directory, name)
+            tmp = f'{path}.tmp'
+            if isinstance(profile, cProfile.Profile):
+                profile.dump_stats(tmp)
+            else:
+                with open(tmp, 'w') as f:
+                    for stack, count in profile.most_common():
+                        f.write(f'{stack} {count}\n')
+            os.replace(tmp, path)
+            self.prune()
+        except Exception:
+            log.exception('saving a request profile failed')
+
+    def prune(self):
+        """Delete the oldest profiles beyond max_files or max_bytes."""
+        kept, total = 0, 0
+        for entry in self.profiles():
+            kept += 1
+            total += entry['size']
+            if kept > self.max_files or total > self.max_bytes:
+                try:
+                    os.remove(os.path.join(self.directory, entry['name']))
+                except FileNotFoundError:
+                    pass  # another worker pruned it first
+
+    def profiles(self):
+        """Saved profiles, newest first."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                match = PROFILE_NAME.match(entry.name)
+                if not match:
+                    continue
+                try:
+                    size = entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+                stamp, endpoint, ms, _, kind = match.groups()
+                entries.append({'name': entry.name, 'endpoint': endpoint, 'ms': int(ms), 'size': size,
+                                'mode': 'cprofile' if kind == 'pstats' else 'sample',
+                                'created_at': datetime.strptime(stamp, '%Y%m%dT%H%M%S%f').isoformat()})
+        entries.sort(key=lambda e: e['name'], reverse=True)
+        return entries
+
+    def path(self, name):
+        """The file of a saved profile, or None for anything that is not one."""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def clear(self):
+        for entry in self.profiles():
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except FileNotFoundError:
+                pass
+
+
+def summary(path, limit=40, sort='cumulative'):
+    """A saved profile as text: the top functions of a .pstats file, or the hottest stacks of a .folded one."""
+    if path.endswith('.pstats'):
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+    with open(path) as f:
+        rows = [line.rsplit(' ', 1) for line in f if line.strip()]
+    total = sum(int(count) for _, count in rows) or 1
+    # own samples per leaf frame, then the hottest full stacks
+    leaves = collections.Counter()
+    for stack, count in rows:
+        leaves[stack.rsplit(';', 1)[-1]] += int(count)
+    lines = [f'{total} samples', '', 'self samples by frame:']
+    lines += [f'{count:7} {count * 100 / total:5.1f}%  {frame}' for frame, count in leaves.most_common(limit)]
+    lines += ['', 'hottest stacks:']
+    for stack, count in rows[:limit // 4 or 1]:
+        lines.append(f'{int(count):7} {int(count) * 100 / total:5.1f}%  ' + ' > '.join(stack.split(';')[-6:]))
+    return '\n'.join(lines) + '\n'
+
+
+class _Sampler:
+    """One thread per worker that snapshots the stacks of the threads being profiled."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}  # thread ident -> (root frame, Counter of folded stacks)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._loop, name='profile-sampler', daemon=True).start()
+
+    def start(self, root):
+        """Start sampling the calling thread below root; returns the Counter that fills up."""
+        stacks = collections.Counter()
+        with self._lock:
+            self._targets[threading.get_ident()] = (root, stacks)
+            self._wake.set()
+        return stacks
+
+    def stop(self):
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def _loop(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            # under the lock, so nothing is added to a Counter once stop() has returned
+            with self._lock:
+                if not self._targets:
+                    self._wake.clear()
+                    continue
+                frames = sys._current_frames()
+                for ident, (root, stacks) in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_fold(frame, root)] += 1
+                del frames
+
+
+def _fold(frame, root):
+    names = []
+    while frame is not None and frame is not root:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f"{module}.{getattr(code, 'co_qualname', code.co_name)}".replace(';', ':'))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names) or '(idle)'
@@ -0,0 +1,268 @@
+"""Question bank import: streaming validation and executemany inserts.
+
+Accepted formats:
+
+- JSON: an array of {"text", "explanation", "choices": [{"text", "is_correct"}]}
+  (the create_quiz format), read incrementally so large files never sit in memory.
+- JSON Lines: one such object per line.
+- CSV with a header row: question, explanation, correct, choice_1, choice_2, ...
+  where correct is the 1-based number (or letter) of the right choice;
+  several may be given separated by ";".
+
+A seekable source is validated completely before the first insert, so a bad
+row rejects the whole file and the write lock is only held while the
+already-validated rows are inserted in batches.
+"""
+import csv
+import io
+import json
+import os
+import time
+
+IMPORT_BATCH_SIZE = int(os.environ.get('QUESTION_IMPORT_BATCH_SIZE', 1000))
+MAX_ERRORS = 20
+JSON_CHUNK = 64 * 1024
+
+
+class QuestionBankError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def _text_stream(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.StringIO(source.decode('utf-8-sig'))
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, io.TextIOBase):
+        return source
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+
+
+def iter_json_array(stream):
+    """Yield the elements of a top-level JSON array without reading it all at once."""
+    decoder = json.JSONDecoder()
+    buf, eof = '', False
+
+    def fill():
+        nonlocal buf, eof
+        chunk = stream.read(JSON_CHUNK)
+        if not chunk:
+            eof = True
+        buf += chunk
+
+    while not buf.lstrip() and not eof:
+        fill()
+    buf = buf.lstrip()
+    if not buf.startswith('['):
+        raise QuestionBankError(['JSON question banks must be an array of questions'])
+    buf = buf[1:]
+    index, need_comma, after_comma = 0, False, False
+    while True:
+        buf = buf.lstrip()
+        if not buf:
+            if eof:
+                raise QuestionBankError(['JSON array is not closed'])
+            fill()
+            continue
+        if buf[0] == ']':
+            if after_comma:
+                raise QuestionBankError([f'item {index}: trailing comma before "]"'])
+            return
+        # exactly one comma between elements
+        if need_comma:
+            if buf[0] != ',':
+                raise QuestionBankError([f'item {index}: expected "," or "]" after it'])
+            buf = buf[1:]
+            need_comma, after_comma = False, True
+            continue
+        if buf[0] == ',':
+            raise QuestionBankError([f'item {index + 1}: expected a question, not ","'])
+        try:
+            item, end = decoder.raw_decode(buf)
+        except ValueError as exc:
+            if eof:
+                raise QuestionBankError([f'item {index + 1}: invalid JSON ({exc.msg})'])
+            fill()
+            continue
+        buf = buf[end:]
+        index += 1
+        need_comma, after_comma = True, False
+        yield f'item {index}', item
+        if len(buf) < JSON_CHUNK and not eof:
+            fill()
+
+
+def iter_json_lines(stream):
+    for lineno, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield f'line {lineno}', json.loads(line)
+        except ValueError as exc:
+            raise QuestionBankError([f'line {lineno}: invalid JSON ({exc.msg})'])
+
+
+def _correct_indexes(value, count):
+    picks = set()
+    for part in str(value or '').replace(',', ';').split(';'):
+        part = part.strip().upper()
+        if not part:
+            continue
+        if part.isdigit():
+            picks.add(int(part) - 1)
+        elif len(part) == 1 and part.isalpha():
+            picks.add(ord(part) - ord('A'))
+        else:
+            raise ValueError(part)
+    if any(i < 0 or i >= count for i in picks):
+        raise ValueError(value)
+    return picks
+
+
+def iter_csv_rows(stream):
+    reader = csv.DictReader(stream)
+    fields = [f.strip().lower() for f in reader.fieldnames or []]
+    if 'question' not in fields or 'correct' not in fields:
+        raise QuestionBankError(['CSV needs a header with question, correct and choice_1, choice_2, ... columns'])
+    reader.fieldnames = fields
+    choice_cols = sorted((f for f in fields if f.startswith('choice_') and f[7:].isdigit()), key=lambda f: int(f[7:]))
+    for row in reader:
+        where = f'row {reader.line_num}'
+        texts = [(row.get(c) or '').strip() for c in choice_cols]
+        texts = [t for t in texts if t]
+        try:
+            correct = _correct_indexes(row.get('correct'), len(texts))
+        except ValueError:
+            raise QuestionBankError([f'{where}: correct must name one of the {len(texts)} choices'])
+        yield where, {'text': row.get('question'), 'explanation': row.get('explanation'),
+                      'choices': [{'text': t, 'is_correct': i in correct} for i, t in enumerate(texts)]}
+
+
+def parse(source, fmt):
+    """Yield (location, raw question) pairs from source in the given format (json, jsonl or csv)."""
+    stream = _text_stream(source)
+    if fmt == 'csv':
+        return iter_csv_rows(stream)
+    if fmt == 'jsonl':
+        return iter_json_lines(stream)
+    if fmt == 'json':
+        return iter_json_array(stream)
+    raise QuestionBankError([f'unsupported format {fmt!r}; use json, jsonl or csv'])
+
+
+def detect_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return {'ndjson': 'jsonl'}.get(ext, ext)
+
+
+def validate_question(raw):
+    """Return (question, errors): a normalized {'text', 'explanation', 'choices': [(text, is_correct)]}."""
+    if not isinstance(raw, dict):
+        return None, ['expected an object']
+    errors = []
+    text = str(raw.get('text') or '').strip()
+    if not text:
+        errors.append('question text is required')
+    choices = []
+    for c in raw.get('choices') or []:
+        if isinstance(c, dict) and str(c.get('text') or '').strip():
+            choices.append((str(c['text']).strip(), bool(c.get('is_correct'))))
+    if len(choices) < 2:
+        errors.append('at least 2 choices are required')
+    elif not any(correct for _, correct in choices):
+        errors.append('one choice must be marked correct')
+    explanation = str(raw.get('explanation') or '').strip() or None
+    return {'text': text, 'explanation': explanation, 'choices': choices}, errors
+
+
+def iter_valid(items):
+    """Validate (location, raw) pairs; raises QuestionBankError with up to MAX_ERRORS messages."""
+    errors = []
+    try:
+        for where, raw in items:
+            question, problems = validate_question(raw)
+            if problems:
+                errors.extend(f'{where}: {p}' for p in problems)
+                if len(errors) >= MAX_ERRORS:
+                    break
+                continue
+            if not errors:
+                yield question
+    except QuestionBankError as exc:  # unreadable input ends the scan; keep what was found so far
+        errors.extend(exc.errors)
+    if errors:
+        raise QuestionBankError(errors[:MAX_ERRORS])
+
+
+def insert_questions(conn, question_table, choice_table, quiz_id, questions, start_order=1,
+                     batch_size=IMPORT_BATCH_SIZE):
+    """Insert validated questions in batches: one executemany for the questions
+    (ids come back via RETURNING, which needs SQLAlchemy 2) and one for their choices.
+    Returns (questions, choices).
+
+    Orders are numbered from start_order and must be unique within the batch.
+    """
+    stmt = question_table.insert().returning(question_table.c.id, question_table.c.order)
+    order, n_questions, n_choices = start_order, 0, 0
+    batch = []
+
+    def flush():
+        nonlocal n_questions, n_choices
+        # RETURNING rows of a batched insert come back in no guaranteed order; match them up by `order`
+        ids = dict((o, qid) for qid, o in conn.execute(stmt, [
+            {'quiz_id': quiz_id, 'text': q['text'], 'explanation': q['explanation'], 'order': o} for o, q in batch]))
+        choices = [{'question_id': ids[o], 'text': text, 'is_correct': correct}
+                   for o, q in batch for text, correct in q['choices']]
+        conn.execute(choice_table.insert(), choices)
+        n_questions += len(batch)
+        n_choices += len(choices)
+        batch.clear()
+
+    for q in questions:
+        batch.append((order, q))
+        order += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return n_questions, n_choices
+
+
+def validate_question_bank(source, fmt):
+    """Pass 1: validate a whole question bank before anything is written.
+
+    Returns the handle import_question_bank inserts from; raises
+    QuestionBankError. A source that cannot be rewound is only validated
+    while it is inserted.
+    """
+    started = time.perf_counter()
+    stream = _text_stream(source)
+    count = None
+    if stream.seekable():
+        count = sum(1 for _ in iter_valid(parse(stream, fmt)))
+        stream.seek(0)
+    return {'stream': stream, 'fmt': fmt, 'count': count, 'validate_seconds': time.perf_counter() - started}
+
+
+def import_question_bank(conn, question_table, choice_table, quiz_id, bank, start_order=1):
+    """Bulk insert a bank returned by validate_question_bank; returns a throughput report dict.
+
+    The caller owns the transaction (commit on success, rollback on QuestionBankError).
+    """
+    started = time.perf_counter()
+    n_questions, n_choices = insert_questions(conn, question_table, choice_table, quiz_id,
+                                              iter_valid(parse(bank['stream'], bank['fmt'])), start_order)
+    insert_seconds = time.perf_counter() - started
+    if bank['count'] is not None and n_questions != bank['count']:
+        raise QuestionBankError(['file changed while importing'])
+    total = bank['validate_seconds'] + insert_seconds
+    return {
+        'questions': n_questions,
+        'choices': n_choices,
+        'validate_seconds': round(bank['validate_seconds'], 4),
+        'insert_seconds': round(insert_seconds, 4),
+        'total_seconds': round(total, 4),
+        'questions_per_second': round(n_questions / total) if total > 0 else n_questions,
+    }
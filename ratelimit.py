@@ -0,0 +1,177 @@
+"""Rate limits for the endpoints that are expensive to abuse.
+
+login and register hash a password on every POST, submit_answer and
+submit_quiz write answers during exams and paystack_callback calls the
+Paystack API. Each gets a per-IP limit and a per-account limit (the email
+being tried for login, the signed-in user otherwise), as sliding-window
+counters. The limits are @limiter.limit decorators on the views and are
+checked before the view body runs, so a rejected request costs a constant
+number of counter reads and writes and never hashes a password.
+
+Counters live in a small SQLite file that every worker on the host shares
+(storage URI sqlite:///<path>). Each check is one short write transaction,
+and the file is never fsynced because counters are disposable. A deployment
+with several hosts sets RATELIMIT_STORAGE_URI to redis://... so they all share
+one set of counters.
+"""
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+
+from flask import request, session
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI')  # default: instance/ratelimit.db
+RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+
+LOGIN_PER_IP = os.environ.get('RATELIMIT_LOGIN_IP', '30 per minute; 300 per hour')
+LOGIN_PER_ACCOUNT = os.environ.get('RATELIMIT_LOGIN_ACCOUNT', '10 per 15 minutes')  # failed attempts only
+REGISTER_PER_IP = os.environ.get('RATELIMIT_REGISTER_IP', '20 per minute; 500 per day')
+ANSWER_PER_IP = os.environ.get('RATELIMIT_ANSWER_IP', '3000 per minute')  # a school lab shares one address
+ANSWER_PER_ACCOUNT = os.environ.get('RATELIMIT_ANSWER_ACCOUNT', '120 per minute')
+PAYMENT_PER_IP = os.environ.get('RATELIMIT_PAYMENT_IP', '30 per minute')
+PAYMENT_PER_ACCOUNT = os.environ.get('RATELIMIT_PAYMENT_ACCOUNT', '10 per minute')
+
+PURGE_INTERVAL = 60
+
+
+def client_ip():
+    """The client address, taken from X-Forwarded-For when RATELIMIT_TRUSTED_PROXIES proxies add to it."""
+    if RATELIMIT_TRUSTED_PROXIES:
+        forwarded = [a.strip() for a in request.headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+        if len(forwarded) >= RATELIMIT_TRUSTED_PROXIES:
+            return forwarded[-RATELIMIT_TRUSTED_PROXIES]
+    return request.remote_addr or '-'
+
+
+def login_account():
+    """The email a login attempt is for, so one account cannot be guessed at from many addresses."""
+    return 'email:' + (request.form.get('email', '').strip().lower()[:254] or '-')
+
+
+def current_account():
+    """The signed-in user, read from the session so that no user row is loaded to reject a request."""
+    user_id = session.get('_user_id')
+    return f'user:{user_id}' if user_id else f'ip:{client_ip()}'
+
+
+def failed_login(response):
+    # a failed login renders the form again with 200; redirects, 429s and busy 503s are not failures
+    return response.status_code == 200
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """limits storage in a local SQLite file, shared by every worker process on the host."""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy URLs
+        self.path = uri.split('://', 1)[1][1:]
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self._connect().close()  # create the file and table now, not on the first request
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('CREATE TABLE IF NOT EXISTS counter '
+                     '(key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL) WITHOUT ROWID')
+        return conn
+
+    def _conn(self):
+        # one connection per thread, reopened after a fork
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def _incr(self, conn, key, expiry, amount, now):
+        return conn.execute(
+            'INSERT INTO counter (key, count, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'count = CASE WHEN expires <= ? THEN excluded.count ELSE count + excluded.count END, '
+            'expires = CASE WHEN expires <= ? THEN excluded.expires ELSE expires END '
+            'RETURNING count', (key, amount, now + expiry, now, now)).fetchone()[0]
+
+    def _get(self, conn, key, now):
+        row = conn.execute('SELECT count FROM counter WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return row[0] if row else 0
+
+    def _purge(self, conn, now):
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL
+            conn.execute('DELETE FROM counter WHERE expires <= ?', (now,))
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        conn = self._conn()
+        self._purge(conn, now)
+        return self._incr(conn, key, expiry, amount, now)
+
+    def get(self, key):
+        return self._get(self._conn(), key, time.time())
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._conn().execute('SELECT expires FROM counter WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        self._conn().execute('SELECT 1').fetchone()
+        return True
+
+    def reset(self):
+        return self._conn().execute('DELETE FROM counter').rowcount
+
+    def clear(self, key):
+        self._conn().execute('DELETE FROM counter WHERE key = ?', (key,))
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        conn = self._conn()
+        self._purge(conn, now)
+        # the write lock makes read-check-increment atomic across workers
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            previous, previous_ttl, current, _ = self._window(conn, previous_key, current_key, expiry, now)
+            if floor(previous * previous_ttl / expiry + current) + amount > limit:
+                return False
+            self._incr(conn, current_key, 2 * expiry, amount, now)
+            return True
+        finally:
+            conn.execute('COMMIT')
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._window(self._conn(), previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._conn().execute('DELETE FROM counter WHERE key IN (?, ?)', (previous_key, current_key))
+
+    def _window(self, conn, previous_key, current_key, expiry, now):
+        # same arithmetic as limits' MemoryStorage
+        counts = dict(conn.execute('SELECT key, count FROM counter WHERE key IN (?, ?) AND expires > ?',
+                                   (previous_key, current_key, now)))
+        previous = counts.get(previous_key, 0)
+        current = counts.get(current_key, 0)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous, previous_ttl, current, current_ttl
@@ -0,0 +1,125 @@
+"""Time /admin/analytics on a large dataset: the old per-course count loop and
+full StudentAnswer scan vs. the rollup tables, plus how long a full rollup
+rebuild and an incremental refresh after a day's new activity take.
+Run from workspace root: `python scripts/bench_analytics.py [courses] [students] [answers_per_student]`
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import (app, db, User, Course, Module, Quiz, Question, Choice, CourseProgress, StudentAnswer,
+                 refresh_rollups, upgrade_database)
+
+COURSES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+STUDENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+ANSWERS = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+DAYS = 90
+
+
+def seed(tag, rng):
+    admin = User(full_name='Analytics Admin', email=f'bench_analytics_{tag}@zit.edu', role='admin', password_hash='!')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(Course.__table__.insert(), [
+        {'title': f'Analytics Course {i}', 'description': 'bench', 'instructor_id': admin.id, 'is_approved': True,
+         'created_at': datetime.utcnow()} for i in range(COURSES)])
+    course_ids = [c.id for c in Course.query.filter(Course.title.like('Analytics Course %'))
+                  .order_by(Course.id.desc()).limit(COURSES)]
+    db.session.execute(Quiz.__table__.insert(), [{'course_id': cid, 'title': 'Bench quiz'} for cid in course_ids])
+    quizzes = dict(db.session.query(Quiz.course_id, Quiz.id).filter(Quiz.course_id.in_(course_ids)))
+    db.session.execute(Question.__table__.insert(), [
+        {'quiz_id': quiz_id, 'text': f'Q{i}', 'order': i} for quiz_id in quizzes.values() for i in range(10)])
+    questions = [q for (q,) in db.session.query(Question.id).filter(Question.quiz_id.in_(list(quizzes.values())))]
+    db.session.execute(Choice.__table__.insert(), [
+        {'question_id': q, 'text': 'A', 'is_correct': True} for q in questions])
+    choices = dict(db.session.query(Choice.question_id, Choice.id).filter(Choice.question_id.in_(questions)))
+
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Analytics Student {i}', 'email': f'bench_analytics_{tag}_{i}@zit.edu', 'password_hash': '!',
+         'role': 'student'} for i in range(STUDENTS)])
+    students = [u for (u,) in db.session.query(User.id).filter(User.email.like(f'bench\\_analytics\\_{tag}\\_%', escape='\\'))]
+    now = datetime.utcnow()
+    enrollments, answers = [], []
+    for sid in students:
+        for cid in rng.sample(course_ids, 2):
+            enrolled = now - timedelta(days=rng.random() * DAYS)
+            done = rng.random() < 0.3
+            enrollments.append({'student_id': sid, 'course_id': cid, 'created_at': enrolled, 'completed': done,
+                                'completed_at': min(now, enrolled + timedelta(days=rng.random() * 10)) if done else None})
+        for q in rng.sample(questions, ANSWERS):
+            answers.append({'student_id': sid, 'question_id': q, 'choice_id': choices[q], 'correct': rng.random() < 0.6,
+                            'answered_at': now - timedelta(days=rng.random() * DAYS)})
+    db.session.execute(CourseProgress.__table__.insert(), enrollments)
+    for start in range(0, len(answers), 50000):
+        db.session.execute(StudentAnswer.__table__.insert(), answers[start:start + 50000])
+    db.session.commit()
+    return admin.id, students, questions, choices, course_ids
+
+
+def legacy_analytics():
+    """The pre-rollup admin_analytics queries (week_ago computed with timedelta so it runs on any date)."""
+    for course in Course.query.filter_by(is_approved=True).all():
+        Module.query.filter_by(course_id=course.id).count()
+        CourseProgress.query.filter_by(course_id=course.id).count()
+        CourseProgress.query.filter_by(course_id=course.id, completed=True).count()
+    for i in range(7, 0, -1):
+        CourseProgress.query.filter(CourseProgress.created_at >= datetime.utcnow() - timedelta(days=i)).count()
+    db.session.query(User.full_name, db.func.count(StudentAnswer.id),
+                     db.func.sum(db.func.cast(StudentAnswer.correct, db.Integer)).label('correct'))\
+        .join(StudentAnswer, User.id == StudentAnswer.student_id).group_by(User.id)\
+        .order_by(db.desc('correct')).limit(5).all()
+
+
+def timed(label, fn, engine):
+    statements = [0]
+
+    def on_statement(*args):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', on_statement)
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    event.remove(engine, 'before_cursor_execute', on_statement)
+    print(f'{label:34} {elapsed * 1000:9.1f} ms  statements={statements[0]}')
+    return result
+
+
+def main():
+    upgrade_database()
+    rng = random.Random(7)
+    with app.app_context():
+        admin_id, students, questions, choices, course_ids = seed(time.time_ns(), rng)
+        engine = db.engine
+        print(f'{COURSES} courses, {StudentAnswer.query.count()} answers, {CourseProgress.query.count()} enrollments')
+        timed('full rollup rebuild', lambda: refresh_rollups(full=True), engine)
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(admin_id)
+        sess['_fresh'] = True
+    with app.app_context():
+        timed('legacy queries', legacy_analytics, engine)
+        db.session.remove()
+    timed('/admin/analytics from rollups', lambda: client.get('/admin/analytics'), engine)
+
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.execute(StudentAnswer.__table__.insert(), [
+            {'student_id': sid, 'question_id': q, 'choice_id': choices[q], 'correct': True, 'answered_at': now}
+            for sid in rng.sample(students, 500) for q in rng.sample(questions, 4)
+            if not StudentAnswer.query.filter_by(student_id=sid, question_id=q).first()])
+        db.session.commit()
+        timed('incremental refresh (~2,000 new)', refresh_rollups, engine)
+        timed('rerun inside ROLLUP_LAG', refresh_rollups, engine)
+
+
+if __name__ == '__main__':
+    main()
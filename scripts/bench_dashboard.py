@@ -0,0 +1,69 @@
+"""Measure how many requests per second /dashboard serves with the old
+per-request last_activity commit and with the write-behind tracker.
+Run from workspace root: `python scripts/bench_dashboard.py [requests] [threads]`
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, User, activity_tracker
+
+TOTAL = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+
+def seed_students(n):
+    with app.app_context():
+        db.create_all()
+        ids = []
+        for i in range(n):
+            email = f'bench_student{i}@zit.edu'
+            s = User.query.filter_by(email=email).first()
+            if not s:
+                s = User(full_name=f'Bench Student {i}', email=email, role='student')
+                s.set_password('student123')
+                db.session.add(s)
+                db.session.commit()
+            ids.append(s.id)
+        return ids
+
+
+def run(label, user_ids):
+    per_thread = TOTAL // THREADS
+    errors = []
+
+    def worker(uid):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(uid)
+            sess['_fresh'] = True
+        for _ in range(per_thread):
+            resp = client.get('/dashboard')
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+
+    threads = [threading.Thread(target=worker, args=(user_ids[i % len(user_ids)],)) for i in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    activity_tracker.flush()
+    elapsed = time.perf_counter() - start
+    done = per_thread * THREADS
+    print(f'{label:14} {done} requests in {elapsed:.2f}s -> {done / elapsed:8.1f} req/s ({len(errors)} errors)')
+
+
+if __name__ == '__main__':
+    user_ids = seed_students(THREADS)
+    app.config['WTF_CSRF_ENABLED'] = False
+    print(f'/dashboard, {THREADS} threads, {TOTAL} requests')
+
+    activity_tracker.write_behind = False
+    run('per-request', user_ids)
+
+    activity_tracker.write_behind = True
+    run('write-behind', user_ids)
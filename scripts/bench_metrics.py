@@ -0,0 +1,96 @@
+"""Overhead of the request metrics on /courses.
+
+One process serves /courses in alternating batches with the metrics hooks
+installed and removed (the same state as METRICS_ENABLED=0), so machine
+drift hits both modes alike; the overhead is the median difference between
+neighbouring on/off batches. Batches are timed in process CPU time, which
+other load on a shared machine disturbs far less than wall-clock time.
+Measured both from the page cache (the common case, where fixed
+per-request costs weigh most) and rendered on every request.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/bench_metrics.py [batches] [batch_size]`
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BATCHES = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+COURSES = 300
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "metrics.db")}'
+os.environ['METRICS_ENABLED'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import metrics
+import app as app_module
+from app import app, db, User, Course, request_metrics, upgrade_database
+
+
+def install(on, timed=app.wsgi_app):
+    app.wsgi_app = timed if on else timed.__wrapped__
+    for name, listener in (('before_cursor_execute', metrics._before_cursor_execute),
+                           ('after_cursor_execute', metrics._after_cursor_execute)):
+        if on and not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+        elif not on and event.contains(Engine, name, listener):
+            event.remove(Engine, name, listener)
+    if on:
+        before_render_template.connect(request_metrics._before_render, app)
+        template_rendered.connect(request_metrics._after_render, app)
+    else:
+        before_render_template.disconnect(request_metrics._before_render, app)
+        template_rendered.disconnect(request_metrics._after_render, app)
+
+
+def measure(client):
+    times = {False: [], True: []}
+    for batch in range(BATCHES):
+        for on in (False, True) if batch % 2 == 0 else (True, False):
+            install(on)
+            start = time.process_time()
+            for _ in range(BATCH_SIZE):
+                client.get('/courses')
+            times[on].append((time.process_time() - start) / BATCH_SIZE * 1e6)
+    install(True)
+    overhead = statistics.median(on - off for off, on in zip(times[False], times[True]))
+    return statistics.median(times[False]), statistics.median(times[True]), overhead
+
+
+def main():
+    app.logger.disabled = True
+    request_metrics.directory = _tmp.name
+    upgrade_database()
+    with app.app_context():
+        instructor = User(full_name='Metrics Instructor', email='bench_metrics@zit.edu', role='instructor', password_hash='!')
+        db.session.add(instructor)
+        db.session.flush()
+        db.session.execute(Course.__table__.insert(), [
+            {'title': f'Course {i}', 'description': 'Benchmark course ' * 20, 'instructor_id': instructor.id,
+             'is_approved': True} for i in range(COURSES)])
+        db.session.commit()
+    client = app.test_client()
+    for _ in range(BATCH_SIZE):
+        client.get('/courses')
+    print(f'{BATCHES} batches of {BATCH_SIZE} GET /courses per mode, interleaved')
+    for case in ('page cache', 'rendered'):
+        if case == 'rendered':
+            app_module.catalogue_cache.max_entries = 0
+            app_module.catalogue_cache.invalidate()
+        off, on, overhead = measure(client)
+        print(f'{case:10}  metrics off {off:7.1f} us/request  on {on:7.1f} us/request CPU  '
+              f'overhead {overhead:+6.1f} us ({overhead / off * 100:+.2f}%)')
+    requests = sum(int(line.rsplit(' ', 1)[1]) for line in request_metrics.render().splitlines()
+                   if line.startswith('zit_http_requests_total{endpoint="courses"'))
+    print(f'recorded {requests} /courses requests')
+
+
+if __name__ == '__main__':
+    main()
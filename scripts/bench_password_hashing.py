@@ -0,0 +1,190 @@
+"""Login throughput and tail latency with password hashing inline vs. on the
+bounded pool, for a few hash methods.
+
+CLIENTS threads post valid logins as fast as they can while PAGE_CLIENTS
+threads browse /courses, against WORKERS forked worker processes sharing one
+socket. A client shed with 503 waits Retry-After before trying again.
+Reports logins/s (total and per core), login p50/p95/p99, how many
+logins were shed with 503, and /courses latency during the storm. Then checks
+rehash-on-login: accounts stored with an older cost are upgraded after one
+login and still sign in afterwards.
+Rate limits are off, so every request reaches the hasher.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/bench_password_hashing.py [clients] [seconds] [workers]`
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 15
+WORKERS = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+PAGE_CLIENTS = 2
+USERS = 50
+REHASH_USERS = 20
+CORES = os.cpu_count() or 1
+PHASES = [
+    ('pbkdf2 600k, inline', 'pbkdf2:sha256:600000', 0),
+    ('pbkdf2 600k, pool', 'pbkdf2:sha256:600000', CORES),
+    ('pbkdf2 300k, pool', 'pbkdf2:sha256:300000', CORES),
+    ('scrypt 2^15, pool', 'scrypt:32768:8:1', CORES),
+]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "passwords.db")}'
+os.environ['RATELIMIT_ENABLED'] = '0'
+os.environ['METRICS_ENABLED'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+import passwords
+from app import app, db, User, password_service, upgrade_database
+
+PASSWORD = 'Student-pass-123'
+
+
+def configure(method, workers):
+    password_service.method = passwords.normalize_method(method)
+    password_service.workers = workers
+
+
+def seed():
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Student {i}', 'email': f'student_{i}@zit.edu', 'password_hash': '!', 'role': 'student'}
+        for i in range(USERS)])
+    db.session.commit()
+
+
+def set_all_hashes(method):
+    # one hash shared by every account; each login still verifies it in full
+    pwhash = generate_password_hash(PASSWORD, method)
+    User.query.update({'password_hash': pwhash})
+    db.session.commit()
+
+
+def serve(server, method, workers):
+    app.config['WTF_CSRF_ENABLED'] = False
+    configure(method, workers)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server.serve_forever()
+
+
+def start_servers(method, workers):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.socket.listen(1024)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=serve, args=(server, method, workers), daemon=True)
+                 for _ in range(WORKERS)]
+    for p in processes:
+        p.start()
+    server.socket.close()  # the workers hold their own copies
+    return f'http://127.0.0.1:{server.port}', processes
+
+
+def login_client(base_url, index, stop, results):
+    session = requests.Session()
+    n = index
+    while not stop.is_set():
+        session.cookies.clear()
+        start = time.perf_counter()
+        resp = session.post(f'{base_url}/login', data={'email': f'student_{n % USERS}@zit.edu', 'password': PASSWORD},
+                            allow_redirects=False, timeout=300)
+        ms = (time.perf_counter() - start) * 1000
+        if resp.status_code == 302:
+            results['login'].append(ms)
+        elif resp.status_code == 503:
+            results['shed'].append(ms)
+            stop.wait(int(resp.headers.get('Retry-After', 1)))  # as a person would
+        else:
+            results['errors'].append(resp.status_code)
+        n += CLIENTS
+
+
+def page_client(base_url, stop, results):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        resp = session.get(f'{base_url}/courses', timeout=300)
+        results['pages'].append((time.perf_counter() - start) * 1000)
+        if resp.status_code != 200:
+            results['errors'].append(resp.status_code)
+        stop.wait(0.05)
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float('nan')
+
+
+def phase(label, method, workers):
+    with app.app_context():
+        set_all_hashes(method)
+    base_url, processes = start_servers(method, workers)
+    stop = threading.Event()
+    results = {'login': [], 'shed': [], 'pages': [], 'errors': []}
+    threads = [threading.Thread(target=login_client, args=(base_url, i, stop, results)) for i in range(CLIENTS)]
+    threads += [threading.Thread(target=page_client, args=(base_url, stop, results)) for _ in range(PAGE_CLIENTS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.terminate()
+
+    logins = sorted(results['login'])
+    pages = sorted(results['pages'])
+    rate = len(logins) / elapsed
+    print(f'{label:20} {rate:6.2f} logins/s ({rate / CORES:5.2f}/core)  '
+          f'p50 {percentile(logins, 0.5):7.0f}  p95 {percentile(logins, 0.95):7.0f}  '
+          f'p99 {percentile(logins, 0.99):7.0f} ms  shed {len(results["shed"]):4}  '
+          f'/courses p50 {percentile(pages, 0.5):6.1f}  p99 {percentile(pages, 0.99):7.1f} ms  '
+          f'errors {len(results["errors"])}')
+
+
+def check_rehash():
+    old_method = 'pbkdf2:sha256:260000'
+    configure(passwords.PASSWORD_HASH_METHOD, CORES)
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        old_hash = generate_password_hash(PASSWORD, old_method)
+        User.query.filter(User.id <= REHASH_USERS).update({'password_hash': old_hash})
+        db.session.commit()
+    client = app.test_client()
+    for i in range(REHASH_USERS):
+        client.post('/login', data={'email': f'student_{i}@zit.edu', 'password': PASSWORD})
+        client.get('/logout')
+    deadline = time.monotonic() + 60
+    while password_service.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    with app.app_context():
+        users = User.query.filter(User.id <= REHASH_USERS).all()
+        upgraded = sum(1 for u in users if u.password_hash.startswith(password_service.method + '$'))
+    ok = sum(client.post('/login', data={'email': f'student_{i}@zit.edu', 'password': PASSWORD}).status_code == 302
+             and client.get('/logout').status_code == 302 for i in range(REHASH_USERS))
+    print(f'rehash-on-login: {upgraded}/{REHASH_USERS} accounts moved from {old_method} to '
+          f'{password_service.method} after one login; {ok}/{REHASH_USERS} sign in with the new hash')
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        seed()
+    print(f'{CLIENTS} login clients and {PAGE_CLIENTS} /courses clients, {WORKERS} worker process(es), '
+          f'{CORES} core(s), {SECONDS:g}s per phase')
+    for label, method, workers in PHASES:
+        phase(label, method, workers)
+    check_rehash()
+
+
+if __name__ == '__main__':
+    main()
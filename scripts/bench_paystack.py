@@ -0,0 +1,177 @@
+"""Benchmark the Paystack client and callback against the local stub server.
+1. N verify calls with a fresh connection each time vs. the pooled client.
+2. Verify success rate when the stub fails a share of calls (retries on).
+3. /paystack_callback response time with synchronous vs. background verification.
+4. A burst of signed webhooks (each delivered twice): ack latency, time until
+   every enrollment is applied, and `reconcile-payments` over pending references.
+Run from workspace root: `python scripts/bench_paystack.py [calls] [latency_s] [fail_rate] [webhooks]`
+"""
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client address; the per-IP limits would reject the load itself
+
+import requests
+
+from paystack_stub import StubPaystack
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+FAIL_RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+WEBHOOKS = int(sys.argv[4]) if len(sys.argv) > 4 else 500
+
+stub = StubPaystack(latency=LATENCY).start()
+os.environ['PAYSTACK_BASE_URL'] = stub.url
+os.environ.setdefault('PAYSTACK_SECRET_KEY', 'sk_test_stub')
+os.environ.setdefault('PAYSTACK_BACKOFF', '0.05')
+
+from paystack import PaystackClient  # noqa: E402  (reads the env set above)
+from werkzeug.security import generate_password_hash  # noqa: E402
+from app import app, db, User, Course, CourseProgress, Payment, upgrade_database  # noqa: E402
+
+
+def stats():
+    return requests.get(f'{stub.url}/__stats').json()
+
+
+def time_verifies(client, label):
+    before = stats()
+    start = time.perf_counter()
+    for i in range(CALLS):
+        client.verify_transaction(f'stub-1-1-{i}')
+    elapsed = time.perf_counter() - start
+    after = stats()
+    print(f'{label:10} {elapsed / CALLS * 1000:7.1f} ms/call  '
+          f'new connections={after["connections"] - before["connections"]}')
+
+
+def bench_client():
+    print(f'-- {CALLS} verify calls, stub latency {LATENCY * 1000:.0f} ms')
+    time_verifies(PaystackClient(os.environ['PAYSTACK_SECRET_KEY'], stub.url, pooled=False), 'unpooled')
+    time_verifies(PaystackClient(os.environ['PAYSTACK_SECRET_KEY'], stub.url), 'pooled')
+
+    print(f'-- stub failing {FAIL_RATE:.0%} of calls')
+    stub.fail_rate = FAIL_RATE
+    for retries in (0, 3):
+        client = PaystackClient(os.environ['PAYSTACK_SECRET_KEY'], stub.url, retries=retries, backoff=0.05)
+        ok = 0
+        for i in range(CALLS):
+            try:
+                client.verify_transaction(f'stub-1-1-{i}')
+                ok += 1
+            except requests.RequestException:
+                pass
+        print(f'retries={retries}  succeeded {ok}/{CALLS}')
+    stub.fail_rate = 0.0
+
+
+def bench_callback():
+    upgrade_database()
+    with app.app_context():
+        student = User.query.filter_by(email='bench_payer@zit.edu').first()
+        if not student:
+            student = User(full_name='Bench Payer', email='bench_payer@zit.edu', role='student')
+            student.set_password('student123')
+            db.session.add(student)
+        course = Course.query.filter_by(title='Paystack Benchmark Course').first()
+        if not course:
+            course = Course(title='Paystack Benchmark Course', description='bench', instructor_id=student.id,
+                            price=5000)
+            db.session.add(course)
+        db.session.commit()
+        student_id, course_id = student.id, course.id
+
+    client = app.test_client()
+    print(f'-- /paystack_callback, stub latency {LATENCY * 1000:.0f} ms')
+    for mode in (False, True):
+        app.config['PAYSTACK_VERIFY_ASYNC'] = mode
+        refs, times = [], []
+        for i in range(20):
+            ref = f'stub-{course_id}-{student_id}-{time.time_ns()}'
+            start = time.perf_counter()
+            resp = client.get(f'/paystack_callback?reference={ref}')
+            times.append((time.perf_counter() - start) * 1000)
+            assert resp.status_code in (200, 302), resp.status_code
+            refs.append(ref)
+        deadline = time.time() + 30
+        with app.app_context():
+            while Payment.query.filter(Payment.reference.in_(refs), Payment.status == 'pending').count():
+                if time.time() > deadline:
+                    break
+                time.sleep(0.05)
+            done = Payment.query.filter(Payment.reference.in_(refs), Payment.status == 'success').count()
+        label = 'background' if mode else 'synchronous'
+        print(f'{label:12} p50 {statistics.median(times):7.1f} ms  max {max(times):7.1f} ms  enrolled {done}/{len(refs)}')
+
+
+def bench_webhooks():
+    with app.app_context():
+        course_id = Course.query.filter_by(title='Paystack Benchmark Course').first().id
+        prefix = f'bench_hook{time.time_ns()}'
+        password_hash = generate_password_hash('student123')  # shared; benchmark accounts only
+        db.session.execute(User.__table__.insert(), [
+            {'full_name': f'Webhook Payer {i}', 'email': f'{prefix}_{i}@zit.edu', 'password_hash': password_hash,
+             'role': 'student'} for i in range(WEBHOOKS)])
+        db.session.commit()
+        student_ids = [u.id for u in User.query.filter(User.email.like(f'{prefix}\\_%', escape='\\'))]
+
+    secret = os.environ['PAYSTACK_SECRET_KEY'].encode()
+    client = app.test_client()
+    refs, times = [], []
+    print(f'-- {len(student_ids)} signed charge.success webhooks, each delivered twice')
+    start = time.perf_counter()
+    for _ in range(2):
+        for student_id in student_ids:
+            ref = f'{prefix}-{student_id}'
+            body = json.dumps({'event': 'charge.success', 'data': {
+                'reference': ref, 'status': 'success', 'amount': 500000, 'currency': 'NGN',
+                'customer': {'email': ''}, 'metadata': {'course_id': course_id, 'student_id': student_id}}}).encode()
+            signature = hmac.new(secret, body, hashlib.sha512).hexdigest()
+            t = time.perf_counter()
+            resp = client.post('/paystack/webhook', data=body, content_type='application/json',
+                               headers={'X-Paystack-Signature': signature})
+            times.append((time.perf_counter() - t) * 1000)
+            assert resp.status_code == 200, resp.status_code
+            refs.append(ref)
+    refs = sorted(set(refs))
+    bad = client.post('/paystack/webhook', data=b'{}', headers={'X-Paystack-Signature': 'bad'})
+    with app.app_context():
+        while Payment.query.filter(Payment.reference.in_(refs), Payment.applied_at.is_(None)).count():
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        enrolled = CourseProgress.query.filter(CourseProgress.course_id == course_id,
+                                               CourseProgress.student_id.in_(student_ids)).count()
+    times.sort()
+    print(f'ack p50 {times[len(times) // 2]:.1f} ms  p99 {times[int(len(times) * 0.99)]:.1f} ms  '
+          f'all applied after {elapsed:.2f}s  enrollments {enrolled}/{len(student_ids)}  '
+          f'bad signature -> {bad.status_code}')
+
+    with app.app_context():
+        db.session.execute(Payment.__table__.insert(), [
+            {'reference': f'stub-{course_id}-{student_id}-reconcile', 'course_id': course_id, 'status': 'pending',
+             'created_at': datetime.utcnow()} for student_id in student_ids[:100]])
+        db.session.commit()
+    print('-- reconcile-payments over 100 pending references')
+    start = time.perf_counter()
+    result = app.test_cli_runner().invoke(args=['reconcile-payments'])
+    print(result.output.strip(), f'({time.perf_counter() - start:.2f}s)')
+
+
+def main():
+    try:
+        bench_client()
+        bench_callback()
+        bench_webhooks()
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Cost of the request profiler on rendered /courses pages.
+
+Disarmed: alternating batches with the profiler's WSGI wrapper in and out of
+the chain, timed in process CPU time; the overhead is the median difference
+between neighbouring batches. Armed: the same page profiled on every request
+in each mode, with the size of the profile files it leaves behind, and a
+check that retention holds the directory at PROFILE_MAX_FILES.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/bench_profiling.py [batches] [batch_size]`
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BATCHES = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+PROFILED = 100
+COURSES = 300
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "profiling.db")}'
+os.environ['METRICS_ENABLED'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app, db, User, Course, request_profiler, upgrade_database
+
+
+def batch(client):
+    start = time.process_time()
+    for _ in range(BATCH_SIZE):
+        client.get('/courses')
+    return (time.process_time() - start) / BATCH_SIZE * 1e3
+
+
+def main():
+    app.logger.disabled = True
+    request_profiler.directory = os.path.join(_tmp.name, 'profiles')
+    os.makedirs(request_profiler.directory)
+    upgrade_database()
+    with app.app_context():
+        instructor = User(full_name='Profiling Instructor', email='bench_profiling@zit.edu', role='instructor',
+                          password_hash='!')
+        db.session.add(instructor)
+        db.session.flush()
+        db.session.execute(Course.__table__.insert(), [
+            {'title': f'Course {i}', 'description': 'Benchmark course ' * 20, 'instructor_id': instructor.id,
+             'is_approved': True} for i in range(COURSES)])
+        db.session.commit()
+    app_module.catalogue_cache.max_entries = 0
+    app_module.catalogue_cache.invalidate()
+    client = app.test_client()
+    profiled = app.wsgi_app
+    bare = profiled.__wrapped__
+    batch(client)
+
+    times = {False: [], True: []}
+    for n in range(BATCHES):
+        for on in (False, True) if n % 2 == 0 else (True, False):
+            app.wsgi_app = profiled if on else bare
+            times[on].append(batch(client))
+    app.wsgi_app = profiled
+    off = statistics.median(times[False])
+    overhead = statistics.median(on - off for off, on in zip(times[False], times[True]))
+    print(f'{BATCHES} batches of {BATCH_SIZE} rendered GET /courses per mode, interleaved')
+    print(f'disarmed: {off:.2f} ms CPU/request without the wrapper, {overhead * 1000:+.1f} us with it '
+          f'({overhead / off * 100:+.2f}%)')
+
+    for mode in ('cprofile', 'sample'):
+        request_profiler.clear()
+        request_profiler.arm(endpoint='courses', mode=mode)
+        start = time.perf_counter()
+        for _ in range(PROFILED):
+            client.get('/courses')
+        ms = (time.perf_counter() - start) / PROFILED * 1000
+        request_profiler.disarm()
+        start = time.perf_counter()
+        for _ in range(PROFILED):
+            client.get('/courses')
+        base = (time.perf_counter() - start) / PROFILED * 1000
+        files = request_profiler.profiles()
+        size = statistics.median(p['size'] for p in files) if files else 0
+        print(f'{mode:8}: {ms:6.2f} ms/request profiled vs {base:6.2f} ms unprofiled '
+              f'({ms / base:.1f}x), {len(files)} files of {size / 1024:.0f} KB median')
+
+    request_profiler.clear()
+    request_profiler.max_files = 20
+    request_profiler.arm(endpoint='courses')
+    for _ in range(50):
+        client.get('/courses')
+    request_profiler.disarm()
+    files = request_profiler.profiles()
+    print(f'retention: 50 profiled requests with max_files=20 left {len(files)} files, '
+          f'{sum(p["size"] for p in files) / 1024:.0f} KB')
+
+
+if __name__ == '__main__':
+    main()
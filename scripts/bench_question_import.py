@@ -0,0 +1,95 @@
+"""Compare the old create_quiz insert loop (flush per question, one Choice at a
+time) with the bulk question-bank import from JSON and CSV: wall time, SQL
+statements and how long the write transaction was open.
+Run from workspace root: `python scripts/bench_question_import.py [questions] [choices]`
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, User, Course, Quiz, Question, Choice, describe_import, import_questions, upgrade_database
+
+QUESTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+CHOICES = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+
+def bank():
+    return [{'text': f'Question {i}: which option is right?', 'explanation': f'Option {i % CHOICES} is right.',
+             'choices': [{'text': f'Option {c}', 'is_correct': c == i % CHOICES} for c in range(CHOICES)]}
+            for i in range(QUESTIONS)]
+
+
+def as_csv(questions):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['question', 'explanation', 'correct'] + [f'choice_{c + 1}' for c in range(CHOICES)])
+    for q in questions:
+        correct = next(i for i, c in enumerate(q['choices'], start=1) if c['is_correct'])
+        writer.writerow([q['text'], q['explanation'], correct] + [c['text'] for c in q['choices']])
+    return out.getvalue().encode()
+
+
+def legacy_insert(quiz_id, questions):
+    for idx, q in enumerate(questions, start=1):
+        question = Question(quiz_id=quiz_id, text=q.get('text', ''), explanation=q.get('explanation'), order=idx)
+        db.session.add(question)
+        db.session.flush()
+        for choice in q.get('choices', []):
+            db.session.add(Choice(question_id=question.id, text=choice.get('text', ''),
+                                  is_correct=bool(choice.get('is_correct', False))))
+
+
+def run(label, course_id, fn):
+    counts = {'statements': 0, 'first_write': None}
+
+    def on_statement(conn, cursor, statement, *args):
+        counts['statements'] += 1
+        if counts['first_write'] is None and statement.lstrip().upper().startswith('INSERT INTO QUESTION'):
+            counts['first_write'] = time.perf_counter()
+
+    quiz = Quiz(course_id=course_id, title=f'Import benchmark {label}')
+    db.session.add(quiz)
+    db.session.commit()
+    event.listen(db.engine, 'before_cursor_execute', on_statement)
+    start = time.perf_counter()
+    report = fn(quiz.id)
+    db.session.commit()
+    end = time.perf_counter()
+    event.remove(db.engine, 'before_cursor_execute', on_statement)
+    assert Question.query.filter_by(quiz_id=quiz.id).count() == QUESTIONS
+    line = (f'{label:14} {end - start:7.3f}s  {QUESTIONS / (end - start):8.0f} questions/s  '
+            f'statements={counts["statements"]:6}  write lock held {end - counts["first_write"]:.3f}s')
+    print(line)
+    if report:
+        print(f'{"":14} {describe_import(report)}')
+
+
+def main():
+    upgrade_database()
+    questions = bank()
+    json_bytes, csv_bytes = json.dumps(questions).encode(), as_csv(questions)
+    with app.app_context():
+        tag = time.time_ns()
+        instructor = User(full_name='Import Instructor', email=f'bench_import_{tag}@zit.edu', role='instructor',
+                          password_hash='!')
+        db.session.add(instructor)
+        db.session.flush()
+        course = Course(title='Import Benchmark Course', description='bench', instructor_id=instructor.id)
+        db.session.add(course)
+        db.session.commit()
+        print(f'{QUESTIONS} questions x {CHOICES} choices '
+              f'(JSON {len(json_bytes) / 1024:.0f} KB, CSV {len(csv_bytes) / 1024:.0f} KB)')
+        run('per-row flush', course.id, lambda quiz_id: legacy_insert(quiz_id, questions))
+        run('bulk JSON', course.id, lambda quiz_id: import_questions(quiz_id, io.BytesIO(json_bytes), 'json'))
+        run('bulk CSV', course.id, lambda quiz_id: import_questions(quiz_id, io.BytesIO(csv_bytes), 'csv'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Seed a large quiz (default 40 questions x 500 students, every question
+answered) and time /quiz/<id>/results and /quiz/<id>/export.csv with their
+SQL statement counts.
+Run from workspace root: `python scripts/bench_quiz_results.py [questions] [students]`
+Seeding is idempotent; rerunning reuses the existing benchmark quiz.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db, User, Course, Quiz, Question, Choice, StudentAnswer, upgrade_database
+
+QUESTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+STUDENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+CHOICES = 4
+
+
+def seed_benchmark_quiz():
+    """Return (quiz_id, instructor_id), creating the fixture on first use."""
+    instructor = User.query.filter_by(email='bench_instructor@zit.edu').first()
+    if not instructor:
+        instructor = User(full_name='Bench Instructor', email='bench_instructor@zit.edu', role='instructor')
+        instructor.set_password('instructor123')
+        db.session.add(instructor)
+        db.session.commit()
+
+    title = f'Benchmark Quiz {QUESTIONS}x{STUDENTS}'
+    quiz = Quiz.query.filter_by(title=title).first()
+    if quiz:
+        return quiz.id, instructor.id
+
+    course = Course(title='Benchmark Course', description='Quiz results benchmark', instructor_id=instructor.id)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(course_id=course.id, title=title)
+    db.session.add(quiz)
+    db.session.flush()
+
+    db.session.execute(Question.__table__.insert(), [
+        {'quiz_id': quiz.id, 'text': f'Question {i}', 'explanation': None, 'order': i}
+        for i in range(1, QUESTIONS + 1)])
+    q_ids = [q.id for q in Question.query.filter_by(quiz_id=quiz.id).order_by(Question.order)]
+    db.session.execute(Choice.__table__.insert(), [
+        {'question_id': q_id, 'text': f'Option {c}', 'is_correct': c == 0}
+        for q_id in q_ids for c in range(CHOICES)])
+    choices = {}
+    for c in Choice.query.filter(Choice.question_id.in_(q_ids)):
+        choices.setdefault(c.question_id, []).append(c)
+
+    # one shared hash keeps seeding fast; these accounts are for benchmarks only
+    password_hash = generate_password_hash('student123')
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Bench Quiz Student {quiz.id}-{i}', 'email': f'bench_quiz{quiz.id}_{i}@zit.edu',
+         'password_hash': password_hash, 'role': 'student'}
+        for i in range(STUDENTS)])
+    student_ids = [u.id for u in User.query.filter(User.email.like(f'bench_quiz{quiz.id}\\_%', escape='\\'))]
+
+    rng = random.Random(quiz.id)
+    rows = []
+    for student_id in student_ids:
+        for q_id in q_ids:
+            choice = rng.choice(choices[q_id])
+            rows.append({'student_id': student_id, 'question_id': q_id, 'choice_id': choice.id,
+                         'correct': bool(choice.is_correct)})
+    db.session.execute(StudentAnswer.__table__.insert(), rows)
+    db.session.commit()
+    return quiz.id, instructor.id
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        start = time.perf_counter()
+        quiz_id, instructor_id = seed_benchmark_quiz()
+        print(f'fixture ready in {time.perf_counter() - start:.2f}s: quiz {quiz_id}, {QUESTIONS} questions x {STUDENTS} students')
+        engines = list(db.engines.values())  # the primary and, with read routing, the read bind
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(instructor_id)
+        sess['_fresh'] = True
+    client.get('/health')
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    for url in (f'/quiz/{quiz_id}/results', f'/quiz/{quiz_id}/export.csv'):
+        statements.clear()
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', listener)
+        start = time.perf_counter()
+        resp = client.get(url)
+        size = len(resp.get_data())
+        elapsed = time.perf_counter() - start
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', listener)
+        print(f'{url:28} status={resp.status_code} {elapsed * 1000:8.1f} ms  statements={len(statements)}  bytes={size}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compare a class taking a quiz one question per POST with whole-quiz batch
+submission: wall time, SQL statements and write transactions.
+Run from workspace root: `python scripts/bench_quiz_submit.py [questions] [students]`
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client address; the per-IP limits would reject the load itself
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db, User, Course, Quiz, Question, Choice, upgrade_database
+
+QUESTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+STUDENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+def seed():
+    """Return (quiz_id, {question_id: [choice_id]}, {mode: [student_id]}) for a fresh quiz."""
+    tag = time.time_ns()
+    instructor = User(full_name='Bench Instructor', email=f'bench_submit_{tag}@zit.edu', role='instructor',
+                      password_hash='!')
+    db.session.add(instructor)
+    db.session.flush()
+    course = Course(title='Submit Benchmark Course', description='bench', instructor_id=instructor.id)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(course_id=course.id, title=f'Submit Benchmark {tag}')
+    db.session.add(quiz)
+    db.session.flush()
+    db.session.execute(Question.__table__.insert(), [
+        {'quiz_id': quiz.id, 'text': f'Question {i}', 'explanation': 'because', 'order': i}
+        for i in range(1, QUESTIONS + 1)])
+    q_ids = [q.id for q in Question.query.filter_by(quiz_id=quiz.id)]
+    db.session.execute(Choice.__table__.insert(), [
+        {'question_id': q_id, 'text': f'Option {c}', 'is_correct': c == 0} for q_id in q_ids for c in range(4)])
+    choices = {}
+    for c in Choice.query.filter(Choice.question_id.in_(q_ids)):
+        choices.setdefault(c.question_id, []).append(c.id)
+
+    password_hash = generate_password_hash('student123')  # shared; benchmark accounts only
+    students = {}
+    for mode in ('per-question', 'batch'):
+        db.session.execute(User.__table__.insert(), [
+            {'full_name': f'Submit Student {i}', 'email': f'bench_submit_{tag}_{mode}_{i}@zit.edu',
+             'password_hash': password_hash, 'role': 'student'} for i in range(STUDENTS)])
+        students[mode] = [u.id for u in User.query.filter(User.email.like(f'bench_submit_{tag}_{mode}_%'))]
+    db.session.commit()
+    return quiz.id, choices, students
+
+
+def run(mode, quiz_id, choices, student_ids, engine):
+    client = app.test_client()
+    rng = random.Random(1)
+    counts = {'statements': 0, 'commits': 0}
+
+    def on_statement(*args):
+        counts['statements'] += 1
+
+    def on_commit(conn):
+        counts['commits'] += 1
+
+    event.listen(engine, 'before_cursor_execute', on_statement)
+    event.listen(engine, 'commit', on_commit)
+    start = time.perf_counter()
+    for student_id in student_ids:
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(student_id)
+            sess['_fresh'] = True
+        picks = {q_id: rng.choice(c_ids) for q_id, c_ids in choices.items()}
+        if mode == 'batch':
+            resp = client.post(f'/quiz/{quiz_id}/submit', json={'answers': picks})
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+        else:
+            for q_id, c_id in picks.items():
+                resp = client.post(f'/quiz/{quiz_id}/answer/{q_id}', json={'choice_id': c_id})
+                assert resp.status_code == 200, resp.get_data(as_text=True)
+    elapsed = time.perf_counter() - start
+    event.remove(engine, 'before_cursor_execute', on_statement)
+    event.remove(engine, 'commit', on_commit)
+    print(f'{mode:13} {elapsed:7.2f}s  statements={counts["statements"]:6}  write transactions={counts["commits"]}')
+
+
+def main():
+    upgrade_database()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        quiz_id, choices, students = seed()
+        engine = db.engine
+    print(f'{STUDENTS} students x {QUESTIONS} questions (login/session statements included)')
+    for mode in ('per-question', 'batch'):
+        run(mode, quiz_id, choices, students[mode], engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Long CSV exports vs. quiz-answer writes, with and without read/write routing.
+
+More slow export downloads than the primary pool has connections (5 + 10
+overflow by default) stream /admin/export/enrollments.csv while students
+keep answering. Without routing every export holds a primary connection
+until the download ends and the writers queue for the pool. With routing the
+exports use the read bind's own pool. Reports answer latency, errors and
+how many statements ran on each bind.
+Each mode runs in its own process against a fresh SQLite file.
+Run from workspace root: `python scripts/bench_read_routing.py [exports] [seconds]`
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client address; the per-IP limits would reject the load itself
+
+EXPORTS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+WRITERS = 4
+
+
+def run_mode():
+    from flask import got_request_exception
+    from sqlalchemy import event
+
+    from load_db_concurrency import seed
+    from app import app, db, User, upgrade_database
+
+    app.logger.disabled = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    upgrade_database()
+    with app.app_context():
+        course_id, quiz_id, choices, student_ids = seed(time.time_ns(), 20000)
+        admin = User(full_name='Routing Admin', email=f'routing_{time.time_ns()}@zit.edu', role='admin', password_hash='!')
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        statements = {key or 'primary': 0 for key in db.engines}
+        for key, engine in db.engines.items():
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *args, key=key or 'primary': statements.__setitem__(key, statements[key] + 1))
+    errors = []
+    got_request_exception.connect(lambda sender, exception, **extra: errors.append(type(exception).__name__), app)
+    deadline = time.time() + SECONDS
+    latencies, exports_done = [], [0]
+    lock = threading.Lock()
+
+    def exporter():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(admin_id)
+            sess['_fresh'] = True
+        while time.time() < deadline:
+            resp = client.get('/admin/export/enrollments.csv', buffered=False)
+            for _ in resp.response:
+                time.sleep(0.05)  # a slow client
+            resp.close()
+            with lock:
+                exports_done[0] += 1
+
+    def writer(index):
+        rng = random.Random(index)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(student_ids[index])
+            sess['_fresh'] = True
+        while time.time() < deadline:
+            question_id = rng.choice(list(choices))
+            start = time.perf_counter()
+            resp = client.post(f'/quiz/{quiz_id}/answer/{question_id}', json={'choice_id': choices[question_id][0]})
+            with lock:
+                if resp.status_code == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=exporter) for _ in range(EXPORTS)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    print(json.dumps({'answers': len(latencies), 'exports': exports_done[0], 'errors': len(errors),
+                      'p50': statistics.median(latencies) if latencies else None,
+                      'max': latencies[-1] if latencies else None, 'statements': statements}))
+
+
+def main():
+    if os.environ.get('BENCH_ROUTING_CHILD'):
+        return run_mode()
+    print(f'{EXPORTS} slow exports + {WRITERS} answering students for {SECONDS:g}s')
+    with tempfile.TemporaryDirectory() as tmp:
+        for routing in ('0', '1'):
+            env = dict(os.environ, BENCH_ROUTING_CHILD='1', DB_READ_ROUTING=routing,
+                       DATABASE_URL=f'sqlite:///{os.path.join(tmp, f"routing{routing}.db")}')
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), str(EXPORTS), str(SECONDS)],
+                                 env=env, cwd=ROOT, capture_output=True, text=True)
+            lines = [line for line in out.stdout.splitlines() if line.startswith('{')]
+            if out.returncode or not lines:
+                print(out.stderr[-2000:])
+                continue
+            r = json.loads(lines[-1])
+            label = 'routing on' if routing == '1' else 'routing off'
+            p50 = f"{r['p50']:.1f}" if r['p50'] is not None else '-'
+            worst = f"{r['max']:.0f}" if r['max'] is not None else '-'
+            print(f"{label:12} answers={r['answers']:5}  answer p50 {p50} ms  max {worst} ms  "
+                  f"exports={r['exports']}  errors={r['errors']}  statements={r['statements']}")
+
+
+if __name__ == '__main__':
+    main()
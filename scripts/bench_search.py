@@ -0,0 +1,121 @@
+"""Search latency on a large catalogue: ranked /api/search pages and
+/api/search/suggest autocomplete served from the FTS5 index, against the
+LIKE scan that is the only option without it. Also times a full reindex and
+the per-write cost of the hooks in create_module.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/bench_search.py [modules] [words_per_module]`
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+MODULES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+WORDS = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+MODULES_PER_COURSE = 50
+VOCABULARY = 8000
+RUNS = 30
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "search.db")}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+import search
+from app import app, db, User, Course, Module, upgrade_database
+
+
+def vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def seed(rng, words):
+    # Zipf-like: a few very common words, a long tail of rare ones
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    instructor = User(full_name='Search Instructor', email='bench_search@zit.edu', role='instructor', password_hash='!')
+    db.session.add(instructor)
+    db.session.flush()
+    courses = MODULES // MODULES_PER_COURSE
+    db.session.execute(Course.__table__.insert(), [
+        {'title': ' '.join(rng.choices(words[:2000], k=3)).title(), 'description': ' '.join(rng.choices(words, weights, k=40)),
+         'instructor_id': instructor.id, 'is_approved': rng.random() < 0.9} for _ in range(courses)])
+    course_ids = [c for (c,) in db.session.query(Course.id)]
+    for start in range(0, MODULES, 10000):
+        db.session.execute(Module.__table__.insert(), [
+            {'course_id': course_ids[i // MODULES_PER_COURSE], 'title': ' '.join(rng.choices(words[:4000], k=4)).title(),
+             'content': ' '.join(rng.choices(words, weights, k=WORDS))} for i in range(start, min(MODULES, start + 10000))])
+    db.session.commit()
+    return instructor.id, course_ids
+
+
+def timed(fn, runs=RUNS):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    rng = random.Random(20)
+    words = vocabulary(rng)
+    upgrade_database()
+    with app.app_context():
+        start = time.perf_counter()
+        instructor_id, course_ids = seed(rng, words)
+        print(f'seeded {len(course_ids)} courses, {MODULES} modules x {WORDS} words in {time.perf_counter() - start:.1f}s')
+        with db.engine.begin() as conn:
+            start = time.perf_counter()
+            courses, modules = search.rebuild(conn)
+            print(f'full reindex of {courses} approved courses and {modules} modules: {time.perf_counter() - start:.1f}s')
+
+    client = app.test_client()
+    queries = {
+        'common word': words[0],
+        'mid-frequency word': words[300],
+        'rare word': words[6000],
+        'two words': f'{words[5]} {words[40]}',
+        'three words': f'{words[2]} {words[90]} {words[700]}',
+    }
+    print(f'\n{"query":22} {"":10} {"FTS p50/p95 ms":>16} {"LIKE p50 ms":>12}')
+    for label, q in queries.items():
+        for page in (1, 5):
+            p50, p95 = timed(lambda: client.get('/api/search', query_string={'q': q, 'page': page}))
+            with app.app_context():
+                like, _ = timed(lambda: search.search_like(db.session, q, page), runs=3) if page == 1 else (None, None)
+            hits = len(client.get('/api/search', query_string={'q': q, 'page': page}).get_json()['results'])
+            like_text = f'{like:12.1f}' if like is not None else f'{"":>12}'
+            print(f'{label:22} page {page:<5} {p50:7.2f}/{p95:<8.2f} {like_text}  results={hits}')
+
+    print()
+    for prefix in (words[0][:2], words[10][:3], words[100][:4], f'{words[3]} {words[500][:3]}'):
+        p50, p95 = timed(lambda: client.get('/api/search/suggest', query_string={'q': prefix}))
+        count = len(client.get('/api/search/suggest', query_string={'q': prefix}).get_json()['suggestions'])
+        print(f'suggest {prefix!r:20} {p50:7.2f}/{p95:<8.2f} ms  suggestions={count}')
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(instructor_id)
+        sess['_fresh'] = True
+    with app.app_context():
+        own_course = Course.query.filter_by(instructor_id=instructor_id, is_approved=True).first().id
+    p50, _ = timed(lambda: client.post(f'/course/{own_course}/modules/create', data={
+        'title': 'Benchmark module', 'content': ' '.join(rng.choices(words, k=WORDS))}), runs=20)
+    with app.app_context():
+        indexed = db.session.execute(text('SELECT count(*) FROM search_index')).scalar()
+    print(f'\ncreate_module with index hook: p50 {p50:.1f} ms  ({indexed} documents indexed)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Cost of the slow-query log: overhead of the engine listeners when nothing
+crosses the threshold (CPU time, interleaved batches of /quiz/<id>/results
+and of bare SELECT 1 statements with the listeners on and off), then a
+capture run with the threshold at 0 over the heavy pages, the report it
+produces and what one EXPLAIN QUERY PLAN costs.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/bench_slow_queries.py [students] [questions]`
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+STUDENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+QUESTIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+BATCHES = 20
+PER_BATCH = 5
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "slow.db")}'
+os.environ['SLOW_QUERY_LOG'] = '0'  # installed by hand below
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+import slowlog
+from app import (app, db, User, Course, Quiz, Question, Choice, CourseProgress, StudentAnswer,
+                 refresh_rollups, upgrade_database)
+
+
+def seed(rng):
+    admin = User(full_name='Slow Admin', email='bench_slow_admin@zit.edu', role='admin', password_hash='!')
+    instructor = User(full_name='Slow Instructor', email='bench_slow_instructor@zit.edu', role='instructor',
+                      password_hash='!')
+    db.session.add_all([admin, instructor])
+    db.session.flush()
+    course = Course(title='Slow Course', description='bench', instructor_id=instructor.id, is_approved=True)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(course_id=course.id, title='Slow Quiz')
+    db.session.add(quiz)
+    db.session.flush()
+    db.session.execute(Question.__table__.insert(), [
+        {'quiz_id': quiz.id, 'text': f'Q{i}', 'order': i} for i in range(QUESTIONS)])
+    questions = [q for (q,) in db.session.query(Question.id).filter_by(quiz_id=quiz.id)]
+    db.session.execute(Choice.__table__.insert(), [
+        {'question_id': q, 'text': f'Option {c}', 'is_correct': c == 0} for q in questions for c in range(4)])
+    choices = {}
+    for c in Choice.query.filter(Choice.question_id.in_(questions)):
+        choices.setdefault(c.question_id, []).append(c)
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Slow Student {i}', 'email': f'bench_slow_{i}@zit.edu', 'password_hash': '!',
+         'role': 'student'} for i in range(STUDENTS)])
+    students = [u for (u,) in db.session.query(User.id).filter_by(role='student')]
+    db.session.execute(CourseProgress.__table__.insert(), [
+        {'student_id': s, 'course_id': course.id} for s in students])
+    answers = []
+    for s in students:
+        for q in questions:
+            choice = rng.choice(choices[q])
+            answers.append({'student_id': s, 'question_id': q, 'choice_id': choice.id, 'correct': choice.is_correct})
+    for start in range(0, len(answers), 50000):
+        db.session.execute(StudentAnswer.__table__.insert(), answers[start:start + 50000])
+    db.session.commit()
+    return admin.id, instructor.id, quiz.id
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        admin_id, instructor_id, quiz_id = seed(random.Random(22))
+        refresh_rollups(full=True)
+        engine = db.engine
+    log = slowlog.SlowQueryLog(os.path.join(_tmp.name, 'slow_queries.log'), log_params=True)
+    client = app.test_client()
+    login(client, instructor_id)
+    url = f'/quiz/{quiz_id}/results'
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(Engine, 'before_cursor_execute', count)  # results run on the read bind
+    client.get(url)
+    event.remove(Engine, 'before_cursor_execute', count)
+    per_request = statements[0]
+
+    def batch():
+        start = time.process_time()
+        for _ in range(PER_BATCH):
+            client.get(url)
+        return (time.process_time() - start) / PER_BATCH
+
+    batch()
+    diffs, baseline = [], []
+    for _ in range(BATCHES):
+        off = batch()
+        log.install()
+        on = batch()
+        log.uninstall()
+        diffs.append(on - off)
+        baseline.append(off)
+    off = statistics.median(baseline)
+    diff = statistics.median(diffs)
+    print(f'{STUDENTS} students x {QUESTIONS} questions, {per_request} statements per {url}')
+    print(f'listeners off {off * 1000:.2f} ms CPU/request, on (nothing captured) {diff * 1000:+.3f} ms '
+          f'({diff / off * 100:+.2f}%)')
+
+    with engine.connect() as conn:
+        select_one = text('SELECT 1')
+
+        def statements_batch():
+            start = time.process_time()
+            for _ in range(1000):
+                conn.execute(select_one)
+            return (time.process_time() - start) / 1000
+
+        diffs, baseline = [], []
+        for _ in range(BATCHES * 5):
+            off = statements_batch()
+            log.install()
+            on = statements_batch()
+            log.uninstall()
+            diffs.append(on - off)
+            baseline.append(off)
+    print(f'SELECT 1: {statistics.median(baseline) * 1e6:.1f} us CPU, listeners '
+          f'{statistics.median(diffs) * 1e6:+.1f} us/statement')
+
+    log.threshold = 0
+    log.install()
+    client.get(url)
+    client.get(f'/quiz/{quiz_id}/export.csv')
+    login(client, admin_id)
+    client.get('/admin/analytics')
+    client.get('/dashboard')
+    log.uninstall()
+
+    ranked = log.report()
+    print(f'\ncaptured {sum(s["count"] for s in ranked)} statements in {len(ranked)} shapes '
+          f'({os.path.getsize(log.path) / 1024:.0f} KB of log); top 5 by total time:')
+    for s in ranked[:5]:
+        print(f'\n{s["total_ms"]:8.1f} ms total  {s["count"]:3}x  max {s["max_ms"]:.1f} ms  '
+              f'{", ".join(e for e, _ in s["endpoints"])}')
+        print(f'  {s["sql"][:150]}')
+        for line in s['plan'] or []:
+            print(f'    {line}')
+
+    # the slowest shape whose parameters were logged (user and payment statements are redacted)
+    worst = next(s['example'] for s in ranked if s['example']['params'] != slowlog.REDACTED)
+    with engine.connect() as conn:
+        raw = conn.connection.dbapi_connection
+        params = tuple(worst['params']) if isinstance(worst['params'], list) else worst['params'] or ()
+        start = time.perf_counter()
+        for _ in range(100):
+            slowlog.explain(raw, worst['statement'], params, 'sqlite')
+        explain_ms = (time.perf_counter() - start) * 10
+    print(f'\nEXPLAIN QUERY PLAN of the worst shape: {explain_ms:.3f} ms '
+          f'(once per shape per {slowlog.SLOW_QUERY_EXPLAIN_INTERVAL:.0f}s per worker)')
+
+
+if __name__ == '__main__':
+    main()
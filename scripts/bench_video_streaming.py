@@ -0,0 +1,93 @@
+"""Measure memory and throughput of /video/<id>/stream with many simultaneous viewers.
+Starts the app on a local threaded server, creates a sparse test video, and
+has N clients download it with `Range: bytes=0-` at the same time.
+Run from workspace root: `python scripts/bench_video_streaming.py [viewers] [size_mb]`
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+from app import app, db, Video, upgrade_database
+
+VIEWERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+SIZE_MB = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    upgrade_database()
+    upload_dir = os.path.join(app.root_path, 'static', 'uploads', 'videos')
+    os.makedirs(upload_dir, exist_ok=True)
+    stored_name = 'bench_stream.mp4'
+    path = os.path.join(upload_dir, stored_name)
+    with open(path, 'wb') as f:
+        f.truncate(SIZE_MB * 1024 * 1024)
+
+    with app.app_context():
+        video = Video(course_id=0, title='bench', filename=stored_name, original_filename=stored_name)
+        db.session.add(video)
+        db.session.commit()
+        video_id = video.id
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.port}/video/{video_id}/stream'
+
+    peak = baseline = rss_mb()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss_mb())
+            time.sleep(0.02)
+
+    received = []
+
+    def viewer():
+        total = 0
+        with requests.get(url, headers={'Range': 'bytes=0-'}, stream=True, timeout=120) as resp:
+            for chunk in resp.iter_content(64 * 1024):
+                total += len(chunk)
+        received.append(total)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=viewer) for _ in range(VIEWERS)]
+    start = time.perf_counter()
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        done.set()
+        server.shutdown()
+        os.remove(path)
+        with app.app_context():
+            Video.query.filter_by(id=video_id).delete()
+            db.session.commit()
+
+    total_mb = sum(received) / 1024 / 1024
+    print(f'{VIEWERS} viewers x {SIZE_MB} MB, Range: bytes=0-')
+    print(f'complete downloads: {sum(1 for r in received if r == SIZE_MB * 1024 * 1024)}/{VIEWERS}')
+    print(f'throughput: {total_mb / elapsed:.1f} MB/s ({elapsed:.2f}s)')
+    print(f'RSS: baseline {baseline:.1f} MB, peak {peak:.1f} MB, growth {peak - baseline:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Time a class opening the same quiz: /quiz/<id> and /api/quiz/<id>, cold,
+warm and revalidated with If-None-Match, with SQL statements per view.
+Run from workspace root: `python scripts/bench_view_quiz.py [questions] [views]`
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, User, Course, Quiz, Question, Choice, invalidate_quiz_cache, upgrade_database
+
+QUESTIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+VIEWS = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+
+def seed():
+    tag = time.time_ns()
+    student = User(full_name='Quiz Viewer', email=f'bench_view_{tag}@zit.edu', role='student', password_hash='!')
+    db.session.add(student)
+    db.session.flush()
+    course = Course(title='View Benchmark Course', description='bench', instructor_id=student.id)
+    db.session.add(course)
+    db.session.flush()
+    quiz = Quiz(course_id=course.id, title=f'View Benchmark {tag}')
+    db.session.add(quiz)
+    db.session.flush()
+    db.session.execute(Question.__table__.insert(), [
+        {'quiz_id': quiz.id, 'text': f'Question {i}', 'explanation': None, 'order': i}
+        for i in range(1, QUESTIONS + 1)])
+    q_ids = [q.id for q in Question.query.filter_by(quiz_id=quiz.id)]
+    db.session.execute(Choice.__table__.insert(), [
+        {'question_id': q_id, 'text': f'Option {c}', 'is_correct': c == 0} for q_id in q_ids for c in range(4)])
+    db.session.commit()
+    return quiz.id, student.id
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        quiz_id, student_id = seed()
+        engines = list(db.engines.values())
+    invalidate_quiz_cache()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(student_id)
+        sess['_fresh'] = True
+    client.get('/health')
+
+    statements = [0]
+    for engine in engines:  # the primary and, with read routing, the read bind
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.__setitem__(0, statements[0] + 1))
+    print(f'{QUESTIONS}-question quiz, {VIEWS} views each')
+    for url in (f'/quiz/{quiz_id}', f'/api/quiz/{quiz_id}'):
+        invalidate_quiz_cache()
+        statements[0] = 0
+        start = time.perf_counter()
+        resp = client.get(url)
+        print(f'{url:16} cold         {(time.perf_counter() - start) * 1000:7.2f} ms/view  '
+              f'statements/view={statements[0]}')
+        for label in ('warm', 'If-None-Match'):
+            # the page ETag changes once the first render put a CSRF token in the session
+            headers = {'If-None-Match': resp.headers['ETag']} if label == 'If-None-Match' else {}
+            statements[0] = 0
+            start = time.perf_counter()
+            for _ in range(VIEWS):
+                resp = client.get(url, headers=headers)
+            elapsed = time.perf_counter() - start
+            print(f'{url:16} {label:13}{elapsed / VIEWS * 1000:7.2f} ms/view  '
+                  f'statements/view={statements[0] / VIEWS:.1f}  status={resp.status_code}')
+
+
+if __name__ == '__main__':
+    main()
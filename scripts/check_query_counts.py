@@ -0,0 +1,109 @@
+"""Regression check: count SQL statements issued per request on the student
+pages so N+1 query loops can't creep back in.
+Runs against a fresh SQLite file and instance folder in a temporary
+directory, never the configured database, and deletes them on exit.
+Run from workspace root: `python scripts/check_query_counts.py`
+Exits non-zero if any page issues more statements than its budget.
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "query_counts.db")}'
+os.environ.pop('DATABASE_READ_URL', None)
+os.environ.pop('RATELIMIT_STORAGE_URI', None)
+os.environ['INSTANCE_PATH'] = os.path.join(_tmp.name, 'instance')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, User, Course, Module, CourseProgress, ModuleProgress, upgrade_database
+
+ENROLLMENTS = 30
+MODULES_PER_COURSE = 3
+
+# statement budgets per request, independent of the number of enrollments
+BUDGETS = {
+    '/dashboard': 6,
+    '/course/{course_id}': 8,
+    '/course/{course_id}/progress': 6,
+}
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())  # the primary and, with read routing, the read bind
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed():
+    upgrade_database()
+    with app.app_context():
+        instructor = User.query.filter_by(email='qcount_instructor@zit.edu').first()
+        if not instructor:
+            instructor = User(full_name='Query Count Instructor', email='qcount_instructor@zit.edu', role='instructor')
+            instructor.set_password('instructor123')
+            db.session.add(instructor)
+        student = User.query.filter_by(email='qcount_student@zit.edu').first()
+        if not student:
+            student = User(full_name='Query Count Student', email='qcount_student@zit.edu', role='student')
+            student.set_password('student123')
+            db.session.add(student)
+        db.session.commit()
+
+        for i in range(ENROLLMENTS):
+            title = f'Query Count Course {i}'
+            course = Course.query.filter_by(title=title, instructor_id=instructor.id).first()
+            if course:
+                continue
+            course = Course(title=title, description='Seeded by check_query_counts', instructor_id=instructor.id, is_approved=True)
+            db.session.add(course)
+            db.session.flush()
+            modules = [Module(course_id=course.id, title=f'Module {m}', content='...') for m in range(MODULES_PER_COURSE)]
+            db.session.add_all(modules)
+            db.session.flush()
+            db.session.add(CourseProgress(student_id=student.id, course_id=course.id, module_id=modules[0].id))
+            db.session.add(ModuleProgress(student_id=student.id, module_id=modules[0].id))
+        db.session.commit()
+
+        course_id = Course.query.filter_by(title='Query Count Course 0', instructor_id=instructor.id).first().id
+        return student.id, course_id
+
+
+def main():
+    student_id, course_id = seed()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(student_id)
+        sess['_fresh'] = True
+    # warm up the connection and app state so only the page queries are counted
+    client.get('/health')
+
+    failed = False
+    for path, budget in BUDGETS.items():
+        url = path.format(course_id=course_id)
+        with count_queries() as statements:
+            resp = client.get(url)
+        status = 'OK' if resp.status_code == 200 and len(statements) <= budget else 'FAIL'
+        if status == 'FAIL':
+            failed = True
+        print(f'{status:4} {url:28} status={resp.status_code} statements={len(statements)} budget={budget}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
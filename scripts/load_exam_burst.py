@@ -0,0 +1,132 @@
+"""Load generator for exam bursts: N students answer a quiz at the same moment,
+one POST per question, against the app on a local threaded server. Runs the
+same burst against a regular quiz and an exam-mode quiz and reports p50/p99
+acknowledgement latency, errors and (exam mode) how long the drain took.
+The server runs in its own process so the client threads do not share its GIL.
+Run from workspace root: `python scripts/load_exam_burst.py [students] [questions]`
+"""
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['RATELIMIT_ENABLED'] = '0'  # one client address; the per-IP limits would reject the load itself
+
+import requests
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.serving import make_server
+
+from app import app, db, User, Course, Quiz, Question, Choice, StudentAnswer, drain_exam_logs, upgrade_database
+
+STUDENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+QUESTIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+
+def seed(tag):
+    instructor = User(full_name='Exam Instructor', email=f'exam_{tag}@zit.edu', role='instructor', password_hash='!')
+    db.session.add(instructor)
+    db.session.flush()
+    course = Course(title='Exam Burst Course', description='bench', instructor_id=instructor.id)
+    db.session.add(course)
+    db.session.flush()
+    quizzes = {}
+    for exam_mode in (False, True):
+        quiz = Quiz(course_id=course.id, title=f'Exam burst {tag} {exam_mode}', exam_mode=exam_mode)
+        db.session.add(quiz)
+        db.session.flush()
+        db.session.execute(Question.__table__.insert(), [
+            {'quiz_id': quiz.id, 'text': f'Question {i}', 'explanation': None, 'order': i}
+            for i in range(1, QUESTIONS + 1)])
+        q_ids = [q.id for q in Question.query.filter_by(quiz_id=quiz.id)]
+        db.session.execute(Choice.__table__.insert(), [
+            {'question_id': q_id, 'text': f'Option {c}', 'is_correct': c == 0} for q_id in q_ids for c in range(4)])
+        choices = {}
+        for c in Choice.query.filter(Choice.question_id.in_(q_ids)):
+            choices.setdefault(c.question_id, []).append(c.id)
+        quizzes[exam_mode] = (quiz.id, choices)
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Exam Student {i}', 'email': f'exam_{tag}_{i}@zit.edu', 'password_hash': '!',
+         'role': 'student'} for i in range(STUDENTS)])
+    student_ids = [u.id for u in User.query.filter(User.email.like(f'exam\\_{tag}\\_%', escape='\\'))]
+    db.session.commit()
+    return quizzes, student_ids
+
+
+def burst(base_url, quiz_id, choices, cookies):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start_gun = threading.Event()
+
+    def student(cookie, seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        session.cookies.set('session', cookie)
+        start_gun.wait()
+        for q_id, c_ids in choices.items():
+            t = time.perf_counter()
+            try:
+                resp = session.post(f'{base_url}/quiz/{quiz_id}/answer/{q_id}', json={'choice_id': rng.choice(c_ids)},
+                                    timeout=120)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - t) * 1000
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=student, args=(cookie, i)) for i, cookie in enumerate(cookies)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    start_gun.set()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def serve(server):
+    app.config['WTF_CSRF_ENABLED'] = False
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server.serve_forever()
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        quizzes, student_ids = seed(time.time_ns())
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    cookies = [serializer.dumps({'_user_id': str(sid), '_fresh': True}) for sid in student_ids]
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.socket.listen(4096)  # the default backlog drops a 1,000-client burst
+    process = multiprocessing.get_context('fork').Process(target=serve, args=(server,), daemon=True)
+    process.start()
+    base_url = f'http://127.0.0.1:{server.port}'
+
+    print(f'{STUDENTS} students x {QUESTIONS} questions, all starting at once')
+    try:
+        for exam_mode in (False, True):
+            quiz_id, choices = quizzes[exam_mode]
+            latencies, errors, elapsed = burst(base_url, quiz_id, choices, cookies)
+            latencies.sort()
+            line = (f'{"exam mode" if exam_mode else "direct":9}  ack p50 {statistics.median(latencies):7.1f} ms  '
+                    f'p99 {latencies[int(len(latencies) * 0.99) - 1]:7.1f} ms  errors {len(errors)}  '
+                    f'{len(latencies) / elapsed:6.0f} answers/s')
+            if exam_mode:
+                start = time.perf_counter()
+                with app.app_context():
+                    drain_exam_logs([quiz_id])
+                    stored = StudentAnswer.query.filter(StudentAnswer.question_id.in_(list(choices))).count()
+                line += f'  final drain {time.perf_counter() - start:.2f}s, {stored} answers stored'
+            print(line)
+    finally:
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Credential-stuffing load test: legitimate users browse and log in while
+attacker threads POST wrong passwords for real accounts to /login, first
+with the rate limits off and then on. Reports legitimate page and login
+latency next to a no-attack baseline, and what the attackers got back.
+Attackers start WARMUP seconds before measuring, so the limits' initial
+allowance is spent and the numbers show the steady state of an attack.
+
+The app runs in WORKERS forked processes accepting on one socket, so the
+per-IP and per-account counters are shared through instance storage exactly
+as between gunicorn workers. Clients send X-Forwarded-For (the server
+trusts one proxy hop), so legitimate users and attackers have distinct
+addresses.
+Runs against a fresh SQLite file in a temporary directory.
+Run from workspace root: `python scripts/load_rate_limit.py [attackers] [attacker_ips] [seconds] [workers]`
+"""
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ATTACKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+ATTACKER_IPS = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 15
+WORKERS = int(sys.argv[4]) if len(sys.argv) > 4 else 2
+WARMUP = 15
+LEGIT_USERS = 4
+LEGIT_PAUSE = 0.2
+LEGIT_LOGIN_EVERY = 5.0
+VICTIMS = 200
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmp.name, "load.db")}'
+os.environ['RATELIMIT_STORAGE_URI'] = f'sqlite:///{os.path.join(_tmp.name, "ratelimit.db")}'
+os.environ['RATELIMIT_TRUSTED_PROXIES'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+from app import app, db, User, limiter, upgrade_database
+
+LEGIT_PASSWORD = 'Legit-pass-123'
+
+
+def seed():
+    legit_hash = generate_password_hash(LEGIT_PASSWORD)
+    victim_hash = generate_password_hash('Victim-pass-456')
+    db.session.execute(User.__table__.insert(), [
+        {'full_name': f'Legit Student {i}', 'email': f'legit_{i}@zit.edu', 'password_hash': legit_hash,
+         'role': 'student'} for i in range(LEGIT_USERS)] + [
+        {'full_name': f'Victim {i}', 'email': f'victim_{i}@zit.edu', 'password_hash': victim_hash,
+         'role': 'student'} for i in range(VICTIMS)])
+    db.session.commit()
+
+
+def serve(server, limited):
+    app.config['WTF_CSRF_ENABLED'] = False
+    limiter.enabled = limited
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('flask-limiter').setLevel(logging.ERROR)
+    server.serve_forever()
+
+
+def start_servers(limited):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.socket.listen(1024)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=serve, args=(server, limited), daemon=True) for _ in range(WORKERS)]
+    for p in processes:
+        p.start()
+    server.socket.close()  # the workers hold their own copies
+    return f'http://127.0.0.1:{server.port}', processes
+
+
+def legit_user(base_url, index, measure, stop, results):
+    measure.wait()
+    session = requests.Session()
+    session.headers['X-Forwarded-For'] = f'10.1.0.{index + 1}'
+    next_login = 0.0
+    while not stop.is_set():
+        if time.monotonic() >= next_login:
+            start = time.perf_counter()
+            resp = session.post(f'{base_url}/login', data={'email': f'legit_{index}@zit.edu', 'password': LEGIT_PASSWORD},
+                                allow_redirects=False, timeout=120)
+            results['login'].append((time.perf_counter() - start) * 1000)
+            if resp.status_code != 302:
+                results['errors'].append(f'login {resp.status_code}')
+            next_login = time.monotonic() + LEGIT_LOGIN_EVERY
+        for path in ('/dashboard', '/courses'):
+            start = time.perf_counter()
+            resp = session.get(f'{base_url}{path}', allow_redirects=False, timeout=120)
+            results['pages'].append((time.perf_counter() - start) * 1000)
+            if resp.status_code != 200:
+                results['errors'].append(f'{path} {resp.status_code}')
+        stop.wait(LEGIT_PAUSE)
+
+
+def attacker(base_url, index, stop, statuses):
+    rng = random.Random(index)
+    session = requests.Session()
+    while not stop.is_set():
+        session.headers['X-Forwarded-For'] = f'203.0.113.{rng.randrange(ATTACKER_IPS) + 1}'
+        try:
+            resp = session.post(f'{base_url}/login', data={'email': f'victim_{rng.randrange(VICTIMS)}@zit.edu',
+                                                           'password': f'guess{rng.random()}'},
+                                allow_redirects=False, timeout=120)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        except requests.RequestException:
+            statuses['error'] = statuses.get('error', 0) + 1
+
+
+def phase(label, attackers, limited):
+    with app.app_context():
+        limiter.reset()
+    base_url, processes = start_servers(limited)
+    stop = threading.Event()
+    results = {'login': [], 'pages': [], 'errors': []}
+    statuses = {}
+    measure = threading.Event()
+    threads = [threading.Thread(target=legit_user, args=(base_url, i, measure, stop, results))
+               for i in range(LEGIT_USERS)]
+    threads += [threading.Thread(target=attacker, args=(base_url, i, stop, statuses)) for i in range(attackers)]
+    for t in threads:
+        t.start()
+    if attackers:
+        time.sleep(WARMUP)
+        statuses.clear()
+    measure.set()
+    time.sleep(SECONDS)
+    stop.set()
+    for t in threads:
+        t.join()
+    for p in processes:
+        p.terminate()
+
+    pages = sorted(results['pages'])
+    logins = sorted(results['login'])
+    print(f'{label:24} pages p50 {statistics.median(pages):7.1f} ms  p95 {pages[int(len(pages) * 0.95) - 1]:7.1f} ms  '
+          f'logins p50 {statistics.median(logins):7.1f} ms  max {logins[-1]:7.1f} ms  '
+          f'({len(pages)} pages, {len(logins)} logins, {len(results["errors"])} errors)')
+    if attackers:
+        total = sum(statuses.values())
+        counts = ', '.join(f'{status}: {n}' for status, n in sorted(statuses.items(), key=str))
+        print(f'{"":24} attackers: {total / SECONDS:6.1f} req/s  {counts}  '
+              f'({statuses.get(200, 0)} password hashes computed)')
+
+
+def main():
+    upgrade_database()
+    with app.app_context():
+        seed()
+    print(f'{LEGIT_USERS} legitimate users, {ATTACKERS} attacker threads from {ATTACKER_IPS} addresses against '
+          f'{VICTIMS} accounts, {WORKERS} worker processes, {SECONDS:g}s per phase')
+    phase('baseline (no attack)', 0, True)
+    phase('attack, limits off', ATTACKERS, False)
+    phase('attack, limits on', ATTACKERS, True)
+
+
+if __name__ == '__main__':
+    main()
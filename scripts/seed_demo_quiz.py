@@ -1,12 +1,27 @@
 """Seed a demo course, instructor, students, quiz, and sample answers.
-Run from workspace root: `python scripts\seed_demo_quiz.py`
+Run from workspace root: `python scripts\seed_demo_quiz.py [question_bank.json|.jsonl|.csv]`
+With a question bank file the demo quiz is imported from it instead of the two built-in questions.
 """
-from app import app, db, User, Course, Module, Quiz, Question, Choice, StudentAnswer, CourseProgress
-from datetime import datetime
+import os
+import sys
 
-with app.app_context():
-    db.create_all()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (app, db, User, Course, Module, Quiz, Question, Choice, StudentAnswer, CourseProgress,
+                 add_questions, describe_import, import_questions, invalidate_quiz_cache, upgrade_database)
+from question_bank import detect_format
+
+DEMO_QUESTIONS = [
+    {'text': 'What is 2+2?', 'explanation': 'Basic math',
+     'choices': [{'text': '3', 'is_correct': False}, {'text': '4', 'is_correct': True}]},
+    {'text': 'Which is a fruit?', 'explanation': 'General knowledge',
+     'choices': [{'text': 'Carrot', 'is_correct': False}, {'text': 'Apple', 'is_correct': True}]},
+]
+BANK = sys.argv[1] if len(sys.argv) > 1 else None
 
+upgrade_database()
+
+with app.app_context():
     # create instructor
     instructor = User.query.filter_by(email='demo_instructor@zit.edu').first()
     if not instructor:
@@ -45,19 +60,13 @@ with app.app_context():
     if not quiz:
         quiz = Quiz(course_id=course.id, title='Demo Quiz')
         db.session.add(quiz)
+        db.session.flush()
+        if BANK:
+            print(f'Imported {describe_import(import_questions(quiz.id, BANK, detect_format(BANK)))}')
+        else:
+            add_questions(quiz.id, DEMO_QUESTIONS)
         db.session.commit()
-
-        q1 = Question(quiz_id=quiz.id, text='What is 2+2?', explanation='Basic math', order=1)
-        q2 = Question(quiz_id=quiz.id, text='Which is a fruit?', explanation='General knowledge', order=2)
-        db.session.add_all([q1, q2])
-        db.session.commit()
-
-        c11 = Choice(question_id=q1.id, text='3', is_correct=False)
-        c12 = Choice(question_id=q1.id, text='4', is_correct=True)
-        c21 = Choice(question_id=q2.id, text='Carrot', is_correct=False)
-        c22 = Choice(question_id=q2.id, text='Apple', is_correct=True)
-        db.session.add_all([c11, c12, c21, c22])
-        db.session.commit()
+        invalidate_quiz_cache()
 
     # enroll students and add sample answers
     for s in students:
@@ -107,4 +116,3 @@ with app.app_context():
     db.session.commit()
 
     print('Seeded demo course, quiz, and sample student answers.')
-*** End Patch
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""Full-text search over course titles/descriptions and module titles/content.
+
+SQLite databases get an FTS5 table, search_index, holding what the public
+catalogue shows: one row per approved course (rowid = -course.id) and per
+module of an approved course (rowid = module.id). The write hooks replace or
+delete a document by rowid without scanning the index; approving a course
+adds it with its modules, rejecting or deleting it removes them.
+
+Ranking is bm25 with titles weighted SEARCH_TITLE_WEIGHT times the body, and
+course documents ranked above modules that match equally well. Only rowids
+and scores are sorted; titles, snippets and course names are read for the
+rows on the page. Queries matching more than SEARCH_RANK_WINDOW documents are
+answered in tiers instead (title matches, then the rest newest first) so
+latency stays bounded on large catalogues. Autocomplete matches titles only
+and treats the last word as a prefix (served by the 2-4 character prefix
+indexes).
+
+Other databases (no FTS5) fall back to LIKE scans over the same columns:
+correct, but linear in the number of modules.
+"""
+import os
+import re
+
+from sqlalchemy import bindparam, text
+
+SEARCH_PER_PAGE = int(os.environ.get('SEARCH_PER_PAGE', 20))
+SEARCH_MAX_PAGE = int(os.environ.get('SEARCH_MAX_PAGE', 50))
+SEARCH_TITLE_WEIGHT = float(os.environ.get('SEARCH_TITLE_WEIGHT', 10.0))
+# queries matching more documents than this are not bm25-ranked in full (see _hits)
+SEARCH_RANK_WINDOW = int(os.environ.get('SEARCH_RANK_WINDOW', 4000))
+SUGGEST_LIMIT = 8
+MAX_TERMS = 8
+MIN_PREFIX = 2
+SNIPPET_TOKENS = 16
+
+# snippet() highlight markers; the caller escapes the text, then swaps these for <mark>
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, course_id UNINDEXED, "
+    "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3 4')"
+)
+
+
+def fts5_available(conn):
+    """True on SQLite builds compiled with FTS5 (conn: a Connection)."""
+    if conn.dialect.name != 'sqlite':
+        return False
+    options = {row[0] for row in conn.execute(text('PRAGMA compile_options'))}
+    return 'ENABLE_FTS5' in options
+
+
+def has_index(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")).first() is not None
+
+
+def create_index(conn):
+    conn.execute(text(CREATE_INDEX))
+
+
+def rebuild(conn):
+    """Reindex every approved course and its modules; returns (courses, modules)."""
+    conn.execute(text('DELETE FROM search_index'))
+    courses = conn.execute(text(
+        'INSERT INTO search_index (rowid, title, body, course_id) '
+        'SELECT -id, title, description, id FROM course WHERE is_approved = 1')).rowcount
+    modules = conn.execute(text(
+        'INSERT INTO search_index (rowid, title, body, course_id) '
+        'SELECT module.id, module.title, module.content, module.course_id '
+        'FROM module JOIN course ON course.id = module.course_id WHERE course.is_approved = 1')).rowcount
+    conn.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    return courses, modules
+
+
+def _put(conn, rowid, title, body, course_id):
+    conn.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': rowid})
+    conn.execute(text('INSERT INTO search_index (rowid, title, body, course_id) '
+                      'VALUES (:rowid, :title, :body, :course_id)'),
+                 {'rowid': rowid, 'title': title or '', 'body': body or '', 'course_id': course_id})
+
+
+def index_course(conn, course_id, title, description):
+    _put(conn, -course_id, title, description, course_id)
+
+
+def index_module(conn, module_id, course_id, title, content):
+    _put(conn, module_id, title, content, course_id)
+
+
+def remove_course(conn, course_id):
+    """Drop a course and its modules; call before the module rows are deleted."""
+    conn.execute(text('DELETE FROM search_index WHERE rowid = :rowid OR rowid IN '
+                      '(SELECT id FROM module WHERE course_id = :course_id)'),
+                 {'rowid': -course_id, 'course_id': course_id})
+
+
+def add_course(conn, course_id):
+    """(Re)index a course and all of its modules from the tables, e.g. once it is approved."""
+    remove_course(conn, course_id)
+    conn.execute(text('INSERT INTO search_index (rowid, title, body, course_id) '
+                      'SELECT -id, title, description, id FROM course WHERE id = :course_id'),
+                 {'course_id': course_id})
+    conn.execute(text('INSERT INTO search_index (rowid, title, body, course_id) '
+                      'SELECT id, title, content, course_id FROM module WHERE course_id = :course_id'),
+                 {'course_id': course_id})
+
+
+def _select(sql):
+    # a TextualSelect rather than a bare text(), so @read_only views run it on the read bind
+    return text(sql).columns()
+
+
+def terms(query):
+    return [t.lower() for t in _WORD.findall(query or '')][:MAX_TERMS]
+
+
+def match_expression(words, prefix_last=False):
+    """FTS5 query: every word must match; words are quoted so user input is never FTS syntax."""
+    if not words:
+        return None
+    quoted = ['"%s"' % w.replace('"', '') for w in words]
+    if prefix_last:
+        quoted[-1] += ' *'
+    return ' '.join(quoted)
+
+
+def _rank(weight=None):
+    weight = SEARCH_TITLE_WEIGHT if weight is None else weight
+    # bm25 is negative (lower is better); courses get a 1.5x boost over modules
+    return f'bm25(search_index, {weight:g}, 1.0) * CASE WHEN rowid < 0 THEN 1.5 ELSE 1.0 END'
+
+
+def _count_upto(conn, match, cap):
+    """Documents matching, counting no further than cap (cheap: no scoring, no content reads)."""
+    return conn.execute(_select(
+        'SELECT count(*) FROM (SELECT 1 FROM search_index WHERE search_index MATCH :match LIMIT :cap)'),
+        {'match': match, 'cap': cap}).scalar()
+
+
+def _slice(conn, match, limit, offset, ranked, weight=None):
+    """[(rowid, score)] by bm25 or, with ranked=False, newest first.
+
+    Newest first follows the index's own rowid order, so it stops after
+    offset + limit rows however many documents match.
+    """
+    if ranked:
+        sql = (f'SELECT rowid, {_rank(weight)} AS score FROM search_index WHERE search_index MATCH :match '
+               'ORDER BY score LIMIT :limit OFFSET :offset')
+    else:
+        sql = ('SELECT rowid, NULL FROM search_index WHERE search_index MATCH :match '
+               'ORDER BY rowid DESC LIMIT :limit OFFSET :offset')
+    return conn.execute(_select(sql), {'match': match, 'limit': limit, 'offset': offset}).fetchall()
+
+
+def _hits(conn, expression, limit, offset, weight=None):
+    """Rank every match when there are at most SEARCH_RANK_WINDOW of them.
+
+    Beyond that (a query made only of words found in most documents) bm25 over
+    all of them would cost far more than the latency budget and barely
+    separate them anyway, so title matches come first, ranked when they fit in
+    the window, followed by the remaining matches newest first.
+    """
+    window = SEARCH_RANK_WINDOW
+    if _count_upto(conn, expression, window + 1) <= window:
+        return _slice(conn, expression, limit, offset, True, weight)
+    in_title = '{title} : (%s)' % expression
+    titled = _count_upto(conn, in_title, window + 1)
+    hits = _slice(conn, in_title, limit, offset, titled <= window, weight)
+    if len(hits) < limit and titled <= window:
+        hits += _slice(conn, '(%s) NOT %s' % (expression, in_title), limit - len(hits),
+                       max(0, offset - titled), False)
+    return hits
+
+
+def _results(conn, expression, hits, snippets=True):
+    """Titles, snippets and course names for the hits on one page, in hit order.
+
+    snippet() needs the MATCH; without snippets the rows are plain rowid lookups.
+    """
+    if not hits:
+        return []
+    if snippets:
+        snippet = f"snippet(search_index, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', {SNIPPET_TOKENS})"
+        where = 'search_index MATCH :match AND search_index.rowid IN :rowids'
+    else:
+        snippet, where = 'NULL', 'search_index.rowid IN :rowids'
+    rows = conn.execute(_select(
+        f'SELECT search_index.rowid, search_index.course_id, search_index.title, {snippet}, course.title '
+        f'FROM search_index JOIN course ON course.id = search_index.course_id WHERE {where}')
+        .bindparams(bindparam('rowids', expanding=True)),
+        {'match': expression, 'rowids': [rowid for rowid, _ in hits]}).fetchall()
+    by_rowid = {row[0]: row for row in rows}
+    results = []
+    for rowid, score in hits:
+        row = by_rowid.get(rowid)
+        if row is not None:  # an index row whose course was deleted outside the app
+            results.append(_result(*row, score))
+    return results
+
+
+def _result(rowid, course_id, title, snippet, course_title, rank):
+    is_course = rowid < 0
+    return {'kind': 'course' if is_course else 'module', 'id': -rowid if is_course else rowid,
+            'course_id': course_id, 'course_title': course_title, 'title': title, 'snippet': snippet,
+            'score': -rank if rank is not None else None}
+
+
+def search(conn, query, page=1, per_page=SEARCH_PER_PAGE):
+    """Ranked results for one page: ({'results': [...], 'page', 'has_next'}).
+
+    Asks for one extra row instead of counting every match.
+    """
+    page = max(1, min(page, SEARCH_MAX_PAGE))
+    # whole (stemmed) words only: prefixes are for suggest(); a prefix term is expanded again
+    # for the snippet() lookups, which costs as much as the search itself for common prefixes
+    expression = match_expression(terms(query))
+    if expression is None:
+        return {'results': [], 'page': page, 'has_next': False}
+    hits = _hits(conn, expression, per_page + 1, (page - 1) * per_page)
+    return {'results': _results(conn, expression, hits[:per_page]), 'page': page,
+            'has_next': len(hits) > per_page and page < SEARCH_MAX_PAGE}
+
+
+def suggest(conn, query, limit=SUGGEST_LIMIT):
+    """Titles starting with (or containing words starting with) what was typed so far."""
+    words = terms(query)
+    if not words or len(words[-1]) < MIN_PREFIX:
+        return []
+    expression = '{title} : (%s)' % match_expression(words, prefix_last=True)
+    return _results(conn, expression, _hits(conn, expression, limit, 0, weight=1.0), snippets=False)
+
+
+def _like_pattern(word):
+    return '%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_like(conn, query, page=1, per_page=SEARCH_PER_PAGE, titles_only=False):
+    """The fallback without FTS5: every word must appear; title matches first, newest next."""
+    page = max(1, min(page, SEARCH_MAX_PAGE))
+    words = terms(query)
+    if not words:
+        return {'results': [], 'page': page, 'has_next': False}
+    # a bound True, not 1: PostgreSQL rejects boolean = integer
+    params = {'limit': per_page + 1, 'offset': (page - 1) * per_page, 'approved': True}
+    course_where, module_where, title_hits = [], [], []
+    for i, word in enumerate(words):
+        params[f'w{i}'] = _like_pattern(word)
+        title_hits.append(f"LOWER(title) LIKE :w{i} ESCAPE '\\'")
+        if titles_only:
+            course_where.append(f"LOWER(c.title) LIKE :w{i} ESCAPE '\\'")
+            module_where.append(f"LOWER(m.title) LIKE :w{i} ESCAPE '\\'")
+        else:
+            course_where.append(f"(LOWER(c.title) LIKE :w{i} ESCAPE '\\' OR LOWER(c.description) LIKE :w{i} ESCAPE '\\')")
+            module_where.append(f"(LOWER(m.title) LIKE :w{i} ESCAPE '\\' OR LOWER(m.content) LIKE :w{i} ESCAPE '\\')")
+    rows = conn.execute(_select(
+        'SELECT rowid, course_id, title, body, course_title, score FROM ('
+        '  SELECT -c.id AS rowid, c.id AS course_id, c.title AS title, c.description AS body,'
+        '         c.title AS course_title, c.created_at AS created_at, -2 AS score'
+        '  FROM course c WHERE c.is_approved = :approved AND ' + ' AND '.join(course_where) +
+        '  UNION ALL'
+        '  SELECT m.id, m.course_id, m.title, m.content, c.title, m.created_at, -1'
+        '  FROM module m JOIN course c ON c.id = m.course_id WHERE c.is_approved = :approved AND ' + ' AND '.join(module_where) +
+        ') AS hits ORDER BY (CASE WHEN ' + ' AND '.join(title_hits) + ' THEN 0 ELSE 1 END), score, created_at DESC '
+        'LIMIT :limit OFFSET :offset'), params).fetchall()
+    results = []
+    for rowid, course_id, title, body, course_title, score in rows[:per_page]:
+        snippet = None if titles_only else ' '.join((body or '').split()[:SNIPPET_TOKENS])
+        results.append(_result(rowid, course_id, title, snippet, course_title, score))
+    return {'results': results, 'page': page, 'has_next': len(rows) > per_page and page < SEARCH_MAX_PAGE}
@@ -0,0 +1,283 @@
+"""Slow-query log with EXPLAIN capture.
+
+Engine events time every statement on every engine (so the read bind is
+covered too). A statement that takes SLOW_QUERY_MS or longer is written to
+a JSON-lines log with the endpoint (or background thread) that ran it and
+its query plan: EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere, run on the
+same connection. Bound parameters are only logged with
+SLOW_QUERY_LOG_PARAMS=1, and never for the user and payment tables or
+columns named like password, token, email or secret. Plans are cached per query
+shape for SLOW_QUERY_EXPLAIN_INTERVAL seconds so a burst of one slow query
+does not EXPLAIN it every time.
+
+Each capture is a single O_APPEND write, so lines from concurrent workers
+never interleave. Past SLOW_QUERY_LOG_MAX_BYTES the log is rotated to
+.1 ... .SLOW_QUERY_LOG_BACKUPS under a file lock. report() groups the
+captures by shape (literals, placeholders and IN lists normalised) and
+ranks the shapes by total time.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single development server, no concurrent rotation
+    fcntl = None
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', '1') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300))
+# off by default; when on, values bound for the user and payment tables or sensitive columns are redacted
+SLOW_QUERY_LOG_PARAMS = os.environ.get('SLOW_QUERY_LOG_PARAMS', '0') == '1'
+
+MAX_STATEMENT_CHARS = 8000
+MAX_PARAM_CHARS = 200
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|(?<![:\w]):\w+|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+# statements on these tables (password hashes, emails, Paystack references) never log their parameters
+_SENSITIVE_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+["`]?(?:user|payment)["`]?(?!\w)', re.I)
+_SENSITIVE_NAME = re.compile(r'password|token|email|secret', re.I)
+REDACTED = '<redacted>'
+
+
+def shape(statement):
+    """The statement with literals, placeholders and IN lists normalised, for grouping."""
+    text = _STRING.sub('?', statement)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _IN_LIST.sub('(...)', text)
+    return _SPACE.sub(' ', text).strip()
+
+
+def fingerprint(shape_text):
+    return hashlib.sha1(shape_text.encode()).hexdigest()[:12]
+
+
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms=SLOW_QUERY_MS, max_bytes=SLOW_QUERY_LOG_MAX_BYTES,
+                 backups=SLOW_QUERY_LOG_BACKUPS, explain_interval=SLOW_QUERY_EXPLAIN_INTERVAL,
+                 log_params=SLOW_QUERY_LOG_PARAMS):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.explain_interval = explain_interval
+        self.log_params = log_params
+        self._plans = {}  # fingerprint -> (explained_at, plan), per worker
+        self._plans_lock = threading.Lock()
+
+    def install(self):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def uninstall(self):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._slowlog_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_slowlog_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if elapsed >= self.threshold:
+            try:
+                self.capture(conn, cursor, statement, parameters, executemany, elapsed)
+            except Exception:
+                log.exception('slow-query capture failed')
+
+    # ---- capture -------------------------------------------------------
+
+    def capture(self, conn, cursor, statement, parameters, executemany, elapsed):
+        shape_text = shape(statement)
+        key = fingerprint(shape_text)
+        record = {
+            'ts': datetime.utcnow().isoformat(timespec='milliseconds'),
+            'ms': round(elapsed * 1000, 2),
+            'shape': key,
+            'endpoint': _origin(),
+            'db': conn.engine.url.database or conn.engine.url.host,
+            'pid': os.getpid(),
+            'statement': statement[:MAX_STATEMENT_CHARS],
+        }
+        if self.log_params:
+            record['params'] = _params(statement, parameters[0] if executemany and parameters else parameters)
+        if executemany:
+            record['executemany'] = len(parameters)
+        else:
+            record['plan'] = self._plan(key, cursor, statement, parameters, conn.dialect.name)
+        self.write(record)
+
+    def _plan(self, key, cursor, statement, parameters, dialect):
+        now = time.monotonic()
+        with self._plans_lock:
+            cached = self._plans.get(key)
+        if cached and now - cached[0] < self.explain_interval:
+            return cached[1]
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        plan = explain(cursor.connection, statement, parameters, dialect)
+        with self._plans_lock:
+            if len(self._plans) > 1000:
+                self._plans.clear()
+            self._plans[key] = (now, plan)
+        return plan
+
+    def write(self, record):
+        line = (json.dumps(record, default=str, separators=(',', ':')) + '\n').encode()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        lock_fd = os.open(f'{self.path}.lock', os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            # another worker may have rotated while we waited for the lock
+            try:
+                if os.path.getsize(self.path) <= self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(f'{self.path}.{n}'):
+                    os.replace(f'{self.path}.{n}', f'{self.path}.{n + 1}')
+            if self.backups:
+                os.replace(self.path, f'{self.path}.1')
+            else:
+                os.remove(self.path)
+        finally:
+            os.close(lock_fd)
+
+    # ---- reading -------------------------------------------------------
+
+    def files(self):
+        """The log and its backups, oldest first."""
+        paths = [f'{self.path}.{n}' for n in range(self.backups, 0, -1)] + [self.path]
+        return [p for p in paths if os.path.exists(p)]
+
+    def records(self, since=None):
+        for path in self.files():
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if since is None or record['ts'] >= since:
+                        yield record
+
+    def report(self, hours=None, endpoint=None):
+        """Captured query shapes ranked by total time, each with its latest plan and an example."""
+        since = (datetime.utcnow() - timedelta(hours=hours)).isoformat() if hours else None
+        shapes = {}
+        for r in self.records(since):
+            if endpoint and r['endpoint'] != endpoint:
+                continue
+            s = shapes.get(r['shape'])
+            if s is None:
+                s = shapes[r['shape']] = {'shape': r['shape'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                          'timings': [], 'endpoints': {}, 'sql': shape(r['statement']),
+                                          'example': None, 'plan': None, 'last_seen': None}
+            s['count'] += 1
+            s['total_ms'] += r['ms']
+            s['timings'].append(r['ms'])
+            s['endpoints'][r['endpoint']] = s['endpoints'].get(r['endpoint'], 0) + 1
+            if r['ms'] >= s['max_ms']:
+                s['max_ms'] = r['ms']
+                s['example'] = {'statement': r['statement'], 'params': r.get('params'), 'ms': r['ms']}
+            if r.get('plan'):
+                s['plan'] = r['plan']
+            s['last_seen'] = r['ts']
+        ranked = sorted(shapes.values(), key=lambda s: s['total_ms'], reverse=True)
+        for s in ranked:
+            timings = sorted(s.pop('timings'))
+            s['avg_ms'] = s['total_ms'] / s['count']
+            s['p95_ms'] = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            s['endpoints'] = sorted(s['endpoints'].items(), key=lambda e: -e[1])
+        return ranked
+
+
+def explain(dbapi_connection, statement, parameters, dialect):
+    """The plan of statement as a list of lines, run on a fresh cursor of the same connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        if dialect == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+            rows = cursor.fetchall()
+            depth = {0: -1}
+            lines = []
+            for node_id, parent, _, detail in rows:
+                depth[node_id] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node_id] + detail)
+            return lines
+        # a failed EXPLAIN must not abort the surrounding transaction (PostgreSQL)
+        cursor.execute('SAVEPOINT slowlog_explain')
+        try:
+            cursor.execute(f'EXPLAIN {statement}', parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            cursor.execute('ROLLBACK TO SAVEPOINT slowlog_explain')
+            raise
+        finally:
+            cursor.execute('RELEASE SAVEPOINT slowlog_explain')
+        return [' | '.join(str(v) for v in row) if len(row) > 1 else str(row[0]) for row in rows]
+    except Exception as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        cursor.close()
+
+
+def _origin():
+    if has_request_context():
+        return request.endpoint or request.path
+    return f'thread:{threading.current_thread().name}'
+
+
+def _params(statement, parameters):
+    if _SENSITIVE_TABLE.search(statement):
+        return REDACTED
+    if isinstance(parameters, dict):
+        return {k: REDACTED if _SENSITIVE_NAME.search(k) else _param(v) for k, v in parameters.items()}
+    if _SENSITIVE_NAME.search(statement):
+        return REDACTED  # positional values cannot be matched to their columns
+    if isinstance(parameters, (list, tuple)):
+        return [_param(v) for v in parameters]
+    return _param(parameters)
+
+
+def _param(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    text = str(value)
+    return text if len(text) <= MAX_PARAM_CHARS else text[:MAX_PARAM_CHARS] + '...'
@@ -0,0 +1,125 @@
+"""Constant-memory file streaming with HTTP range and conditional support.
+
+Responses never hold more than one chunk of the file in memory. When the WSGI
+server offers wsgi.file_wrapper (gunicorn does, and uses os.sendfile for it),
+the open file is handed to the server so the kernel copies it straight to the
+socket; otherwise a bounded chunk generator is used.
+"""
+import os
+import re
+from datetime import datetime, timezone
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+
+CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 256 * 1024))
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Return (start, end) inclusive for a single byte range, or None to send
+    the whole file. Raises RangeNotSatisfiable for ranges outside the file."""
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        # multi-range or unknown units: ignore the header and send everything
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def file_chunks(f, start, length, chunk_size=CHUNK_SIZE):
+    """Yield length bytes of f from start in chunk_size pieces, then close it."""
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _body(path, start, length, size):
+    f = open(path, 'rb')
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # A generic file_wrapper streams to EOF; gunicorn stops at Content-Length.
+    to_eof = start + length == size
+    if file_wrapper and (to_eof or request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+        f.seek(start)
+        return file_wrapper(f, CHUNK_SIZE)
+    return file_chunks(f, start, length)
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag.strip('"'))
+    since = request.if_modified_since
+    return since is not None and last_modified <= since
+
+
+def _if_range_matches(etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and date == last_modified
+
+
+def stream_file(path, mimetype):
+    """Build a streaming response for path honouring Range, If-Range,
+    If-None-Match and If-Modified-Since."""
+    st = os.stat(path)
+    size = st.st_size
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+    }
+    if _not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+
+    byte_range = None
+    if _if_range_matches(etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+
+    if byte_range is None:
+        start, length, status = 0, size, 200
+    else:
+        start, end = byte_range
+        length, status = end - start + 1, 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(length)
+
+    return Response(_body(path, start, length, size), status, headers=headers,
+                    mimetype=mimetype, direct_passthrough=True)
@@ -0,0 +1,106 @@
+"""Video renditions, segmented playlists and poster frames via a local ffmpeg.
+
+Everything here works on file paths only; the job queue that decides what to
+encode lives in app.py.
+"""
+import json
+import os
+import subprocess
+
+FFMPEG = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+FFPROBE = os.environ.get('FFPROBE_PATH', 'ffprobe')
+TRANSCODE_TIMEOUT = int(os.environ.get('TRANSCODE_TIMEOUT', 3600))
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', 6))
+
+# (name, height, video bitrate, audio bitrate)
+RENDITION_LADDER = [
+    ('720p', 720, '2800k', '128k'),
+    ('480p', 480, '1400k', '96k'),
+    ('360p', 360, '800k', '96k'),
+]
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def _run(cmd):
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              timeout=TRANSCODE_TIMEOUT)
+    except FileNotFoundError:
+        raise TranscodeError(f'{cmd[0]} not found; install ffmpeg or set FFMPEG_PATH/FFPROBE_PATH')
+    except subprocess.TimeoutExpired:
+        raise TranscodeError(f'{cmd[0]} timed out after {TRANSCODE_TIMEOUT}s')
+    if proc.returncode != 0:
+        raise TranscodeError(proc.stderr.decode(errors='replace')[-2000:])
+    return proc.stdout
+
+
+def probe(src):
+    """Return {'width', 'height', 'duration'} of the first video stream."""
+    out = _run([FFPROBE, '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'stream=width,height:format=duration', '-of', 'json', src])
+    info = json.loads(out)
+    stream = (info.get('streams') or [{}])[0]
+    return {
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        'duration': float((info.get('format') or {}).get('duration') or 0),
+    }
+
+
+def extract_poster(src, out_path, duration=0):
+    """Grab one frame ~10% into the video as a JPEG."""
+    at = max(min(duration * 0.1, 10.0), 0.0)
+    _run([FFMPEG, '-y', '-v', 'error', '-ss', f'{at:.2f}', '-i', src,
+          '-frames:v', '1', '-vf', 'scale=-2:480', '-q:v', '3', out_path])
+    return out_path
+
+
+def encode_rendition(src, out_dir, name, height, v_bitrate, a_bitrate):
+    """Encode one MP4 rendition plus an HLS playlist cut from it (stream copy)."""
+    mp4 = os.path.join(out_dir, f'{name}.mp4')
+    _run([FFMPEG, '-y', '-v', 'error', '-i', src,
+          '-vf', f'scale=-2:{height}', '-c:v', 'libx264', '-preset', 'veryfast',
+          '-b:v', v_bitrate, '-maxrate', v_bitrate, '-bufsize', v_bitrate,
+          '-c:a', 'aac', '-b:a', a_bitrate, '-movflags', '+faststart', mp4])
+    playlist = os.path.join(out_dir, f'{name}.m3u8')
+    _run([FFMPEG, '-y', '-v', 'error', '-i', mp4, '-c', 'copy',
+          '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+          '-hls_segment_filename', os.path.join(out_dir, f'{name}_%04d.ts'), playlist])
+    # the encoded frame size, for the master playlist's RESOLUTION=WIDTHxHEIGHT
+    out = probe(mp4)
+    return {'name': name, 'width': out['width'], 'height': out['height'] or height, 'bitrate': v_bitrate,
+            'file': f'{name}.mp4', 'playlist': f'{name}.m3u8'}
+
+
+def write_master_playlist(out_dir, renditions):
+    lines = ['#EXTM3U']
+    for r in renditions:
+        bandwidth = int(r['bitrate'].rstrip('k')) * 1000
+        attributes = f'BANDWIDTH={bandwidth}'
+        if r.get('width') and r.get('height'):
+            attributes += f",RESOLUTION={r['width']}x{r['height']}"
+        lines.append(f'#EXT-X-STREAM-INF:{attributes}')
+        lines.append(r['playlist'])
+    with open(os.path.join(out_dir, 'master.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return 'master.m3u8'
+
+
+def transcode(src, out_dir, ladder=RENDITION_LADDER):
+    """Produce every rendition no taller than the source, the playlists and a poster.
+
+    Returns metadata suitable for storing on the Video row.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    info = probe(src)
+    steps = [step for step in ladder if not info['height'] or step[1] <= info['height']] or ladder[-1:]
+    renditions = [encode_rendition(src, out_dir, *step) for step in steps]
+    return {
+        'source': info,
+        'renditions': renditions,
+        'master': write_master_playlist(out_dir, renditions),
+        'poster': os.path.basename(extract_poster(src, os.path.join(out_dir, 'poster.jpg'), info['duration'])),
+    }